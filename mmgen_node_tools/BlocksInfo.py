@@ -20,9 +20,11 @@
 mmgen_node_tools.BlocksInfo: Display information about a block or range of blocks
 """
 
-import re, json
+import sys, os, re, json, struct, asyncio, hashlib
+from array import array
 from collections import namedtuple
-from time import strftime, gmtime
+from contextlib import contextmanager
+from time import strftime, gmtime, time
 from decimal import Decimal
 
 from mmgen.util import msg, Msg, Msg_r, die, suf, secs_to_ms, secs_to_dhms, is_int
@@ -73,12 +75,219 @@ class RangeParser:
 				die(1, f"'+{res}': overly long nBlocks specifier")
 			return self.caller.check_nblocks(eval(res)) # res is only digits plus '*', so eval safe
 
+class RPCFetchCache:
+	"""
+	Wrapper for an RPC client that coalesces identical requests, so that data shared
+	by concurrently processed block ranges is fetched only once
+	"""
+
+	def __init__(self, rpc):
+		self.rpc = rpc
+		self.cache = {}
+
+	def __getattr__(self, name):
+		return getattr(self.rpc, name)
+
+	def make_key(self, method, args):
+		return (method,) + tuple(frozenset(a) if isinstance(a, list) else a for a in args)
+
+	async def call(self, method, *args):
+		return (await self.gathered_call(method, [args]))[0]
+
+	async def gathered_call(self, method, args_list):
+		keys = [self.make_key(method, args) for args in args_list]
+		new = {k: args for k, args in zip(keys, args_list) if k not in self.cache}
+		if new:
+			loop = asyncio.get_running_loop()
+			for k in new:
+				self.cache[k] = loop.create_future()
+			try:
+				res_list = await self.rpc.gathered_call(method, list(new.values()))
+			except BaseException as e:
+				# pass the error to any concurrent waiters, and let later calls retry:
+				for k in new:
+					fut = self.cache.pop(k)
+					if isinstance(e, Exception):
+						fut.set_exception(e)
+						fut.exception() # mark as retrieved, as there may be no waiters
+					else:
+						fut.cancel()
+				raise
+			for k, res in zip(new, res_list):
+				self.cache[k].set_result(res)
+		return [await self.cache[k] for k in keys]
+
+class BlockStatsIndex:
+	"""
+	Persistent prefix-sum index of block stats.  Row ‘n’ holds the truncated hash and
+	timestamp of block ‘n’ plus cumulative totals of the indexed fields for blocks 0
+	through ‘n’, so totals over any range may be computed from just two rows.
+
+	The index file is shared by all processes on the machine.  Updates hold an
+	exclusive lock on it, and reads a shared one.  Within a process, a single
+	instance per index file is used, access to which is serialized by an asyncio
+	lock, as a file lock held across an await would block the event loop.
+	"""
+
+	fields = (
+		'subsidy', 'totalfee', 'size', 'weight', 'fee90', 'fee75', 'fee50', 'fee25', 'fee10',
+		'fee_max', 'fee_avg', 'fee_min', 'nTx', 'inputs', 'outputs', 'utxo_inc')
+
+	row = struct.Struct('<8sq' + 'q' * len(fields))
+
+	instances = {}
+
+	@classmethod
+	def get(cls, parent):
+		"""
+		Return the process-wide instance for the parent’s chain, creating it if necessary
+		"""
+		proto = parent.rpc.proto
+		key = (parent.cfg.data_dir_root, proto.coin, proto.network)
+		if key not in cls.instances:
+			cls.instances[key] = cls(parent)
+		return cls.instances[key]
+
+	def __init__(self, parent):
+		self.parent = parent
+		self.rpc = parent.rpc
+		self.fvals = [BlocksInfo.fields[name] for name in self.fields]
+		self.bs_keys = sorted({v.key1 for v in self.fvals if v.src == 'bs'})
+		proto = self.rpc.proto
+		self.fn = os.path.join(
+			parent.cfg.data_dir_root,
+			'node_tools',
+			f'blocks_info-{proto.coin.lower()}-{proto.network}.idx')
+		os.makedirs(os.path.dirname(self.fn), exist_ok=True)
+		self.fh = open(self.fn, 'r+b' if os.path.exists(self.fn) else 'w+b')
+		self.task_lock = asyncio.Lock()
+
+	@contextmanager
+	def lock(self, exclusive=False):
+		try:
+			import fcntl
+		except ImportError: # MSWin: no locking
+			yield
+			return
+		fcntl.flock(self.fh, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+		try:
+			yield
+		finally:
+			fcntl.flock(self.fh, fcntl.LOCK_UN)
+
+	@property
+	def nrows(self):
+		return os.fstat(self.fh.fileno()).st_size // self.row.size
+
+	def get_row(self, n): # => (hash_prefix, time, sums)
+		self.fh.seek(n * self.row.size)
+		H, t, *sums = self.row.unpack(self.fh.read(self.row.size))
+		return (H, t, sums)
+
+	async def update(self, height):
+		async with self.task_lock:
+			with self.lock(exclusive=True):
+				await self._update(height)
+
+	async def _update(self, height):
+		"""
+		Extend the index up to block ‘height’, first discarding any rows invalidated by
+		a chain reorganization
+		"""
+		c = self.rpc
+		n = self.nrows
+		while n and self.get_row(n-1)[0] != bytes.fromhex(await c.call('getblockhash', n-1))[:8]:
+			n -= 1
+		if n < self.nrows:
+			self.fh.truncate(n * self.row.size)
+
+		if n > height:
+			return
+
+		sums = self.get_row(n-1)[2] if n else [0] * len(self.fields)
+		self.fh.seek(n * self.row.size)
+
+		for start in range(n, height+1, self.parent.chunk_size):
+			heights = range(start, min(start + self.parent.chunk_size, height+1))
+			hashes = await c.gathered_call('getblockhash', [(h,) for h in heights])
+			hdrs = await c.gathered_call('getblockheader', [(H,) for H in hashes])
+			# 'getblockstats' RPC raises exception on Genesis Block:
+			bs = await c.gathered_call(
+				'getblockstats',
+				[(H, self.bs_keys) for H in hashes[(0 if start else 1):]])
+			if not start:
+				bs.insert(0, self.parent.genesis_stats)
+			for H, hdr, stats in zip(hashes, hdrs, bs):
+				blk_data = {'bh': hdr, 'bs': stats}
+				for i, v in enumerate(self.fvals):
+					sums[i] += (
+						blk_data[v.src][v.key1] if v.key2 is None else
+						blk_data[v.src][v.key1][v.key2])
+				self.fh.write(self.row.pack(bytes.fromhex(H)[:8], hdr['time'], *sums))
+
+		self.fh.flush()
+
+	async def get_sums(self, first, last):
+		async with self.task_lock:
+			return self._get_sums(first, last)
+
+	def _get_sums(self, first, last):
+		with self.lock():
+			if last >= self.nrows: # truncated by a concurrent update following a reorg
+				die(2, f'Block {last} no longer in stats index (chain reorganization?).  Please retry')
+			_, t0, sums0 = (
+				self.get_row(first-1) if first else
+				(None, self.get_row(0)[1], [0] * len(self.fields)))
+			_, t1, sums1 = self.get_row(last)
+		return dict(zip(self.fields, (b - a for a, b in zip(sums0, sums1)))) | {'interval': t1 - t0}
+
+def bits_to_target(bits):
+	return (bits & 0xffffff) << (8 * ((bits >> 24) - 3))
+
+def target_to_bits(target):
+	size = (target.bit_length() + 7) // 8
+	compact = target << (8 * (3 - size)) if size <= 3 else target >> (8 * (size - 3))
+	if compact & 0x800000:
+		compact >>= 8
+		size += 1
+	return compact | (size << 24)
+
+def verify_header_chunk(start, raw_hdrs, hashes, pow_algo):
+	"""
+	Verify a chunk of concatenated raw block headers against the node-supplied block
+	hashes (internal byte order), checking each header’s hash, proof of work and link
+	to its predecessor within the chunk.  Run in a worker process.
+
+	Returns (errors, first_prev_hash, last_hash, times, bits)
+	"""
+	errors = []
+	times = array('I')
+	bits = array('I')
+	H = None
+	for i in range(len(raw_hdrs) // 80):
+		height = start + i
+		raw = raw_hdrs[i*80:(i+1)*80]
+		if i and raw[4:36] != H:
+			errors.append(f'{height}: previous block hash mismatch')
+		H = hashlib.sha256(hashlib.sha256(raw).digest()).digest()
+		if H != hashes[i*32:(i+1)*32]:
+			errors.append(f'{height}: header hash does not match node-supplied block hash')
+		t, b = struct.unpack_from('<II', raw, 68)
+		times.append(t)
+		bits.append(b)
+		pow_hash = (
+			hashlib.scrypt(raw, salt=raw, n=1024, r=1, p=1, dklen=32) if pow_algo == 'scrypt' else H)
+		if int.from_bytes(pow_hash, 'little') > bits_to_target(b):
+			errors.append(f'{height}: header hash does not meet target ({b:08x})')
+	return (errors, raw_hdrs[4:36], H, times, bits)
+
 class BlocksInfo:
 
 	total_bytes = 0
 	total_weight = 0
 	total_solve_time = 0
 	header_printed = False
+	sums = None
 
 	bf = namedtuple('block_info_fields', ['fmt_func', 'src', 'fs', 'hdr1', 'hdr2', 'key1', 'key2'])
 	# bh=getblockheader, bs=getblockstats, lo=local
@@ -147,6 +356,31 @@ class BlocksInfo:
 
 	range_data = namedtuple('parsed_range_data', ['first', 'last', 'from_tip', 'nblocks', 'step'])
 
+	# configuration of instances created by iter_blocks(), in place of command-line opts:
+	iter_cfg = namedtuple(
+		'iter_blocks_cfg',
+		[
+			'coin',
+			'fields',
+			'header_info',
+			'miner_info',
+			'raw_miner_info',
+			'stats',
+			'stats_only',
+			'stats_index',
+			'full_stats',
+			'from_file'],
+		defaults = (None,) * 9)
+
+	chunk_size = 1000 # number of blocks fetched per batch of RPC calls
+	verify_chunk_size = 10000 # number of headers per --verify-headers worker task
+	max_errors_disp = 50
+
+	# (target timespan, proof-of-work limit) for difficulty adjustment checks:
+	retarget_params = {
+		('BTC', 'mainnet'): (1209600, 0x1d00ffff)}
+	hash_pat = re.compile(r'[0-9a-fA-F]{64}$')
+
 	t_fmt = lambda self, t: f'{t/86400:.2f} days' if t > 172800 else f'{t/3600:.2f} hrs'
 
 	@classmethod
@@ -178,7 +412,7 @@ class BlocksInfo:
 		else:
 			die(1, f'{uarg}: invalid parameter')
 
-	def __init__(self, cfg, cmd_args, rpc):
+	def __init__(self, cfg, cmd_args, rpc, *, fields=None):
 
 		def parse_cs_uarg(uarg, full_set, dfl_set, desc):
 			return (
@@ -186,12 +420,22 @@ class BlocksInfo:
 				self.parse_cslist(uarg, full_set, dfl_set, desc))
 
 		def get_fields():
-			return parse_cs_uarg(self.cfg.fields, list(self.fields), self.dfl_fields, 'field')
+			return parse_cs_uarg(fields, list(self.fields), self.dfl_fields, 'field')
 
 		def get_stats():
 			return parse_cs_uarg(self.cfg.stats.lower(), self.all_stats, self.dfl_stats, 'stat')
 
 		def parse_cmd_args(): # => (block_list, first, last, step)
+			if self.cfg.from_file:
+				if cmd_args:
+					die(1, 'block specifiers may not be given on the command line with --from-file')
+				# stats are computed only for ranges (--header-info sets --stats=range):
+				if self.cfg.stats_only or (
+						self.cfg.stats
+						and self.cfg.stats.lower() != 'none'
+						and not self.cfg.header_info):
+					die(1, '--stats and --stats-only are not supported with --from-file')
+				return (None, None, None, None)
 			match cmd_args:
 				case [] | None:
 					return (None, self.tip, self.tip, None)
@@ -208,6 +452,7 @@ class BlocksInfo:
 		self.cfg = cfg
 		self.rpc = rpc
 		self.tip = rpc.blockcount
+		fields = fields or cfg.fields
 
 		from_satoshi = self.rpc.proto.coin_amt.satoshi
 		to_satoshi = 1 / from_satoshi
@@ -216,8 +461,8 @@ class BlocksInfo:
 
 		have_segwit = self.rpc.info('segwit_is_active')
 
-		if not have_segwit:
-			del self.fields['weight']
+		if not have_segwit: # don’t modify the class attribute, as there may be more than one instance
+			self.fields = {k: v for k, v in self.fields.items() if k != 'weight'}
 			self.dfl_fields = tuple(f for f in self.dfl_fields if f != 'weight')
 
 		self.stats_deps = {
@@ -247,13 +492,13 @@ class BlocksInfo:
 		self.fnames = tuple(
 			[f for f in self.fields if self.fields[f].src == 'bh' or f == 'interval']
 				if self.cfg.header_info
-			else get_fields() if self.cfg.fields
+			else get_fields() if fields
 			else self.dfl_fields)
 
 		if self.cfg.miner_info and 'miner' not in self.fnames:
 			self.fnames += ('miner',)
 
-		self.stats = get_stats() if self.cfg.stats else self.dfl_stats
+		self.stats = list(get_stats() if self.cfg.stats else self.dfl_stats)
 
 		# Display diff stats by default only if user-requested range ends with chain tip
 		if 'diff' in self.stats and not self.cfg.stats and self.last != self.tip:
@@ -299,6 +544,17 @@ class BlocksInfo:
 		self.block_data = namedtuple('block_data', self.fnames)
 		self.deps = {v.src for v in self.fvals}
 
+		# Use stats index only if all requested stats can be computed from it:
+		self.use_index = (
+			self.cfg.stats_index
+			and self.cfg.stats_only
+			and self.first is not None
+			and not self.block_list
+			and self.cfg.coin != 'BCH'
+			and set(self.stats) <= {'range', 'avg', 'mini_avg', 'total', 'diff'}
+			and {f for sname in self.stats for f in self.stats_deps[sname] if f in self.fnames}
+				<= {'interval'} | set(BlockStatsIndex.fields))
+
 	def gen_fs(self, fnames, fill=[], fill_char='-', add_name=False):
 		for i in range(len(fnames)):
 			name = fnames[i]
@@ -371,7 +627,77 @@ class BlocksInfo:
 
 		return self.range_data(first, last, from_tip, nblocks, step)
 
-	async def process_blocks(self):
+	def gen_file_blkspecs(self):
+		"""
+		Read whitespace-separated block heights or hashes from the --from-file file
+		(or stdin), yielding them in chunks of at most ‘chunk_size’ items
+		"""
+		try:
+			fh = sys.stdin if self.cfg.from_file == '-' else open(self.cfg.from_file)
+		except OSError as e:
+			die(1, f'{self.cfg.from_file}: unable to open file ({e.strerror})')
+		with fh:
+			chunk = []
+			for line in fh:
+				for spec in line.split('#', 1)[0].split():
+					chunk.append(spec)
+					if len(chunk) == self.chunk_size:
+						yield chunk
+						chunk = []
+			if chunk:
+				yield chunk
+
+	async def get_hashes(self, blkspecs):
+		heights = [self.conv_blkspec(s) for s in blkspecs if not self.hash_pat.match(s)]
+		hashes = iter(await self.rpc.gathered_call('getblockhash', [(n,) for n in heights]))
+		return [s.lower() if self.hash_pat.match(s) else next(hashes) for s in blkspecs]
+
+	async def gen_blocks_from_file(self):
+		"""
+		Streaming version of gen_blocks() for block lists of arbitrary length.
+		Only one chunk of headers is held in memory at a time.
+		"""
+		c = self.rpc
+		last_hdr = None
+		for blkspecs in self.gen_file_blkspecs():
+			hashes = await self.get_hashes(blkspecs)
+			hdrs = await c.gathered_call('getblockheader', [(H,) for H in hashes])
+			# avoid refetching headers of blocks preceding their successors in the list:
+			known = {h['hash']: h for h in hdrs} | ({last_hdr['hash']: last_hdr} if last_hdr else {})
+			# Genesis Block has no prev:
+			prev_hashes = [h.get('previousblockhash', h['hash']) for h in hdrs]
+			missing = [H for H in dict.fromkeys(prev_hashes) if H not in known]
+			known |= dict(zip(missing, await c.gathered_call('getblockheader', [(H,) for H in missing])))
+			for hdr, prev_hash in zip(hdrs, prev_hashes):
+				self.t_cur = known[prev_hash]['time']
+				yield (hdr, await self.process_block(hdr))
+			last_hdr = hdrs[-1]
+
+	async def process_blocks_indexed(self):
+		"""
+		Compute sums over the range from the stats index without fetching per-block data
+		"""
+		c = self.rpc
+		idx = BlockStatsIndex.get(self)
+		await idx.update(self.last)
+		self.sums = await idx.get_sums(self.first, self.last)
+		self.total_solve_time = self.sums['interval']
+		self.total_bytes = self.sums['size']
+		self.total_weight = self.sums['weight']
+		heights = (max(self.first - 1, 0), self.first, self.last)
+		hashes = await c.gathered_call('getblockhash', [(h,) for h in heights])
+		self.first_prev_hdr, *self.hdrs = await c.gathered_call('getblockheader', [(H,) for H in hashes])
+
+	async def gen_blocks(self):
+		"""
+		Yield a (header, block_data) pair for each block in the configured range or list.
+		Headers are fetched in chunks as the consumer advances.
+		"""
+
+		if self.cfg.from_file:
+			async for ret in self.gen_blocks_from_file():
+				yield ret
+			return
 
 		async def get_hdrs(heights):
 			hashes = await c.gathered_call('getblockhash',[(height,) for height in heights])
@@ -380,26 +706,172 @@ class BlocksInfo:
 		c = self.rpc
 
 		heights = self.block_list or range(self.first, self.last+1)
-		self.hdrs = await get_hdrs(heights)
 
-		if self.block_list:
-			self.prev_hdrs = await get_hdrs([(n-1 if n else 0) for n in self.block_list])
-			self.first_prev_hdr = self.prev_hdrs[0]
-		else:
-			self.first_prev_hdr = (
-				self.hdrs[0] if heights[0] == 0 else
-				await c.call('getblockheader', await c.call('getblockhash', heights[0]-1)))
+		for i in range(0, len(heights), self.chunk_size):
+			chunk = heights[i:i+self.chunk_size]
+			hdrs = await get_hdrs(chunk)
+
+			if self.block_list:
+				prev_hdrs = await get_hdrs([(n-1 if n else 0) for n in chunk])
+				if i == 0:
+					self.first_prev_hdr = prev_hdrs[0]
+			elif i == 0:
+				self.first_prev_hdr = (
+					hdrs[0] if chunk[0] == 0 else
+					await c.call('getblockheader', await c.call('getblockhash', chunk[0]-1)))
+				self.t_cur = self.first_prev_hdr['time']
+
+			for n, hdr in enumerate(hdrs):
+				if self.block_list:
+					self.t_cur = prev_hdrs[n]['time']
+				yield (hdr, await self.process_block(hdr))
+
+	@classmethod
+	async def iter_blocks(
+			cls,
+			rpc,
+			range_spec = None,
+			fields     = None,
+			*,
+			header_info    = False,
+			miner_info     = False,
+			raw_miner_info = False):
+		"""
+		Library interface: asynchronous generator yielding a ‘block_data’ namedtuple of
+		unformatted values for each block in ‘range_spec’, a list of block specifiers
+		in command-line format (default: the chain tip).  ‘fields’ is a field list in
+		--fields format, and the keyword args correspond to the command-line options of
+		the same name, which are otherwise ignored.  Blocks are fetched only as the caller
+		consumes them, and no output is produced.  Example:
+
+		    async for blk in BlocksInfo.iter_blocks(rpc, ['+100'], 'block,date,size'):
+		        print(blk.block, blk.size)
+		"""
+		m = cls(
+			cls.iter_cfg(
+				coin           = rpc.proto.coin,
+				header_info    = header_info,
+				miner_info     = miner_info,
+				raw_miner_info = raw_miner_info,
+				stats          = 'none'),
+			range_spec or [],
+			rpc,
+			fields = fields)
+		async for _, blk in m.gen_blocks():
+			yield blk
+
+	def check_difficulty(self, times, bits):
+		"""
+		Check the ‘bits’ field of each header in the range against the expected value
+		"""
+		proto = self.rpc.proto
+		I = proto.diff_adjust_interval
+		params = self.retarget_params.get((proto.coin, proto.network))
+		if not (params or proto.network == 'regtest'):
+			return (None, [])
+		errors = []
+		nchecked = 0
+		for i in range(1, len(bits)):
+			height = self.first + i
+			if height % I or not params: # regtest: no retargeting
+				if bits[i] != bits[i-1]:
+					errors.append(
+						f'{height}: unexpected difficulty change ({bits[i-1]:08x} -> {bits[i]:08x})')
+			elif i >= I:
+				timespan, pow_limit = params
+				actual = min(max(times[i-1] - times[i-I], timespan // 4), timespan * 4)
+				target = min(bits_to_target(bits[i-1]) * actual // timespan, bits_to_target(pow_limit))
+				if target_to_bits(target) != bits[i]:
+					errors.append(
+						f'{height}: difficulty adjustment mismatch '
+						f'(expected {target_to_bits(target):08x}, got {bits[i]:08x})')
+				nchecked += 1
+		return (nchecked, errors)
+
+	async def verify_headers(self):
+		"""
+		Verify hashes, proof of work, hash linkage and difficulty adjustments for the headers
+		in the range.  Hashing is distributed across a process pool, with RPC fetching of
+		subsequent chunks overlapping it.
+		"""
+		from concurrent.futures import ProcessPoolExecutor
+
+		if self.first is None or self.block_list:
+			die(1, '--verify-headers requires a contiguous block range')
 
-		self.t_cur = self.first_prev_hdr['time']
+		c = self.rpc
+		loop = asyncio.get_running_loop()
+		pow_algo = 'scrypt' if c.proto.coin == 'LTC' else 'sha256d'
+		nprocs = os.cpu_count() or 1
+		t_start = time()
+
+		with ProcessPoolExecutor(max_workers=nprocs) as pool:
+			futs = []
+			for start in range(self.first, self.last+1, self.verify_chunk_size):
+				heights = range(start, min(start + self.verify_chunk_size, self.last+1))
+				hashes = await c.gathered_call('getblockhash', [(h,) for h in heights])
+				raw_hdrs = await c.gathered_call('getblockheader', [(H, False) for H in hashes])
+				futs.append(loop.run_in_executor(
+					pool,
+					verify_header_chunk,
+					start,
+					bytes.fromhex(''.join(raw_hdrs)),
+					b''.join(bytes.fromhex(H)[::-1] for H in hashes),
+					pow_algo))
+			results = await asyncio.gather(*futs)
+
+		errors = []
+		times = array('I')
+		bits = array('I')
+		prev_hash = (
+			bytes.fromhex(await c.call('getblockhash', self.first-1))[::-1] if self.first else
+			bytes(32))
+		for start, (errs, first_prev_hash, last_hash, t, b) in zip(
+				range(self.first, self.last+1, self.verify_chunk_size), results):
+			if first_prev_hash != prev_hash:
+				errors.append(f'{start}: previous block hash mismatch')
+			errors += errs
+			prev_hash = last_hash
+			times += t
+			bits += b
+
+		nchecked, diff_errors = self.check_difficulty(times, bits)
+
+		Msg('Verified headers {}-{} ({} header{}, {:.2f}s, {} process{})'.format(
+			self.first,
+			self.last,
+			len(times),
+			suf(len(times)),
+			time() - t_start,
+			nprocs,
+			suf(nprocs, 'es')))
+		Msg('  Hash, proof of work, linkage: {}'.format('FAILED' if errors else 'OK'))
+		Msg('  Difficulty adjustments:       {}'.format(
+			'FAILED' if diff_errors else
+			f'not checked for {c.proto.coin} {c.proto.network}' if nchecked is None else 'OK'))
+
+		if errors or diff_errors:
+			for e in (errors + diff_errors)[:self.max_errors_disp]:
+				msg(e)
+			n = len(errors) + len(diff_errors)
+			die(1, f'{n} error{suf(n)} found')
+
+	async def process_blocks(self):
+
+		if self.use_index:
+			return await self.process_blocks_indexed()
+
+		self.hdrs = []
 		self.res = []
+		n = 0
 
-		for n in range(len(heights)):
-			if self.block_list:
-				self.t_cur = self.prev_hdrs[n]['time']
-			ret = await self.process_block(self.hdrs[n])
-			self.res.append(ret)
+		async for hdr, ret in self.gen_blocks():
+			if not self.cfg.from_file: # don’t accumulate lists of arbitrary length
+				self.hdrs.append(hdr)
+				self.res.append(ret)
 			if self.fnames and not self.cfg.stats_only:
 				self.output_block(ret, n)
+			n += 1
 
 	def output_block(self, data, n):
 		def gen():
@@ -499,7 +971,7 @@ class BlocksInfo:
 		# These figures don’t include the Genesis Block:
 		elapsed = self.hdrs[-1]['time'] - self.first_prev_hdr['time']
 		nblocks = self.hdrs[-1]['height'] - self.first_prev_hdr['height']
-		total_blks = len(self.hdrs)
+		total_blks = self.nblocks_processed
 		step_disp = f', nBlocks={total_blks}, step={self.step}' if self.step else ''
 		def gen():
 			yield 'Range Statistics:'
@@ -564,11 +1036,17 @@ class BlocksInfo:
 			('Est. diff adjust: {}%', 'est_diff_adjust_pct', '{:+.2f}', ((600 / bdi) - 1) * 100),
 		))
 
+	@property
+	def nblocks_processed(self):
+		return self.last - self.first + 1 if self.sums else len(self.res)
+
 	def sum_field_avg(self, field):
-		return self.sum_field_total(field) // len(self.res)
+		return self.sum_field_total(field) // self.nblocks_processed
 
 	def sum_field_total(self, field):
-		if isinstance(getattr(self.res[0], field), str):
+		if self.sums:
+			return self.sums[field]
+		elif isinstance(getattr(self.res[0], field), str):
 			return sum(Decimal(getattr(block, field)) for block in self.res)
 		else:
 			return sum(getattr(block, field) for block in self.res)
@@ -754,3 +1232,97 @@ class JSONBlocksInfo(BlocksInfo):
 
 	def finalize_output(self):
 		Msg('}')
+
+class CompareBlocksInfo:
+	"""
+	Process two block ranges concurrently, displaying their stats side by side
+	"""
+
+	class range_info(BlocksInfo):
+		def output_block(self, data, n): pass
+
+	# column averages are per-field and difficulty stats don’t depend on the range:
+	skip_stats = ('col_avg', 'diff')
+
+	range_lbls = {
+		'start':   'First block',
+		'end':     'Last block',
+		'range':   'Range size',
+		'elapsed': 'Elapsed',
+		'nBlocks': 'Blocks processed',
+		'step':    'Step'}
+
+	def __init__(self, cfg, cmd_args, rpc):
+		if cfg.json:
+			die(1, '--compare is incompatible with --json')
+		if cfg.from_file:
+			die(1, '--compare is incompatible with --from-file')
+		rpc = RPCFetchCache(rpc)
+		self.cfg = cfg
+		self.ranges = [self.range_info(cfg, args, rpc) for args in (cmd_args, [cfg.compare])]
+
+	async def process_blocks(self):
+		await asyncio.gather(*(m.process_blocks() for m in self.ranges))
+
+	async def get_stats_rows(self, m, sname):
+		method = getattr(m, f'create_{sname}_stats', None)
+		hdr = None
+		rows = {}
+		for d in (await (method() if method else m.create_stats(sname)))[1]:
+			match d:
+				case [_, b]:
+					for k, v in b.items():
+						rows[self.range_lbls.get(k, k)] = ('', *v)
+				case [a, _, b, c]:
+					lbl, suf = a.split('{}', 1)
+					rows[lbl.strip().rstrip(':')] = (suf, b, c)
+				case str():
+					hdr = d
+		return (hdr, rows)
+
+	def fmt_delta(self, suf, fs, v1, v2):
+		m = self.ranges[0]
+		try:
+			a, b = (Decimal(v) if isinstance(v, str) else v for v in (v1, v2))
+			d = b - a
+		except (TypeError, ArithmeticError):
+			return ('-', '-')
+		if fs is m.fmt_funcs['da']: # display difference between dates as a time interval
+			return (('-' if d < 0 else '+') + m.t_fmt(abs(d)), '-')
+		return (
+			('-' if d < 0 else '+') + m.fmt_stat_item(fs, abs(d)).strip() + suf,
+			'{:+.2f}%'.format(d / a * 100) if a else 'N/A')
+
+	def gen_table(self, hdr, rows1, rows2):
+
+		def fmt_val(row):
+			return m.fmt_stat_item(*row[1:]).strip() + row[0] if row else '-'
+
+		def gen_rows():
+			for lbl in rows1 | rows2:
+				r1, r2 = (rows1.get(lbl), rows2.get(lbl))
+				if (r1 and r1[2] is not None) or (r2 and r2[2] is not None):
+					yield (
+						'  ' + lbl + ':',
+						fmt_val(r1),
+						fmt_val(r2),
+						*(self.fmt_delta(*r1[:2], r1[2], r2[2]) if r1 and r2 else ('-', '-')))
+
+		m = self.ranges[0]
+		data = [(hdr,) + tuple(f"{m.hdrs[0]['height']}-{m.hdrs[-1]['height']}" for m in self.ranges)
+			+ ('Delta', 'Delta %')] + list(gen_rows())
+		widths = [max(len(row[i]) for row in data) for i in range(5)]
+		for row in data:
+			yield '{:{}}  {:>{}}  {:>{}}  {:>{}}  {:>{}}'.format(
+				*(e for pair in zip(row, widths) for e in pair)).rstrip()
+
+	async def output_stats(self):
+		m1, m2 = self.ranges
+		for sname in m1.stats:
+			if sname not in self.skip_stats:
+				(hdr, rows1), (_, rows2) = [await self.get_stats_rows(m, sname) for m in self.ranges]
+				Msg('\n'.join(self.gen_table(hdr, rows1, rows2)) + '\n')
+		for m in self.ranges:
+			if 'diff' in m.stats:
+				await m.process_stats('diff')
+				break
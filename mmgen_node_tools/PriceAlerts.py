@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+#
+# mmgen = Multi-Mode GENerator, a command-line cryptocurrency wallet
+# Copyright (C)2013-2022 The MMGen Project <mmgen@tuta.io>
+# Licensed under the GNU General Public License, Version 3:
+#   https://www.gnu.org/licenses
+# Public project repositories:
+#   https://github.com/mmgen/mmgen-wallet https://github.com/mmgen/mmgen-node-tools
+#   https://gitlab.com/mmgen/mmgen-wallet https://gitlab.com/mmgen/mmgen-node-tools
+
+"""
+mmgen_node_tools.PriceAlerts: Price alerts for the ticker
+"""
+
+import os, re, time, json, bisect
+from collections import namedtuple
+
+from mmgen.color import yellow
+from mmgen.util import msg
+
+alert_cols = {
+	'usd':     'price_usd',
+	'btc':     'price_btc',
+	'chg_24h': 'percent_change_24h',
+	'chg_7d':  'percent_change_7d',
+	'chg_30d': 'percent_change_30d',
+	'chg_1y':  'percent_change_1y'}
+
+class PriceAlerts:
+	"""
+	Price alert rules, triggered when an asset’s value in a column crosses a rule’s
+	threshold.  For each asset and column, the rules are indexed by threshold in two
+	sorted lists, one each for rising and falling values, so that only those rules
+	whose thresholds lie between the previous and current values are examined.  The
+	previous values are persisted in the cache directory, so that crossings between
+	invocations of the script are detected.
+	"""
+	fn = 'ticker-alerts-state.json'
+	rule = namedtuple('alert_rule', ['asset', 'col', 'above', 'threshold', 'spec'])
+	alert = namedtuple('price_alert', ['rule', 'symbol', 'prev', 'value'])
+	max_watch_alerts = 5 # number of most recent alerts shown by --watch
+	esc_pat = re.compile(r'\033\[[0-9;]*m')
+
+	def __init__(self, cachedir, rules, command=None, sound=None, volume=None):
+		self.state_fn = os.path.join(cachedir, self.fn)
+		self.rules = rules
+		self.command = command
+		self.sound = sound
+		self.volume = volume
+		self.index = {}
+		for r in rules:
+			self.index.setdefault((r.asset, r.col), ([], []))[r.above].append(r)
+		for v in self.index.values():
+			for rules in v:
+				rules.sort(key=lambda r: r.threshold)
+		self.thresholds = {
+			k: tuple([r.threshold for r in rules] for rules in v)
+				for k, v in self.index.items()}
+		self.prev = None
+
+	def check(self, data):
+		"""
+		return the alerts triggered by the values in ‘data’ since the last check, and
+		save the values
+		"""
+		if self.prev is None:
+			try:
+				with open(self.state_fn) as fh:
+					self.prev = json.load(fh)
+			except (FileNotFoundError, ValueError):
+				self.prev = {}
+		by_symbol = {}
+		for d in data.values():
+			by_symbol.setdefault(d['symbol'], d)
+		alerts = []
+		state = {}
+		for (asset, col), (falling, rising) in self.thresholds.items():
+			d = data.get(asset.id) if asset.id else by_symbol.get(asset.symbol)
+			if d is None or d.get(alert_cols[col]) is None:
+				continue
+			key = f'{d["id"]}:{col}'
+			state[key] = val = float(d[alert_cols[col]])
+			if (prev := self.prev.get(key)) is None or prev == val:
+				continue
+			rules = self.index[(asset, col)][val > prev]
+			if val > prev: # rising: thresholds in (prev, val]
+				crossed = rules[bisect.bisect_right(rising, prev):bisect.bisect_right(rising, val)]
+			else:          # falling: thresholds in [val, prev)
+				crossed = rules[bisect.bisect_left(falling, val):bisect.bisect_left(falling, prev)]
+			alerts.extend(self.alert(r, d['symbol'], prev, val) for r in crossed)
+		self.prev |= state
+		tmp_fn = self.state_fn + '.tmp'
+		with open(tmp_fn, 'w') as fh:
+			json.dump(self.prev, fh)
+		os.replace(tmp_fn, self.state_fn)
+		return alerts
+
+	@staticmethod
+	def fmt_alert(a, t):
+		return '{} {}  {} {} crossed {} {:g} ({:.8g} → {:.8g})'.format(
+			yellow('ALERT'),
+			time.strftime('%X', time.gmtime(t)),
+			a.symbol,
+			a.rule.col.upper(),
+			'above' if a.rule.above else 'below',
+			a.rule.threshold,
+			a.prev,
+			a.value)
+
+	def notify(self, alerts, t):
+		"""
+		deliver alerts via the configured command hook and sound
+		"""
+		if self.command:
+			import subprocess
+			for a in alerts:
+				text = self.esc_pat.sub('', self.fmt_alert(a, t))
+				env = os.environ | {'MMNODE_TICKER_ALERT': text}
+				if subprocess.run(self.command, shell=True, env=env).returncode:
+					msg(yellow(f'Warning: alert command {self.command!r} failed'))
+		if self.sound:
+			from .Sound import play_sound
+			try:
+				play_sound(self.sound, self.volume or 100)
+			except Exception as e:
+				msg(yellow(f'Warning: unable to play alert sound: {type(e).__name__}: {e}'))
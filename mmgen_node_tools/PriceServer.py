@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+#
+# mmgen = Multi-Mode GENerator, a command-line cryptocurrency wallet
+# Copyright (C)2013-2022 The MMGen Project <mmgen@tuta.io>
+# Licensed under the GNU General Public License, Version 3:
+#   https://www.gnu.org/licenses
+# Public project repositories:
+#   https://github.com/mmgen/mmgen-wallet https://github.com/mmgen/mmgen-node-tools
+#   https://gitlab.com/mmgen/mmgen-wallet https://gitlab.com/mmgen/mmgen-node-tools
+
+"""
+mmgen_node_tools.PriceServer: Local server of ticker price data
+"""
+
+import os, re, json, asyncio, bisect
+
+from mmgen.color import red
+from mmgen.util import msg, die
+
+class PriceServer:
+	"""
+	Local server that owns upstream fetching and caching of source data, so that any
+	number of clients can share a single fetch per rate limit period.
+
+	A client sends a JSON request with the source ID, the IDs and symbols of the
+	assets it wants and an optional asset range, and closes its end of the connection.
+	The server responds with the matching raw records, which the client processes
+	with gen_data() as if it had fetched them itself.
+
+	As requests are unauthenticated, TCP sockets may be bound to loopback addresses
+	only, and requests are limited in size.
+	"""
+	dfl_addr = 'ticker.sock'
+	max_req_size = 0x10000
+	req_timeout = 10
+
+	def __init__(self, srcs):
+		self.srcs = srcs
+		self.src_data = {}
+		self.next_fetch = dict.fromkeys(srcs, 0)
+		self.lock = asyncio.Lock()
+
+	@staticmethod
+	def parse_addr(s, cachedir):
+		"""
+		Return (host, port) for a TCP address, or the path of a Unix socket.  Relative
+		socket paths are taken to be in the cache directory.
+		"""
+		if m := re.fullmatch(r'(.*):(\d+)', s):
+			return (m[1] or 'localhost', int(m[2]))
+		return os.path.join(cachedir, os.path.expanduser(s))
+
+	@staticmethod
+	def is_loopback(host):
+		"""
+		Return True if all addresses ‘host’ resolves to are loopback addresses
+		"""
+		import socket, ipaddress
+		try:
+			addrs = {e[4][0] for e in socket.getaddrinfo(host, None)}
+		except socket.gaierror:
+			return False
+		return all(ipaddress.ip_address(a.split('%')[0]).is_loopback for a in addrs)
+
+	@staticmethod
+	def fmt_addr(addr):
+		return '{}:{}'.format(*addr) if isinstance(addr, tuple) else addr
+
+	@staticmethod
+	async def connect(addr):
+		return await (
+			asyncio.open_connection(*addr) if isinstance(addr, tuple) else
+			asyncio.open_unix_connection(addr))
+
+	@classmethod
+	async def request(cls, addr, req):
+		try:
+			reader, writer = await cls.connect(addr)
+		except OSError as e:
+			die(2, f'Cannot connect to price server at {cls.fmt_addr(addr)}: {e.strerror or e}')
+		try:
+			writer.write(json.dumps(req).encode())
+			writer.write_eof()
+			return json.loads(await reader.read())
+		finally:
+			writer.close()
+
+	@staticmethod
+	def select_records(src, req):
+		"""
+		Return the records of ‘src’ wanted by a client request in source order, along
+		with the bounds of the requested asset range within them, if any
+		"""
+		if isinstance(src.data, dict): # Yahoo Finance data is keyed by symbol
+			ids = set(req['id'])
+			return ({k: v for k, v in src.data.items() if k.lower() in ids}, None)
+		pos = {n for k in ('id', 'symbol') for e in req[k] for n in src.find(k, e)}
+		pos.update(src.find('id', 'btc-bitcoin'))
+		if req['range']:
+			n, m = req['range']
+			asset_range = range(len(src.data))[n-1:m]
+			pos.update(asset_range)
+		pos = sorted(pos)
+		return (
+			[src.data[n] for n in pos],
+			[bisect.bisect_left(pos, asset_range.start), bisect.bisect_left(pos, asset_range.stop)]
+				if req['range'] else None)
+
+	async def update(self):
+		from .Ticker import refetch_expired, cache_data
+		async with self.lock: # concurrent requests share a single fetch
+			try:
+				for k in await refetch_expired(self.srcs, self.src_data, self.next_fetch):
+					cache_data(self.src_data[k])
+			except Exception as e:
+				msg(red(f'Fetch failed: {e}'))
+
+	async def read_request(self, reader):
+		data = b''
+		while len(data) <= self.max_req_size and (
+				chunk := await reader.read(self.max_req_size + 1 - len(data))):
+			data += chunk
+		if len(data) > self.max_req_size:
+			raise ValueError(f'request exceeds {self.max_req_size} bytes')
+		return json.loads(data)
+
+	async def handle(self, reader, writer):
+		try:
+			req = await asyncio.wait_for(self.read_request(reader), self.req_timeout)
+			if req['source'] not in self.srcs:
+				raise ValueError(f'{req["source"]!r}: unknown source')
+			await self.update()
+			if src := self.src_data.get(req['source']):
+				data, asset_range = self.select_records(src, req)
+				res = {'time': src.data_time, 'data': data, 'range': asset_range}
+			else:
+				res = {'error': f'no data available for source {req["source"]!r}'}
+		except Exception as e:
+			res = {'error': f'{type(e).__name__}: {e}'}
+		try:
+			writer.write(json.dumps(res).encode())
+			await writer.drain()
+		finally:
+			writer.close()
+
+	async def run(self, addr):
+		if isinstance(addr, tuple):
+			if not self.is_loopback(addr[0]):
+				die(1, '{!r}: not a loopback address.  The price server is for local clients only'.format(
+					addr[0]))
+			server = await asyncio.start_server(self.handle, *addr)
+		else:
+			if os.path.exists(addr):
+				try:
+					await self.connect(addr)
+				except OSError: # stale socket from previous run
+					os.unlink(addr)
+				else:
+					die(1, f'A price server is already running at {addr}')
+			server = await asyncio.start_unix_server(self.handle, addr)
+		await self.update()
+		msg(f'Serving price data at {self.fmt_addr(addr)}.  Press Ctrl-C to exit')
+		try:
+			async with server:
+				await server.serve_forever()
+		finally:
+			if not isinstance(addr, tuple):
+				os.unlink(addr)
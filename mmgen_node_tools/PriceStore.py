@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+#
+# mmgen = Multi-Mode GENerator, a command-line cryptocurrency wallet
+# Copyright (C)2013-2022 The MMGen Project <mmgen@tuta.io>
+# Licensed under the GNU General Public License, Version 3:
+#   https://www.gnu.org/licenses
+# Public project repositories:
+#   https://github.com/mmgen/mmgen-wallet https://github.com/mmgen/mmgen-node-tools
+#   https://gitlab.com/mmgen/mmgen-wallet https://gitlab.com/mmgen/mmgen-node-tools
+
+"""
+mmgen_node_tools.PriceStore: Local price and portfolio value history for the ticker
+"""
+
+import os, time, datetime, json, struct, mmap, hashlib
+from collections import namedtuple
+
+from mmgen.color import red, green, blue, gray
+from mmgen.util import die, suf
+
+pchg_windows = {
+	'percent_change_24h': 86400,
+	'percent_change_7d':  86400 * 7,
+	'percent_change_30d': 86400 * 30,
+	'percent_change_1y':  86400 * 365}
+
+class PriceStore:
+	"""
+	Append-only local store of asset prices, fed by every fetch of source data.  Used
+	to display data as of a past time and to compute percent changes over arbitrary
+	windows without network access.
+
+	Prices are clustered by asset and time, so the price of an asset at a given time
+	is a single index lookup.  Records already in the store are ignored, so the same
+	data may be appended any number of times.
+	"""
+	fn = 'ticker-history.db'
+	record = namedtuple('price_record', ['id', 'symbol', 'name', 'time', 'price', 'market_cap'])
+
+	def __init__(self, cachedir):
+		import sqlite3
+		self.db = sqlite3.connect(os.path.join(cachedir, self.fn), timeout=10)
+		self.db.executescript("""
+			CREATE TABLE IF NOT EXISTS assets (
+				aid    INTEGER PRIMARY KEY,
+				id     TEXT NOT NULL UNIQUE,
+				symbol TEXT NOT NULL,
+				name   TEXT);
+			CREATE INDEX IF NOT EXISTS assets_symbol ON assets (symbol);
+			CREATE TABLE IF NOT EXISTS prices (
+				aid        INTEGER NOT NULL,
+				time       INTEGER NOT NULL,
+				price      REAL NOT NULL,
+				market_cap REAL,
+				PRIMARY KEY (aid, time)) WITHOUT ROWID;
+		""")
+		self.aids = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.db.close()
+
+	def get_aid(self, id):
+		if self.aids is None:
+			self.aids = dict(self.db.execute('SELECT id, aid FROM assets'))
+		return self.aids.get(id)
+
+	def append(self, records):
+		"""
+		Append price records to the store, returning the number of new records
+		"""
+		records = [r for r in records if r.price is not None]
+		with self.db:
+			self.db.executemany(
+				'INSERT INTO assets (id, symbol, name) VALUES (?, ?, ?) '
+				'ON CONFLICT (id) DO UPDATE SET '
+					'symbol = excluded.symbol, name = coalesce(excluded.name, name)',
+				((r.id, r.symbol, r.name) for r in records))
+			self.aids = None
+			return self.db.executemany(
+				'INSERT OR IGNORE INTO prices VALUES (?, ?, ?, ?)',
+				((self.get_aid(r.id), int(r.time), r.price, r.market_cap) for r in records)).rowcount
+
+	def price_at(self, aid, t):
+		"""
+		Return (time, price, market_cap) of the latest record for an asset at or before
+		time ‘t’, or None
+		"""
+		return self.db.execute(
+			'SELECT time, price, market_cap FROM prices WHERE aid = ? AND time <= ? '
+			'ORDER BY time DESC LIMIT 1',
+			(aid, int(t))).fetchone()
+
+	def pchg(self, aid, t, window, price):
+		"""
+		Return the percent change in an asset’s price over the ‘window’ seconds up to time
+		‘t’, or None if there are no prices for the start of the window
+		"""
+		if r := self.price_at(aid, t - window):
+			return (float(price) / r[1] - 1) * 100
+
+	def set_pchg(self, data, t, windows):
+		"""
+		Set percent change fields of display data from stored prices, ‘windows’ being a
+		mapping of field names to window lengths in seconds
+		"""
+		for d in data.values():
+			if 'percent_change_24h' in d: # skip assets with user-supplied rates
+				aid = self.get_aid(d['id'])
+				for k, window in windows.items():
+					d[k] = (
+						0.0 if d['id'] == 'usd-us-dollar' else
+						self.pchg(aid, t, window, d['price_usd']) if aid else
+						None)
+
+	def get_records(self, t, ids=(), symbols=(), all_assets=False):
+		"""
+		Return records in CoinPaprika format for the given assets (or all assets) as of
+		time ‘t’, with percent changes computed from stored prices.  If ‘all_assets’ is
+		set, records are ranked by market cap.
+		"""
+		q = 'SELECT aid, id, symbol, name FROM assets'
+		assets = (
+			self.db.execute(q + ' ORDER BY aid').fetchall() if all_assets else
+			[a for k, vals in (('id', ids), ('symbol', symbols))
+				for v in vals
+					for a in self.db.execute(q + f' WHERE {k} = ? ORDER BY aid', (v,))])
+
+		def gen():
+			for aid, id, symbol, name in dict.fromkeys(assets):
+				if r := self.price_at(aid, t):
+					rec_time, price, market_cap = r
+					upd_time = datetime.datetime.fromtimestamp(rec_time, datetime.timezone.utc)
+					yield {
+						'id': id,
+						'symbol': symbol,
+						'name': name or symbol,
+						'quotes': {'USD': {
+							'price': price,
+							'market_cap': market_cap or 0} | {
+								k: self.pchg(aid, t, window, price)
+									for k, window in pchg_windows.items()}},
+						'last_updated': upd_time.isoformat()}
+
+		ret = list(gen())
+		if all_assets:
+			ret.sort(key=lambda d: d['quotes']['USD']['market_cap'], reverse=True)
+			for n, d in enumerate(ret, 1):
+				d['rank'] = n
+		return ret
+
+class PortfolioLog:
+	"""
+	Append-only valuation log for a portfolio, one per distinct set of holdings, fed
+	by every display of the portfolio with new prices.  Each record is a fixed-width struct of the
+	time, the total value in USD and BTC and the USD value of each asset, so the log
+	can be memory-mapped and read without parsing.  Records are appended with a single
+	write, so concurrent invocations don’t interleave them.
+	"""
+	magic = b'MMNTPFL1'
+	hdr = struct.Struct('<8sII') # magic, header length (including portfolio JSON), nassets
+
+	def __init__(self, cachedir, portfolio):
+		holdings = [[k, str(v)] for k, v in sorted(portfolio, key=lambda a: a[0])]
+		self.ids = [k for k, v in holdings]
+		self.amts = dict(portfolio)
+		meta = json.dumps(holdings).encode()
+		self.hdr_data = self.hdr.pack(self.magic, self.hdr.size + len(meta), len(holdings)) + meta
+		self.rec = struct.Struct(f'<{3 + len(holdings)}d') # time, USD total, BTC total, USD values
+		self.fn = os.path.join(
+			cachedir,
+			'ticker-portfolio-{}.log'.format(hashlib.blake2b(meta, digest_size=4).hexdigest()))
+
+	def get_time(self, data):
+		"""
+		Return the update time of the newest price of the portfolio’s assets in display
+		data ‘data’, or None if none is known
+		"""
+		return max(
+			(int(data[k]['last_updated']) for k in self.ids if k in data and data[k]['last_updated']),
+			default = None)
+
+	def append(self, t, data):
+		"""
+		Append a record of the portfolio’s value at time ‘t’ from display data ‘data’,
+		unless it’s not newer than the last record.  Assets missing from the data are
+		recorded as NaN and left out of the totals.
+		"""
+		ids = [k for k in self.ids if k in data]
+		rec = self.rec.pack(
+			t,
+			float(sum(data[k]['price_usd'] * self.amts[k] for k in ids)),
+			float(sum(data[k]['price_btc'] * self.amts[k] for k in ids)),
+			*(float(data[k]['price_usd'] * self.amts[k]) if k in data else float('nan')
+				for k in self.ids))
+		with open(self.fn, 'a+b') as fh:
+			if not (size := fh.seek(0, os.SEEK_END)):
+				fh.write(self.hdr_data)
+				size = len(self.hdr_data)
+			elif extra := (size - len(self.hdr_data)) % self.rec.size: # truncated record
+				fh.truncate(size := size - extra)
+			elif size > len(self.hdr_data):
+				fh.seek(size - self.rec.size)
+				if self.rec.unpack(fh.read(self.rec.size))[0] >= t:
+					return
+			fh.write(rec)
+
+	def records(self):
+		"""
+		Return the log’s records as a sequence of tuples, or None if the log doesn’t exist
+		"""
+		try:
+			fh = open(self.fn, 'rb')
+		except FileNotFoundError:
+			return None
+		with fh:
+			mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+		if mm[:len(self.hdr_data)] != self.hdr_data:
+			die(2, f'{self.fn}: invalid portfolio log header')
+		nrecs = (len(mm) - len(self.hdr_data)) // self.rec.size
+		return list(self.rec.iter_unpack(
+			memoryview(mm)[len(self.hdr_data):len(self.hdr_data) + nrecs * self.rec.size]))
+
+	def gen_output(self, comma='', add_prec=0):
+		"""
+		Generate a display of the portfolio’s value over time, with profit and loss
+		relative to the first record
+		"""
+		from .Ticker import homedir
+		fn_disp = '~/' + os.path.relpath(self.fn, start=homedir)
+		if not (recs := self.records()):
+			die(1,
+				f'No portfolio history in {fn_disp}.  '
+				'Display the portfolio with --portfolio to record it')
+
+		prec = 2 + add_prec
+		first = recs[0]
+
+		def fmt_chg(v, v0, wid):
+			return (red, green)[v >= v0](f'{v - v0:+{wid}{comma}.{prec}f}')
+
+		def fmt_pct(v, v0):
+			return (red, green)[v >= v0](f'{(v / v0 - 1) * 100 if v0 else 0:+8.2f}%')
+
+		yield f'Portfolio history: {fn_disp} ({len(recs)} record{suf(recs)})'
+		yield ''
+		yield blue('VALUE')
+		wid = max(12, len(f'{max(r[1] for r in recs):{comma}.{prec}f}') + 1)
+		hdr = f'{"TIME (UTC)":19}  {"USD":>{wid}}  {"CHG_USD":>{wid}}  {"CHG_PCT":>9}  {"BTC":>14}'
+		yield hdr
+		yield '-' * len(hdr)
+		for r in recs:
+			yield '{}  {:{w}{c}.{p}f}  {}  {}  {:14.8f}'.format(
+				time.strftime('%F %X', time.gmtime(r[0])),
+				r[1],
+				fmt_chg(r[1], first[1], wid),
+				fmt_pct(r[1], first[1]),
+				r[2],
+				w = wid,
+				c = comma,
+				p = prec)
+		yield '-' * len(hdr)
+
+		last = recs[-1]
+		yield ''
+		yield blue('ASSETS') + ' ({} to {} UTC)'.format(
+			*(time.strftime('%F %X', time.gmtime(r[0])) for r in (first, last)))
+		lbl_wid = max(len(k) for k in self.ids)
+		hdr = (
+			f'{"":{lbl_wid}}  {"FIRST_USD":>{wid}}  {"LAST_USD":>{wid}}  '
+			f'{"CHG_USD":>{wid}}  {"CHG_PCT":>9}')
+		yield hdr
+		yield '-' * len(hdr)
+		for n, k in enumerate(self.ids, 3):
+			if first[n] == first[n] and last[n] == last[n]: # skip NaNs
+				yield '{:{}}  {:{w}{c}.{p}f}  {:{w}{c}.{p}f}  {}  {}'.format(
+					k.upper(), lbl_wid, first[n], last[n],
+					fmt_chg(last[n], first[n], wid),
+					fmt_pct(last[n], first[n]),
+					w = wid,
+					c = comma,
+					p = prec)
+			else:
+				yield '{:{}}  {}'.format(k.upper(), lbl_wid, gray('(no data)'))
+		yield '-' * len(hdr)
@@ -19,8 +19,8 @@ mmgen_node_tools.Ticker: Display price information for cryptocurrency and other
 # Possible alternatives:
 # - https://min-api.cryptocompare.com/data/pricemultifull?fsyms=BTC,LTC&tsyms=USD,EUR
 
-import os, re, time, datetime, json, yaml, random
-from subprocess import run, PIPE, CalledProcessError
+import os, re, time, datetime, json, yaml, random, asyncio, struct
+from subprocess import PIPE
 from decimal import Decimal
 from collections import namedtuple
 
@@ -28,12 +28,21 @@ from mmgen.color import red, yellow, green, blue, orange, gray, cyan, pink
 from mmgen.util import msg, msg_r, rmsg, Msg, Msg_r, die, fmt, fmt_list, fmt_dict, list_gen, suf, is_int
 from mmgen.ui import do_pager
 
+from .TickerCache import CacheIndex, JSONStream, CompressedCache, SearchIndex
+from .PriceStore import PriceStore, PortfolioLog, pchg_windows
+from .PriceAlerts import PriceAlerts, alert_cols
+from .PriceServer import PriceServer
+
 homedir = os.getenv('HOME')
 dfl_cachedir = os.path.join(homedir, '.cache', 'mmgen-node-tools')
 cfg_fn = 'ticker-cfg.yaml'
 portfolio_fn = 'ticker-portfolio.yaml'
+alerts_fn = 'ticker-alerts.yaml'
 asset_tuple = namedtuple('asset_tuple', ['symbol', 'id', 'source'])
-last_api_host = None
+fetching_concurrently = False
+refresh_lock_timeout = 120
+# options passed to the background refresh, which determine what is fetched:
+refresh_opts = ('proxy', 'proxy2', 'http_backend', 'asset_limit', 'btc', 'add_rows', 'add_columns')
 
 percent_cols = {
 	'd': 'day',
@@ -50,11 +59,86 @@ sort_params = {
 	'p': sp('price_usd',          Decimal(0), 'asset price'),
 	'c': sp('market_cap',         0,          'market cap')}
 
+class http_session:
+	"""
+	aiohttp session shared by all data sources for the lifetime of the program, so
+	that connections to remote hosts and proxies are kept alive and reused
+	"""
+	session = None
+
+	@classmethod
+	def get(cls):
+		if cls.session is None:
+			import aiohttp
+			cls.session = aiohttp.ClientSession(
+				headers   = {'Accept': 'application/json'},
+				timeout   = aiohttp.ClientTimeout(connect=gcfg.http_timeout or None),
+				trust_env = cfg.proxy is None) # proxy 'none': allow override from environment
+		return cls.session
+
+	@staticmethod
+	def supports_proxy(proxy):
+		"""
+		return True if aiohttp can use proxy ‘proxy’ or, if None, the proxies set in the
+		environment.  Of the latter, aiohttp reads only the HTTP proxies for HTTP(S) and
+		WebSocket URLs, ignoring ‘all_proxy’.
+		"""
+		if proxy is None:
+			from urllib.request import getproxies
+			env = getproxies()
+			return 'all' not in env and all(
+				v.startswith('http://') for k, v in env.items() if k in ('http', 'https', 'ws', 'wss'))
+		return not proxy or proxy.startswith('http')
+
+	@classmethod
+	async def close(cls):
+		if cls.session:
+			await cls.session.close()
+			cls.session = None
+
 class RowDict(dict):
 
 	def __iter__(self):
 		return (e for v in self.values() for e in v)
 
+class RateLimiter:
+	"""
+	Token bucket limiting the rate of requests to a remote host, shared by all
+	processes on the machine via a state file in the cache directory.  Updates of
+	the state are serialized by an exclusive lock on the file.
+	"""
+	state = struct.Struct('<dd') # tokens, time of last update
+
+	def __init__(self, cachedir, host, capacity, period):
+		self.fn = os.path.join(cachedir, f'ticker-ratelimit-{host}')
+		self.capacity = capacity
+		self.rate = capacity / period # tokens per second
+
+	def acquire(self, cost=1):
+		"""
+		Take ‘cost’ tokens from the bucket, returning 0 on success, otherwise the
+		number of seconds until enough tokens are available
+		"""
+		try:
+			import fcntl
+		except ImportError: # MSWin: no locking
+			fcntl = None
+		with open(self.fn, 'a+b') as fh:
+			if fcntl:
+				fcntl.flock(fh, fcntl.LOCK_EX) # released on close
+			fh.seek(0)
+			now = time.time()
+			try:
+				tokens, t = self.state.unpack(fh.read(self.state.size))
+			except struct.error: # new file
+				tokens, t = self.capacity, now
+			tokens = min(self.capacity, tokens + max(0, now - t) * self.rate)
+			if ok := tokens >= cost:
+				tokens -= cost
+			fh.truncate(0)
+			fh.write(self.state.pack(tokens, now))
+		return 0 if ok else (cost - tokens) / self.rate
+
 class DataSource:
 
 	source_groups = [
@@ -72,20 +156,76 @@ class DataSource:
 
 	class base:
 
-		def fetch_delay(self):
-			global last_api_host
-			if not gcfg.testing and last_api_host and last_api_host != self.api_host:
+		host_locks = {}
+		hosts_fetched = set()
+
+		async def fetch_delay(self):
+			# Sources on different hosts are fetched concurrently.  Requests to the same host
+			# are serialized by a per-host lock, with a random delay between them:
+			if not gcfg.testing and self.api_host in self.hosts_fetched:
 				delay = 1 + random.randrange(1, 5000) / 1000
-				msg_r(f'Waiting {delay:.3f} seconds...')
-				time.sleep(delay)
+				msg(f'Waiting {delay:.3f} seconds before next request to {self.api_host}')
+				await asyncio.sleep(delay)
+			self.hosts_fetched.add(self.api_host)
+
+		async def get_data_from_network(self):
+			"""
+			Return the response body as a JSONStream, its raw bytes having been written to a
+			new cache file, or the cached text if it hasn’t been modified
+			"""
+			stream = JSONStream(
+				CompressedCache.writer(self.json_fn),
+				select  = self.stream_selector(),
+				extract = self.history_record,
+				flush   = self.append_history)
+			try:
+				fetch = self.get_data_aiohttp if cfg.http_backend == 'aiohttp' else self.get_data_curl
+				ret = await fetch(stream)
+				if ret is stream:
+					stream.close()
+				else:
+					stream.out.discard()
+				return ret
+			except ValueError:
+				stream.out.discard()
+				self.json_data_error_msg(stream.head)
+				die(2, 'Retrieved data is not valid JSON, exiting')
+			except:
+				stream.out.discard()
+				raise
+
+		async def get_data_aiohttp(self, stream):
+
+			if gcfg.testing:
+				Msg(fmt_list(
+					['GET', self.api_url] + (['proxy', cfg.proxy] if cfg.proxy else []),
+					fmt = 'bare'))
+				return
+
+			import aiohttp
+			try:
+				async with http_session.get().get(
+						self.api_url,
+						proxy   = cfg.proxy or None,
+						headers = self.get_conditional_headers()) as res:
+					self.set_cache_meta(res.status, res.headers)
+					if self.not_modified:
+						return self.read_cached_text()
+					async for chunk in res.content.iter_chunked(self.chunk_size):
+						stream.feed(chunk)
+					return stream
+			except aiohttp.ClientError as e:
 				msg('')
-			last_api_host = self.api_host
+				msg(red(f'{type(e).__name__}: {e}'))
+				die(3, f'HTTP request to {self.api_host} failed')
 
-		def get_data_from_network(self):
+		async def get_data_curl(self, stream):
 
 			curl_cmd = list_gen(
 				['curl', '--tr-encoding', '--header', 'Accept: application/json', True],
+				*(['--header', f'{k}: {v}', True] for k, v in self.get_conditional_headers().items()),
 				['--compressed'], # adds 'Accept-Encoding: gzip'
+				['--dump-header', '-', True], # headers precede the body on stdout
 				['--proxy', cfg.proxy, isinstance(cfg.proxy, str)],
 				['--silent', not cfg.verbose],
 				['--connect-timeout', str(gcfg.http_timeout), gcfg.http_timeout],
@@ -95,55 +235,136 @@ class DataSource:
 				Msg(fmt_list(curl_cmd, fmt='bare'))
 				return
 
+			proc = await asyncio.create_subprocess_exec(*curl_cmd, stdout=PIPE)
 			try:
-				return run(curl_cmd, check=True, stdout=PIPE).stdout.decode()
-			except CalledProcessError as e:
+				# the last header block is that of the final response:
+				hdrs = b''
+				try:
+					while (body := await proc.stdout.readexactly(5)) == b'HTTP/':
+						hdrs = body + await proc.stdout.readuntil(b'\r\n\r\n')
+				except asyncio.IncompleteReadError as e: # short or empty body
+					body = e.partial
+				status_line, *lines = hdrs.decode().removesuffix('\r\n\r\n').split('\r\n')
+				self.set_cache_meta(
+					int(status_line.split()[1]) if hdrs else 200,
+					{k.strip().lower(): v.strip() for k, _, v in (line.partition(':') for line in lines)})
+				if not self.not_modified:
+					stream.feed(body)
+				while chunk := await proc.stdout.read(self.chunk_size):
+					if not self.not_modified:
+						stream.feed(chunk)
+				await proc.wait()
+			finally:
+				if proc.returncode is None:
+					proc.kill()
+					await proc.wait()
+
+			if proc.returncode:
 				msg('')
 				from .Misc import curl_exit_codes
-				msg(red(curl_exit_codes[e.returncode]))
+				msg(red(curl_exit_codes[proc.returncode]))
 				msg(red('Command line:\n  {}'.format(
-					' '.join((repr(i) if ' ' in i else i) for i in e.cmd))))
+					' '.join((repr(i) if ' ' in i else i) for i in curl_cmd))))
 				from mmgen.exception import MMGenCalledProcessError
 				raise MMGenCalledProcessError(
-					f'Subprocess returned non-zero exit status {e.returncode}')
+					f'Subprocess returned non-zero exit status {proc.returncode}')
+
+			return self.read_cached_text() if self.not_modified else stream
+
+		def fetch_msg(self, done=False):
+			if gcfg.watch:
+				return
+			elif fetching_concurrently:
+				msg('{} {} from {}{}'.format(
+					'Received' if done else 'Fetching',
+					self.data_desc,
+					self.api_host,
+					(' (not modified)' if self.not_modified else '') if done else '...'))
+			elif done:
+				msg('done (not modified)' if self.not_modified else 'done')
+			else:
+				msg_r(f'Fetching {self.data_desc} from {self.api_host}...')
+				if self.has_verbose and cfg.verbose:
+					msg('')
 
-		def get_data(self):
+		async def get_data(self):
+
+			if cfg.server and not gcfg.serve:
+				return await self.get_data_from_server()
 
 			if not os.path.exists(cfg.cachedir):
 				os.makedirs(cfg.cachedir)
 
 			use_cached_data = cfg.cached_data and not gcfg.download
+			cache_mtime = None
 
-			if use_cached_data:
-				data_type = 'json'
+			if not (use_cached_data or gcfg.testing):
 				try:
-					data_in = open(self.json_fn).read()
+					mtime = self.get_cache_time()
 				except FileNotFoundError:
+					mtime = None
+				else:
+					match self.cache_status(elapsed := int(time.time() - mtime)):
+						case 'fresh' if gcfg.download:
+							die(1, self.rate_limit_errmsg(elapsed))
+						case 'fresh' | 'stale' as status if not gcfg.download:
+							use_cached_data = True
+							cache_mtime = mtime
+							self.refresh = status == 'stale'
+				# other processes may have made requests to the host, so wait for a token,
+				# or fall back to cached data:
+				while not use_cached_data and (
+						wait := self.rate_limiter.acquire(self.timeout / self.ratelimit)):
+					if mtime and not gcfg.download:
+						use_cached_data = True
+						cache_mtime = mtime
+						if not cfg.quiet:
+							msg(yellow(f'Rate limit for {self.api_host} in effect'))
+					else:
+						msg(f'Rate limit for {self.api_host} in effect, waiting {wait:.1f} seconds')
+						await asyncio.sleep(wait)
+
+			if use_cached_data:
+				if not (cache_fn := CompressedCache.path(self.json_fn)):
 					die(1, f'Cannot use cached data, because {self.json_fn_disp} does not exist')
+				self.cache_fn = cache_fn
+				if self.indexed and (data_idx := CacheIndex.open(cache_fn, load=CompressedCache.read)):
+					data_type = 'indexed'
+				else:
+					data_type = 'json'
+					data_in = CompressedCache.read(cache_fn).decode()
 			else:
 				data_type = self.net_data_type
-				try:
-					mtime = os.stat(self.json_fn).st_mtime
-				except FileNotFoundError:
-					mtime = 0
-				if (elapsed := int(time.time() - mtime)) >= self.timeout or gcfg.testing:
-					if gcfg.testing:
-						msg('')
-					self.fetch_delay()
-					msg_r(f'Fetching {self.data_desc} from {self.api_host}...')
-					if self.has_verbose and cfg.verbose:
-						msg('')
-					data_in = self.get_data_from_network()
-					msg('done')
-					if gcfg.testing:
-						return {}
-				else:
-					die(1, self.rate_limit_errmsg(elapsed))
-
+				if gcfg.testing:
+					msg('')
+				async with self.host_locks.setdefault(self.api_host, asyncio.Lock()):
+					await self.fetch_delay()
+					self.fetch_msg()
+					data_in = await self.get_data_from_network()
+				self.fetch_msg(done=True)
+				if gcfg.testing:
+					return {}
+				if isinstance(data_in, JSONStream):
+					data_type = 'stream'
+
+			spans = None
+			json_text = None
 			match data_type:
+				case 'indexed':
+					data = data_idx
+				case 'stream':
+					if data_in.is_list: # records not kept by the stream are read from the cache file
+						writer = data_in.out
+						data = CacheIndex.from_stream(
+							data_in,
+							load = lambda: CompressedCache.read(writer.path))
+					else:
+						data = data_in.value
 				case 'json':
 					try:
-						data = json.loads(data_in)
+						data, spans = (
+							CacheIndex.parse(data_in) if self.indexed else
+							(json.loads(data_in), None))
 					except:
 						self.json_data_error_msg(data_in)
 						die(2, 'Retrieved data is not valid JSON, exiting')
@@ -159,31 +380,194 @@ class DataSource:
 						'or use --download to retrieve data from remote host')
 				else:
 					die(2, 'Remote host returned no data!')
-			elif 'error' in data:
+			elif isinstance(data, dict) and 'error' in data:
 				die(1, data['error'])
 
 			self.data = self.postprocess_data(data)
+			self.data_time = cache_mtime or time.time()
+
+			self.cache_writer = data_in.out if data_type == 'stream' else None
 
 			if use_cached_data:
 				self.json_text = None
+				if spans: # cache file has no valid index, so create one
+					try:
+						CacheIndex.write(self.cache_fn, data, spans)
+					except OSError:
+						pass
 				if not cfg.quiet:
-					msg(f'Using cached data from {self.json_fn_disp}')
+					if cache_mtime:
+						from mmgen.util2 import format_elapsed_hr
+						msg('Using cached data from {} (updated {}{})'.format(
+							self.json_fn_disp,
+							format_elapsed_hr(cache_mtime, show_secs=True),
+							', refreshing in background' if self.refresh else ''))
+					else:
+						msg(f'Using cached data from {self.json_fn_disp}')
+			elif self.not_modified: # refresh the cache’s timestamp, and hence its index
+				self.json_text = None
+				os.utime(self.cache_fn)
+				if spans:
+					CacheIndex.write(self.cache_fn, data, spans)
+				self.write_cache_meta()
 			else:
 				self.json_text = json_text
-				if cache_data(self, no_overwrite=True):
-					self.json_text = None
+				self.json_spans = spans
+				cache_data(self, no_overwrite=True)
+				# the price records of a streamed list are appended to the history while parsing:
+				if not (data_type == 'stream' and data_in.is_list and data_in.extract):
+					self.append_history()
 
 			return self
 
+		async def get_data_from_server(self):
+
+			wants = get_wants()[0]
+			res = await PriceServer.request(cfg.server, {
+				'source': self.src_id,
+				'id':     sorted(wants['id']),
+				'symbol': sorted(wants['symbol']),
+				'range':  (1, None) if gcfg.list_ids else cfg.asset_range})
+
+			if 'error' in res:
+				die(2, f'Price server: {res["error"]}')
+
+			self.data = self.postprocess_server_data(res)
+			self.data_time = res['time']
+			self.json_text = None
+
+			if not cfg.quiet:
+				from mmgen.util2 import format_elapsed_hr
+				msg('Using {} from price server (updated {})'.format(
+					self.data_desc,
+					format_elapsed_hr(res['time'], show_secs=True)))
+
+			return self
+
+		def append_history(self, records=None):
+			"""
+			Append ‘records’, or those of the data, to the price history, returning True on
+			success
+			"""
+			try:
+				with PriceStore(cfg.cachedir) as store:
+					store.append(self.gen_history_records() if records is None else records)
+			except Exception as e:
+				msg(yellow(f'Warning: unable to update price history: {type(e).__name__}: {e}'))
+				return False
+			return True
+
+		def gen_history_records(self):
+			return ()
+
+		def stream_selector(self):
+			"""
+			return a function of an element’s position and value selecting the elements of a
+			streamed list to be kept, or None to keep all
+			"""
+			return None
+
+		history_record = None # function returning an element’s price record
+		cache_writer = None # the CompressedCache.writer of streamed data not yet cached
+		chunk_size = 2**16
+
+		cache_fn = None # the version of ‘json_fn’ read or written, which may be compressed
+		cache_meta = None # validators and server time of the last response, if any
+		not_modified = False
+
+		@property
+		def meta_fn(self):
+			return self.json_fn + '.meta'
+
+		def read_cache_meta(self):
+			try:
+				with open(self.meta_fn) as fh:
+					return json.load(fh)
+			except (FileNotFoundError, ValueError):
+				return {}
+
+		def write_cache_meta(self):
+			if self.cache_meta:
+				with open(self.meta_fn, 'w') as fh:
+					json.dump(self.cache_meta | {'mtime': os.stat(self.cache_fn).st_mtime}, fh)
+
+		def read_cached_text(self):
+			return CompressedCache.read(self.cache_fn).decode()
+
+		def get_conditional_headers(self):
+			self.cache_fn = CompressedCache.path(self.json_fn)
+			meta = self.read_cache_meta() if self.cache_fn else {}
+			return {k: meta[m] for k, m in (
+					('If-None-Match', 'etag'),
+					('If-Modified-Since', 'last_modified'))
+				if meta.get(m)}
+
+		def set_cache_meta(self, status, headers):
+			"""
+			Save the validators and server time of a response, retaining the validators of
+			the cached data if the response is ‘304 Not Modified’
+			"""
+			from email.utils import parsedate_to_datetime
+			self.not_modified = status == 304
+			try:
+				date = parsedate_to_datetime(headers['date']).timestamp()
+			except (KeyError, TypeError, ValueError):
+				date = time.time()
+			self.cache_meta = (self.read_cache_meta() if self.not_modified else {}) | {
+				k: v for k, v in (
+					('etag', headers.get('etag')),
+					('last_modified', headers.get('last-modified')))
+				if v} | {'date': date}
+
+		def get_cache_time(self):
+			"""
+			Return the server time of the last response validating the cached data, if
+			recorded for it, otherwise the cache file’s mtime
+			"""
+			if not (cache_fn := CompressedCache.path(self.json_fn)):
+				raise FileNotFoundError(f'{self.json_fn}: cache file not found')
+			self.cache_fn = cache_fn
+			mtime = os.stat(cache_fn).st_mtime
+			meta = self.read_cache_meta()
+			return min(meta['date'], time.time()) if meta.get('mtime') == mtime else mtime
+
+		@property
+		def rate_limiter(self):
+			# sources on the same host share its bucket, each being fetched once per rate limit
+			# period:
+			hosts = [getattr(DataSource, v).api_host for v in DataSource.get_sources().values()]
+			return RateLimiter(cfg.cachedir, self.api_host, hosts.count(self.api_host), self.ratelimit)
+
+		indexed = False
+		json_spans = None
+		refresh = False
+		stale_ttl = 900 # cached data this many seconds past the rate limit is served while refreshing
+
+		def cache_status(self, elapsed):
+			"""
+			TTL policy for cached data: within the rate limit window, it’s ‘fresh’ and served
+			as-is; for ‘stale_ttl’ seconds after that, it’s ‘stale’ and served while being
+			refreshed in the background; after that, it’s ‘expired’ and must be refetched
+			"""
+			return (
+				'fresh' if elapsed < self.timeout else
+				'stale' if (
+					elapsed < self.timeout + self.stale_ttl
+					and not (gcfg.test_suite or gcfg.watch or gcfg.serve)) else
+				'expired')
+
 		def json_data_error_msg(self, json_text):
 			pass
 
 		def postprocess_data(self, data):
 			return data
 
+		def postprocess_server_data(self, res):
+			return res['data']
+
 		@property
 		def json_fn_disp(self):
-			return '~/' + os.path.relpath(self.json_fn, start=homedir)
+			return '~/' + os.path.relpath(self.cache_fn or self.json_fn, start=homedir)
 
 	class coinpaprika(base):
 		desc = 'CoinPaprika'
@@ -195,7 +579,10 @@ class DataSource:
 		net_data_type = 'json'
 		has_verbose = True
 		dfl_asset_limit = 2000
+		max_search_results = 100
 		max_asset_idx = 1_000_000
+		src_id = 'cc'
+		range_slice = None # slice of data from price server corresponding to requested asset range
 
 		def __init__(self):
 			self.asset_limit = int(cfg.asset_limit) if is_int(cfg.asset_limit) else self.dfl_asset_limit
@@ -242,8 +629,85 @@ class DataSource:
 			msg(json_text[:1024] + '...')
 			msg(orange(fmt(tor_captcha_msg, strip_char='\t')))
 
+		@property
+		def indexed(self):
+			return not cfg.btc_only
+
 		def postprocess_data(self, data):
-			return [data] if cfg.btc_only else data
+			if isinstance(data, CacheIndex):
+				self.find = data.find
+				return data
+			return self.index_data([data] if cfg.btc_only else data)
+
+		def postprocess_server_data(self, res):
+			if res['range']:
+				self.range_slice = slice(*res['range'])
+			return self.index_data(res['data'])
+
+		def get_asset_range(self, n, m):
+			return self.data[self.range_slice or slice(n-1, m)]
+
+		search_idx = None
+
+		def search(self, term, limit=None):
+			"""
+			return the positions of the assets matching ‘term’, best match first
+			"""
+			if self.search_idx is None: # data read from or written to the cache has a sidecar index
+				self.search_idx = SearchIndex.get(
+					self.data,
+					self.cache_fn if self.json_text is None and self.cache_writer is None else None)
+			return self.search_idx.search(term, limit)
+
+		def stream_selector(self):
+			# keep the wanted assets and the requested asset range, other assets being decoded
+			# from the cache file on access:
+			wants = get_wants()[0]
+			ids = wants['id'] | {'btc-bitcoin'}
+			symbols = wants['symbol']
+			asset_range = range(cfg.asset_range[0] - 1, cfg.asset_range[1]) if cfg.asset_range else ()
+			return lambda n, d: d['id'] in ids or d['symbol'] in symbols or n in asset_range
+
+		@staticmethod
+		def history_record(d):
+			return PriceStore.record(
+				id         = d['id'],
+				symbol     = d['symbol'],
+				name       = d['name'],
+				time       = datetime.datetime.fromisoformat(d['last_updated']).timestamp(),
+				price      = d['quotes']['USD']['price'],
+				market_cap = d['quotes']['USD']['market_cap'])
+
+		def gen_history_records(self):
+			return map(self.history_record, self.data)
+
+		def get_data_from_history(self):
+			wants = get_wants()[0]
+			with PriceStore(cfg.cachedir) as store:
+				self.data = self.index_data(store.get_records(
+					cfg.as_of,
+					ids        = wants['id'] | {'btc-bitcoin'},
+					symbols    = wants['symbol'],
+					all_assets = bool(cfg.asset_range)))
+			if not self.find('id', 'btc-bitcoin'):
+				die(1, 'No price history for BTC at {} in {}'.format(
+					time.strftime('%F %X UTC', time.gmtime(cfg.as_of)),
+					PriceStore.fn))
+			self.data_time = cfg.as_of
+			self.json_text = None
+			if not cfg.quiet:
+				msg('Using price history from ~/{}'.format(
+					os.path.relpath(os.path.join(cfg.cachedir, PriceStore.fn), start=homedir)))
+			return self
+
+		def index_data(self, data):
+			# index the asset list by ID and symbol, preserving source order:
+			idx = {k: {} for k in CacheIndex.key_fields}
+			for n, d in enumerate(data):
+				for k, v in idx.items():
+					v.setdefault(d[k], []).append(n)
+			self.find = lambda field, value: idx[field].get(value, [])
+			return data
 
 		@staticmethod
 		def parse_asset_id(s, require_label=True):
@@ -265,6 +729,7 @@ class DataSource:
 		has_verbose = False
 		asset_id_pat = r'^\^.*|.*=[xf]$'
 		json_fn_basename = 'ticker-finance.json'
+		src_id = 'fi'
 
 		@staticmethod
 		def get_id(sym, data):
@@ -302,7 +767,7 @@ class DataSource:
 		def symbols(self):
 			return [r.symbol for r in cfg.rows if r.source == 'fi']
 
-		def get_data_from_network(self):
+		async def get_data_from_network(self):
 
 			kwargs = {
 				'formatted': True,
@@ -321,12 +786,27 @@ class DataSource:
 					fmt_dict(kwargs, fmt='kwargs')))
 				return
 
-			from yahooquery import Ticker
-			return self.process_network_data(Ticker(self.symbols,**kwargs))
+			def fetch():
+				from yahooquery import Ticker
+				return self.process_network_data(Ticker(self.symbols, **kwargs))
+
+			# yahooquery is blocking, so run it in a thread to allow other sources to be fetched:
+			return await asyncio.to_thread(fetch)
 
 		def process_network_data(self, ticker):
 			return ticker.price
 
+		def gen_history_records(self):
+			for k, v in self.data.items():
+				if isinstance(v, dict):
+					yield PriceStore.record(
+						id         = k.lower(),
+						symbol     = k.upper(),
+						name       = v['shortName'],
+						time       = v['regularMarketTime'],
+						price      = v['regularMarketPrice']['raw'],
+						market_cap = None)
+
 		@staticmethod
 		def parse_asset_id(s, require_label=True):
 			return asset_tuple(
@@ -338,30 +818,93 @@ class DataSource:
 
 		json_fn_basename = 'ticker-finance-history.json'
 		data_desc = 'historical financial data'
-		net_data_type = 'json'
+		src_id = 'hi'
+		net_data_type = 'python'
 		period = '1y'
+		period_days = 365
 		interval = '1wk'
 
 		def process_network_data(self, ticker):
-			return ticker.history(
-				period   = self.period,
-				interval = self.interval).to_json(orient='index')
+			"""
+			Fetch only the weeks since the oldest of the symbols’ newest cached points,
+			merging them into the cached history.  The full period is fetched if there’s
+			no usable cached history for some symbol.
+			"""
+			cached = self.get_cached_history()
+			today = datetime.datetime.now(datetime.timezone.utc).date()
+			# drop weeks that end before the start of the period:
+			cutoff = (today - datetime.timedelta(days=self.period_days + 7)).isoformat()
+			newest = [max(cached[sym], default='') for sym in self.symbols if sym in cached]
+			if len(newest) == len(self.symbols) and min(newest, default='') > cutoff:
+				# refetch the last cached week too, as its close may have been partial:
+				start = (
+					datetime.date.fromisoformat(min(newest)) - datetime.timedelta(days=7)).isoformat()
+				res = ticker.history(start=start, interval=self.interval)
+			else:
+				start = ''
+				res = ticker.history(period=self.period, interval=self.interval)
+			return self.merge_history(cached, self.parse_history(res), start, cutoff, self.symbols)
 
-		def postprocess_data(self, data):
+		@staticmethod
+		def parse_history(res):
+			"""
+			Convert a DataFrame indexed by (symbol, date) to a dict of weekly data keyed
+			by symbol and ISO date.  Rows indexed by a datetime (the current day’s data,
+			returned in addition to the weekly data) are skipped.
+			"""
+			ret = {}
+			if isinstance(res, dict): # yahooquery returns a dict of error messages on failure
+				return ret
+			for (sym, date), row in zip(res.index, res.to_dict(orient='records')):
+				if not isinstance(date, datetime.datetime):
+					ret.setdefault(sym, {})[date.isoformat()] = {
+						k: (None if v != v else v) for k, v in row.items()}
+			return ret
+
+		@staticmethod
+		def merge_history(cached, new, start, cutoff, symbols):
+			"""
+			Fetched data replaces cached data from date ‘start’ on.  Data before ‘cutoff’
+			is dropped, as are symbols not in ‘symbols’.
+			"""
 			def gen():
-				keys = set()
-				d = {}
-				for key, val in data.items():
-					if m := re.match(r"\('(.*?)', datetime\.date\((.*)\)\)$", key):
-						date = '{}-{:>02}-{:>02}'.format(*m[2].split(', '))
-						if (sym := m[1]) in keys:
-							d[date] = val
-						else:
-							keys.add(sym)
-							d = {date: val}
-							yield (sym, d)
+				for sym in symbols:
+					d = {k: v for k, v in cached.get(sym, {}).items() if k < start} | new.get(sym, {})
+					if d:
+						yield (sym, {k: d[k] for k in sorted(d) if k > cutoff})
 			return dict(gen())
 
+		def get_cached_history(self):
+			if fn := CompressedCache.path(self.json_fn):
+				try:
+					return self.postprocess_data(json.loads(CompressedCache.read(fn)))
+				except (OSError, EOFError, ValueError):
+					pass
+			return {}
+
+		def gen_history_records(self):
+			# weekly closing prices are recorded at the end of their week:
+			for k, v in self.data.items():
+				for date, d in v.items():
+					yield PriceStore.record(
+						id         = k.lower(),
+						symbol     = k.upper(),
+						name       = None,
+						time       = min(self.data_time, datetime.datetime.fromisoformat(date).replace(
+							tzinfo = datetime.timezone.utc).timestamp() + 86400 * 7),
+						price      = d['close'],
+						market_cap = None)
+
+		def postprocess_data(self, data):
+			# convert data cached by older versions, keyed by the stringified DataFrame index:
+			if not next(iter(data), '').startswith("('"):
+				return data
+			ret = {}
+			for key, val in data.items():
+				if m := re.match(r"\('(.*?)', datetime\.date\((.*)\)\)$", key):
+					ret.setdefault(m[1], {})['{}-{:>02}-{:>02}'.format(*m[2].split(', '))] = val
+			return ret
+
 def assets_list_gen(cfg_in):
 	for k, v in cfg_in.cfg['assets'].items():
 		yield ''
@@ -370,6 +913,33 @@ def assets_list_gen(cfg_in):
 			out = e.split('-', 1)
 			yield '  {:5s} {}'.format(out[0], out[1] if len(out) == 2 else '')
 
+def get_wants():
+	"""
+	Return the IDs and symbols of all assets required for display, of user-specified
+	assets and of user rate assets
+	"""
+	rows_want = {
+		'id': {r.id for r in cfg.rows if r.id} - {'usd-us-dollar'},
+		'symbol': {r.symbol for r in cfg.rows if r.id is None} - {'USD'}}
+	usr_rate_assets = tuple(u.rate_asset for u in cfg.usr_rows + cfg.usr_columns if u.rate_asset)
+	usr_rate_assets_want = {
+		'id':     {a.id for a in usr_rate_assets if a.id},
+		'symbol': {a.symbol for a in usr_rate_assets if not a.id}}
+	usr_assets = cfg.usr_rows + cfg.usr_columns + tuple(c for c in (cfg.query or ()) if c)
+	usr_wants = {
+		'id': (
+			{a.id for a in usr_assets + usr_rate_assets if a.id} -
+			{a.id for a in usr_assets if a.rate and a.id} - {'usd-us-dollar'})
+		,
+		'symbol': (
+			{a.symbol for a in usr_assets + usr_rate_assets if not a.id} -
+			{a.symbol for a in usr_assets if a.rate} - {'USD'})}
+
+	return (
+		{k: rows_want[k] | usr_wants[k] for k in ('id', 'symbol')},
+		usr_wants,
+		usr_rate_assets_want)
+
 def gen_data(data):
 	"""
 	Filter the raw data and return it as a dict keyed by the IDs of the assets
@@ -379,17 +949,31 @@ def gen_data(data):
 
 	Since symbols in source data are not guaranteed to be unique (e.g. XAG), we
 	must search the data twice: first for unique IDs, then for symbols while
-	checking for duplicates.
+	checking for duplicates.  Lookups use the source’s ID and symbol indexes,
+	with matches processed in source order.
 	"""
 
 	def dup_sym_errmsg(data_type, dup_sym):
+		src = data[data_type]
+		ids = (
+			[src.data[n]['id'] for n in src.find('symbol', dup_sym)] if data_type == 'cc' else
+			[d['id'] for d in src.data if d['symbol'] == dup_sym])
 		return (
 			f'The symbol {dup_sym!r} is shared by the following assets:\n' +
-			'\n  ' + '\n  '.join(d['id'] for d in data[data_type].data if d['symbol'] == dup_sym) +
+			'\n  ' + '\n  '.join(ids) +
 			'\n\nPlease specify the asset by one of the full IDs listed above\n' +
 			f'instead of {dup_sym!r}')
 
 	def check_assets_found(wants, found, keys=['symbol', 'id']):
+
+		def suggest(k, v):
+			# search IDs by their labels, which are names in lowercase with hyphens for spaces:
+			if 'cc' in data and (hits := data['cc'].search(
+					v.split('-', 1)[-1].replace('-', ' ') if k == 'id' else v,
+					limit = 3)):
+				return '  (closest matches: {})'.format(', '.join(data['cc'].data[n]['id'] for n in hits))
+			return ''
+
 		error = False
 		for k in keys:
 			missing = wants[k] - found[k]
@@ -397,7 +981,7 @@ def gen_data(data):
 				msg(
 					('The following IDs were not found in source data:\n{}' if k == 'id' else
 					'The following symbols could not be resolved:\n{}').format(
-						fmt_list(missing, fmt='col', indent='  ')))
+						'\n'.join(f'  {v}{suggest(k, v)}' for v in sorted(missing))))
 				error = True
 		if error:
 			die(1, 'Missing data, exiting')
@@ -406,35 +990,32 @@ def gen_data(data):
 
 		def cc():
 			nonlocal btcusd
-			for d in data['cc'].data:
-				if d['id'] == 'btc-bitcoin':
-					btcusd = Decimal(str(d['quotes']['USD']['price']))
-					break
-			else:
+			src = data['cc']
+			if not (pos := src.find('id', 'btc-bitcoin')):
 				raise ValueError('malformed cryptocurrency data')
+			btcusd = Decimal(str(src.data[pos[0]]['quotes']['USD']['price']))
 			for k in ('id', 'symbol'):
-				for d in data['cc'].data:
-					if wants[k]:
-						if d[k] in wants[k]:
-							if d[k] in found[k]:
-								die(1, dup_sym_errmsg('cc', d[k]))
-							if not 'price_usd' in d:
-								d['price_usd'] = Decimal(str(d['quotes']['USD']['price']))
-								d['price_btc'] = Decimal(str(d['quotes']['USD']['price'])) / btcusd
-								d['percent_change_24h'] = d['quotes']['USD']['percent_change_24h']
-								d['percent_change_7d']  = d['quotes']['USD']['percent_change_7d']
-								d['percent_change_30d'] = d['quotes']['USD']['percent_change_30d']
-								d['percent_change_1y']  = d['quotes']['USD']['percent_change_1y']
-								d['market_cap']  = d['quotes']['USD']['market_cap']
-								d['last_updated'] = int(datetime.datetime.fromisoformat(
-									d['last_updated']).timestamp())
-							yield (d['id'], d)
-							found[k].add(d[k])
-							wants[k].remove(d[k])
-							if d[k] in usr_rate_assets_want[k]:
-								rate_assets[d['symbol']] = d # NB: using symbol instead of ID for key
-					else:
-						break
+				# for duplicate symbols, the first asset in source order wins:
+				hits = sorted(pos[0] for e in wants[k] if (pos := src.find(k, e)))
+				for d in (src.data[n] for n in hits):
+					if d[k] in found[k]:
+						die(1, dup_sym_errmsg('cc', d[k]))
+					if not 'price_usd' in d:
+						q = d['quotes']['USD']
+						d['price_usd'] = Decimal(str(q['price']))
+						d['price_btc'] = d['price_usd'] / btcusd
+						d['percent_change_24h'] = q['percent_change_24h']
+						d['percent_change_7d']  = q['percent_change_7d']
+						d['percent_change_30d'] = q['percent_change_30d']
+						d['percent_change_1y']  = q['percent_change_1y']
+						d['market_cap']  = q['market_cap']
+						d['last_updated'] = int(datetime.datetime.fromisoformat(
+							d['last_updated']).timestamp())
+					yield (d['id'], d)
+					found[k].add(d[k])
+					wants[k].remove(d[k])
+					if d[k] in usr_rate_assets_want[k]:
+						rate_assets[d['symbol']] = d # NB: using symbol instead of ID for key
 
 		def fi():
 			get_id = src_cls['fi'].get_id
@@ -454,11 +1035,11 @@ def gen_data(data):
 							v['pct_chg_1y']   = (spot / hist.close_1y   - 1) * 100
 						else:
 							v['pct_chg_1wk'] = v['pct_chg_4wks'] = v['pct_chg_1y'] = None
-						yield (id, conv_func(id, v, btcusd))
+						yield (id, d := conv_func(id, v, btcusd))
 						found['id'].add(id)
 						wants['id'].remove(id)
 						if id in usr_rate_assets_want['id']: # NB: using symbol instead of ID for key:
-							rate_assets[k] = conv_func(id, v, btcusd)
+							rate_assets[k] = d
 				else:
 					break
 
@@ -470,28 +1051,11 @@ def gen_data(data):
 				hist_close[k] = ret(hist[-2]['close'], hist[-5]['close'], hist[0]['close'])
 			return ()
 
-	rows_want = {
-		'id': {r.id for r in cfg.rows if r.id} - {'usd-us-dollar'},
-		'symbol': {r.symbol for r in cfg.rows if r.id is None} - {'USD'}}
-	usr_rate_assets = tuple(u.rate_asset for u in cfg.usr_rows + cfg.usr_columns if u.rate_asset)
-	usr_rate_assets_want = {
-		'id':     {a.id for a in usr_rate_assets if a.id},
-		'symbol': {a.symbol for a in usr_rate_assets if not a.id}}
-	usr_assets = cfg.usr_rows + cfg.usr_columns + tuple(c for c in (cfg.query or ()) if c)
-	usr_wants = {
-		'id': (
-			{a.id for a in usr_assets + usr_rate_assets if a.id} -
-			{a.id for a in usr_assets if a.rate and a.id} - {'usd-us-dollar'})
-		,
-		'symbol': (
-			{a.symbol for a in usr_assets + usr_rate_assets if not a.id} -
-			{a.symbol for a in usr_assets if a.rate} - {'USD'})}
+	wants, usr_wants, usr_rate_assets_want = get_wants()
 
 	found = {'id': set(), 'symbol': set()}
 	rate_assets = {}
 
-	wants = {k: rows_want[k] | usr_wants[k] for k in ('id', 'symbol')}
-
 	btcusd = Decimal('1') # dummy
 	hist_close = {}
 
@@ -543,18 +1107,260 @@ def gen_data(data):
 		'last_updated': None})
 
 def cache_data(data_src, no_overwrite=False):
-	if data_src.json_text:
-		if os.path.exists(data_src.json_fn):
-			if no_overwrite:
-				return False
-			os.rename(data_src.json_fn, data_src.json_fn + '.bak')
-		with open(data_src.json_fn, 'w') as fh:
-			fh.write(data_src.json_text)
+	if data_src.json_text or data_src.cache_writer:
+		if no_overwrite and CompressedCache.path(data_src.json_fn):
+			return False
+		if data_src.cache_writer: # streamed data
+			data_src.cache_fn = data_src.cache_writer.commit()
+			data_src.write_cache_meta()
+			if isinstance(data_src.data, CacheIndex):
+				data_src.data.save(data_src.cache_fn)
+			data_src.cache_writer = None
+		else:
+			data_src.cache_fn = CompressedCache.write(data_src.json_fn, data_src.json_text)
+			data_src.write_cache_meta()
+			if data_src.json_spans:
+				CacheIndex.write(data_src.cache_fn, data_src.data, data_src.json_spans)
+			data_src.json_text = None
 		if not cfg.quiet:
 			msg(f'JSON data cached to {data_src.json_fn_disp}')
 		return True
 
-def main():
+async def fetch_data(srcs):
+	"""
+	fetch data for the given sources concurrently, returning a dict of sources keyed
+	by source ID
+	"""
+	global fetching_concurrently
+	fetching_concurrently = len({v.api_host for v in srcs.values()}) > 1
+
+	tasks = [asyncio.create_task(v.get_data()) for v in srcs.values()]
+	try:
+		return dict(zip(srcs, await asyncio.gather(*tasks)))
+	except:
+		for task in tasks:
+			task.cancel()
+		raise
+
+def get_display_data(src_data):
+
+	global cfg, now
+
+	if cfg.asset_range:
+		n, m = cfg.asset_range
+		cfg = cfg._replace(rows = RowDict({
+			'asset_list':
+				tuple(
+					asset_tuple(e['symbol'], e['id'], source='cc')
+						for e in src_data['cc'].get_asset_range(n, m)),
+			'extra':
+				tuple(
+					[asset_tuple('BTC', 'btc-bitcoin', source='cc')]
+					+ [r for r in cfg.rows if r.source == 'fi'])}))
+
+	now = cfg.as_of or (1659465400 if gcfg.test_suite else time.time()) # 1659524400 1659445900
+
+	data = dict(gen_data(src_data))
+
+	if windows := (
+			(pchg_windows if cfg.local_pchg else {})
+			| ({'percent_change_window': cfg.pchg_window.secs} if cfg.pchg_window else {})):
+		with PriceStore(cfg.cachedir) as store:
+			store.set_pchg(data, now, windows)
+
+	return data
+
+async def refetch_expired(srcs, src_data, next_fetch):
+	"""
+	Refetch those sources whose data has expired, updating ‘src_data’ and ‘next_fetch’
+	in place, and return their IDs.  On failure, sources are retried when the rate
+	limit allows.
+	"""
+	if due := [k for k, t in next_fetch.items() if time.time() >= t]:
+		try:
+			src_data |= await fetch_data({k: srcs[k] for k in due})
+		except:
+			for k in due:
+				next_fetch[k] = time.time() + srcs[k].timeout
+			raise
+		for k in due: # fetch again when the data expires
+			next_fetch[k] = srcs[k].data_time + srcs[k].timeout
+	return due
+
+async def watch(srcs):
+	"""
+	Redisplay data every ‘--watch’ seconds, refetching each source when its cached
+	data expires.  Sources are reused across refreshes, and only changed cells of the
+	display are redrawn.
+	"""
+	global cfg
+	cfg = cfg._replace(quiet=True)
+
+	disp = WatchDisplay()
+	src_data = {}
+	next_fetch = dict.fromkeys(srcs, 0)
+	errmsg = ''
+	alert_lines = []
+
+	try:
+		while True:
+			try:
+				if await refetch_expired(srcs, src_data, next_fetch):
+					errmsg = ''
+			except Exception as e:
+				if not src_data:
+					raise
+				errmsg = red(f'Fetch failed: {e}')
+			data = get_display_data(src_data)
+			if cfg.alerts and (alerts := cfg.alerts.check(data)):
+				cfg.alerts.notify(alerts, now)
+				alert_lines = (
+					alert_lines + [PriceAlerts.fmt_alert(a, now) for a in alerts]
+				)[-PriceAlerts.max_watch_alerts:]
+			disp.draw(
+				list(getattr(Ticker, cfg.clsname)(data).gen_output())
+				+ ([''] + alert_lines if alert_lines else [])
+				+ ['', f'Redisplaying every {gcfg.watch} seconds.  Press Ctrl-C to exit  {errmsg}'])
+			await asyncio.sleep(int(gcfg.watch))
+	finally:
+		disp.close()
+
+class WatchDisplay:
+	"""
+	Full-screen display that redraws only those cells (runs of non-space characters)
+	that have changed since the last draw.  A line is rewritten in full if its cell
+	layout has changed, and the whole screen if the number of lines or terminal width
+	has.
+	"""
+	ERASE_ALL, ERASE_EOL, CUR_HOME = ('\033[J', '\033[K', '\033[H')
+	CUR_HIDE, CUR_SHOW, RESET = ('\033[?25l', '\033[?25h', '\033[0m')
+	esc_pat = re.compile(r'\033\[[0-9;]*m')
+
+	def __init__(self):
+		from mmgen.term import get_term
+		self.term = get_term()
+		self.term.init(noecho=True)
+		self.lines = None
+		self.width = None
+		Msg_r(self.CUR_HIDE)
+
+	def get_cells(self, line):
+		"""
+		return a tuple of (column, color state, cell text) tuples for a line
+		"""
+		def gen():
+			col = pos = 0
+			sgr = ''
+			for m in re.finditer(r'\S+', line):
+				gap = line[pos:m.start()]
+				for e in self.esc_pat.findall(gap):
+					sgr = '' if e == self.RESET else sgr + e
+				col += len(self.esc_pat.sub('', gap))
+				yield (col, sgr, m[0])
+				for e in self.esc_pat.findall(m[0]):
+					sgr = '' if e == self.RESET else sgr + e
+				col += len(self.esc_pat.sub('', m[0]))
+				pos = m.end()
+		return tuple(gen())
+
+	def draw(self, lines):
+		from mmgen.term import get_terminal_size
+		width = get_terminal_size().width
+		if (
+				self.lines is None
+				or len(lines) != len(self.lines)
+				or width != self.width
+				or max(len(self.esc_pat.sub('', line)) for line in lines) >= width):
+			Msg_r(self.CUR_HOME + self.ERASE_ALL + '\n'.join(lines))
+		else:
+			def gen_updates():
+				for row, (old, new) in enumerate(zip(self.lines, lines), 1):
+					if old == new:
+						continue
+					old_cells = self.get_cells(old)
+					new_cells = self.get_cells(new)
+					if [c[0] for c in old_cells] == [c[0] for c in new_cells]:
+						for (col, _, old_text), (_, sgr, text) in zip(old_cells, new_cells):
+							if text != old_text:
+								pad = (
+									len(self.esc_pat.sub('', old_text))
+									- len(self.esc_pat.sub('', text)))
+								yield (
+									f'\033[{row};{col+1}H{self.RESET}{sgr}{text}{self.RESET}'
+									+ ' ' * pad)
+					else:
+						yield f'\033[{row};1H{self.RESET}{new}{self.ERASE_EOL}'
+			Msg_r(''.join(gen_updates()))
+		self.lines = lines
+		self.width = width
+
+	def close(self):
+		Msg_r(f'\033[{len(self.lines or ())};1H\n' + self.CUR_SHOW)
+		self.term.reset()
+
+def refresh_in_background(src_ids):
+	"""
+	Refresh cached data for the given sources by running this script with --download
+	in a detached process, passing it only the options that determine what is fetched.
+	The process holds a lock on the lock file while it runs, so that concurrent
+	invocations don’t spawn more than one refresh at a time.  Its output and exit
+	status are appended to a log file, and a failed refresh is reported on the next run.
+	"""
+	import sys
+	from subprocess import Popen, DEVNULL
+	try:
+		import fcntl
+	except ImportError: # MSWin: no locking, so refresh at most once per lock timeout
+		fcntl = None
+	lock_fn = os.path.join(cfg.cachedir, 'ticker-refresh.lock')
+	log_fn = os.path.join(cfg.cachedir, 'ticker-refresh.log')
+	with open(lock_fn, 'a+') as lock_fh: # holds the IDs of the sources last refreshed
+		if fcntl:
+			try:
+				fcntl.flock(lock_fh, fcntl.LOCK_EX | fcntl.LOCK_NB) # inherited by the child
+			except BlockingIOError:
+				return
+		elif lock_fh.tell() and time.time() - os.fstat(lock_fh.fileno()).st_mtime < refresh_lock_timeout:
+			return
+		try:
+			with open(log_fn) as fh:
+				log_tail = fh.read().splitlines()[-2:]
+		except FileNotFoundError:
+			log_tail = []
+		if log_tail and (m := re.match(r'exit status: (\d+)$', log_tail[-1])) and m[1] != '0':
+			msg(yellow('Warning: background refresh of cached data failed{} (see {})'.format(
+				''.join(': ' + s for s in log_tail[:-1]),
+				log_fn)))
+		lock_fh.truncate(0)
+		lock_fh.write(','.join(src_ids))
+		lock_fh.flush()
+		# run the script as it was invoked, i.e. via the mmgen launcher:
+		cmd = (
+			[sys.executable, os.path.abspath(sys.argv[0]),
+				'--quiet',
+				'--download=' + ','.join(src_ids),
+				'--data-dir=' + gcfg.data_dir_root,
+				'--cachedir=' + cfg.cachedir]
+			+ [a for opt in refresh_opts if (val := getattr(gcfg, opt)) is not None
+				for a in ['--' + opt.replace('_', '-')] + ([] if val is True else [str(val)])]
+			+ gcfg._args)
+		# the log is restarted when it grows large:
+		append = os.path.exists(log_fn) and os.path.getsize(log_fn) < 0x100000
+		with open(log_fn, 'a' if append else 'w') as log_fh:
+			log_fh.write('{} refreshing {}\n'.format(
+				time.strftime('%Y-%m-%d %X', time.gmtime()),
+				','.join(src_ids)))
+			log_fh.flush()
+			Popen(
+				# the shell, which also holds the lock, logs the exit status:
+				['/bin/sh', '-c', '"$@"; echo "exit status: $?"', 'sh'] + cmd if fcntl else cmd,
+				stdin  = DEVNULL,
+				stdout = log_fh,
+				stderr = log_fh,
+				pass_fds = (lock_fh.fileno(),) if fcntl else (),
+				start_new_session = True)
+
+async def main():
 
 	def update_sample_file(usr_cfg_file):
 		usr_data = files('mmgen_node_tools').joinpath('data', os.path.basename(usr_cfg_file)).read_text()
@@ -574,57 +1380,91 @@ def main():
 
 	update_sample_file(cfg_in.cfg_file)
 	update_sample_file(cfg_in.portfolio_file)
+	update_sample_file(cfg_in.alerts_file)
 
-	if gcfg.portfolio and not cfg_in.portfolio:
+	if (gcfg.portfolio or gcfg.portfolio_log) and not cfg_in.portfolio:
 		die(1, 'No portfolio configured!\nTo configure a portfolio, edit the file ~/{}'.format(
 			os.path.relpath(cfg_in.portfolio_file, start=homedir)))
 
-	if gcfg.list_ids:
+	if gcfg.portfolio_log: # display from the portfolio log only, fetching no data
+		(do_pager if cfg.pager else Msg_r)(
+			'\n'.join(PortfolioLog(cfg.cachedir, cfg.portfolio).gen_output(
+				comma    = ',' if cfg.thousands_comma else '',
+				add_prec = cfg.add_prec)) + '\n')
+		return
+
+	if gcfg.download:
+		src_ids = gcfg.download.split(',')
+		for src_id in src_ids:
+			if not src_id in DataSource.get_sources():
+				die(1, f'{src_id!r}: invalid data source')
+	elif gcfg.list_ids or gcfg.search:
 		src_ids = ['cc']
-	elif gcfg.download:
-		if not gcfg.download in DataSource.get_sources():
-			die(1, f'{gcfg.download!r}: invalid data source')
-		src_ids = [gcfg.download]
+	else: # with --local-pchg, historical data comes from the price history instead
+		src_ids = [k for k in DataSource.get_sources(randomize=True)
+			if not (k == 'hi' and cfg.local_pchg)]
+
+	if gcfg.watch or gcfg.serve:
+		try:
+			srcs = {k: src_cls[k]() for k in src_ids}
+			return await (PriceServer(srcs).run(cfg.server) if gcfg.serve else watch(srcs))
+		finally:
+			await http_session.close()
+
+	if cfg.as_of:
+		src_data = {'cc': src_cls['cc']().get_data_from_history()}
 	else:
-		src_ids = DataSource.get_sources(randomize=True)
-
-	src_data = {k: src_cls[k]().get_data() for k in src_ids}
+		try:
+			src_data = await fetch_data({k: src_cls[k]() for k in src_ids})
+		finally:
+			await http_session.close()
 
 	if gcfg.testing:
 		return
 
+	if refresh_ids := [k for k, v in src_data.items() if v.refresh]:
+		refresh_in_background(refresh_ids)
+
 	if gcfg.list_ids:
-		do_pager('\n'.join(e['id'] for e in src_data['cc'].data))
+		do_pager('\n'.join(e['id'] for e in src_data['cc'].get_asset_range(1, None)))
 		return
 
-	global cfg
-
-	if cfg.asset_range:
-		n, m = cfg.asset_range
-		cfg = cfg._replace(rows = RowDict({
-			'asset_list':
-				tuple(
-					asset_tuple(e['symbol'], e['id'], source='cc')
-						for e in src_data['cc'].data[n-1:m]),
-			'extra':
-				tuple(
-					[asset_tuple('BTC', 'btc-bitcoin', source='cc')]
-					+ [r for r in cfg.rows if r.source == 'fi'])}))
-
-	global now
-	now = 1659465400 if gcfg.test_suite else time.time() # 1659524400 1659445900
+	if gcfg.search:
+		src = src_data['cc']
+		if not (hits := src.search(gcfg.search)):
+			die(1, f'{gcfg.search!r}: no matching assets found')
+		shown = hits[:src.max_search_results]
+		wid = max(len(src.data[n]['id']) for n in shown)
+		do_pager('\n'.join(
+			['{:{w}}  {}'.format(src.data[n]['id'], src.data[n]['name'], w=wid) for n in shown]
+			+ ([f'({len(hits) - len(shown)} more matches not shown)'] if len(hits) > len(shown) else [])))
+		return
 
-	data = dict(gen_data(src_data))
+	data = get_display_data(src_data)
 
 	if gcfg.download:
 		return
 
-	(do_pager if cfg.pager else Msg_r)(
-		'\n'.join(getattr(Ticker, cfg.clsname)(data).gen_output()) + '\n')
+	alerts = cfg.alerts.check(data) if cfg.alerts else []
+
+	if cfg.output_fmt: # machine-readable output, with any alerts printed to stderr
+		(do_pager if cfg.pager else Msg_r)(
+			getattr(getattr(Ticker, cfg.clsname)(data), f'format_{cfg.output_fmt}')() + '\n')
+		for a in alerts:
+			msg(PriceAlerts.fmt_alert(a, now))
+	else:
+		(do_pager if cfg.pager else Msg_r)(
+			'\n'.join(
+				list(getattr(Ticker, cfg.clsname)(data).gen_output())
+				+ ([''] + [PriceAlerts.fmt_alert(a, now) for a in alerts] if alerts else [])) + '\n')
+
+	if alerts:
+		cfg.alerts.notify(alerts, now)
 
 def make_cfg(gcfg_arg):
 
 	query_tuple = namedtuple('query', ['asset', 'to_asset'])
+	pchg_window_tuple = namedtuple('pchg_window', ['label', 'secs'])
 	asset_data  = namedtuple('asset_data', ['symbol', 'id', 'amount', 'rate', 'rate_asset', 'source'])
 
 	def parse_asset_id(s, require_label=True):
@@ -730,6 +1570,55 @@ def make_cfg(gcfg_arg):
 		return tuple((k, Decimal(v)) for k, v in cfg_in.portfolio.items()
 			if (not gcfg.btc) or k == 'btc-bitcoin')
 
+	def get_alert_rules():
+
+		def parse_rule(s):
+			match str(s).split():
+				case [asset, col, ('above' | 'below') as op, threshold] if col in alert_cols:
+					try:
+						return PriceAlerts.rule(
+							asset     = parse_asset_id(asset, require_label=False),
+							col       = col,
+							above     = op == 'above',
+							threshold = float(threshold.removesuffix('%')),
+							spec      = s)
+					except ValueError:
+						pass
+			die(1, '{!r}: invalid alert rule in ~/{}\n{}'.format(
+				s,
+				os.path.relpath(cfg_in.alerts_file, start=homedir),
+				'(must be ‘ASSET COLUMN above|below VALUE’, with COLUMN one of {})'.format(
+					fmt_list(alert_cols, fmt='fancy'))))
+
+		# alerts are checked against current data only:
+		if cfg_in.alerts and not gcfg.as_of:
+			return tuple(parse_rule(s) for s in cfg_in.alerts.get('rules') or ())
+		return ()
+
+	def parse_interval(s):
+		if m := re.fullmatch(r'([1-9][0-9]*)([mhdwy])', s):
+			return int(m[1]) * {'m': 60, 'h': 3600, 'd': 86400, 'w': 86400 * 7, 'y': 86400 * 365}[m[2]]
+
+	def parse_pchg_window(arg):
+		if not arg:
+			return None
+		if secs := parse_interval(arg):
+			return pchg_window_tuple(arg, secs)
+		die(1,
+			f'{arg!r}: invalid parameter for --pchg-window '
+			'(must be an integer followed by m, h, d, w or y)')
+
+	def parse_as_of(arg):
+		if not arg:
+			return None
+		if secs := parse_interval(arg):
+			return int((1659465400 if gcfg.test_suite else time.time()) - secs)
+		try:
+			dt = datetime.datetime.fromisoformat(arg)
+		except ValueError:
+			die(1, f'{arg!r}: invalid parameter for --as-of (must be a UTC date/time or interval)')
+		return int((dt if dt.tzinfo else dt.replace(tzinfo=datetime.timezone.utc)).timestamp())
+
 	def parse_add_precision(arg):
 		if not arg:
 			return 0
@@ -748,7 +1637,8 @@ def make_cfg(gcfg_arg):
 		for hdr, data in (
 				('user_uniq', get_usr_assets()),
 				('portfolio_uniq', get_portfolio_assets()),
-				('pchg_unit_uniq', [pchg_unit] if pchg_unit else None)):
+				('pchg_unit_uniq', [pchg_unit] if pchg_unit else None),
+				('alert_uniq', [r.asset for r in alert_rules])):
 			if data:
 				if uniq_data := tuple(gen_uniq(data, 'symbol', preload=rows)):
 					rows[hdr] = uniq_data
@@ -768,6 +1658,24 @@ def make_cfg(gcfg_arg):
 			'' if proxy == '' else 'none' if (proxy and proxy.lower() == 'none')
 			else (proxy or cfg_in.cfg.get(name)))
 
+	def get_http_backend():
+		match get_cfg_var('http_backend') or 'auto':
+			case 'auto':
+				from importlib.util import find_spec # don’t import aiohttp unless it’s used
+				# aiohttp supports HTTP proxies only:
+				return (
+					'aiohttp' if find_spec('aiohttp') and http_session.supports_proxy(proxy) else
+					'curl')
+			case 'aiohttp' if not http_session.supports_proxy(proxy):
+				die(1, '{}: proxy type not supported by the aiohttp backend'.format(
+					'proxy set in environment' if proxy is None else repr(proxy)))
+			case 'aiohttp' | 'curl' as s:
+				return s
+			case s:
+				die(1,
+					f'{s!r}: invalid parameter for --http-backend option '
+					'(must be one of ‘auto’, ‘aiohttp’, ‘curl’)')
+
 	def get_sort_opt():
 		match get_cfg_var('sort'):
 			case None:
@@ -789,15 +1697,22 @@ def make_cfg(gcfg_arg):
 		'asset_range',
 		'adjust',
 		'clsname',
+		'output_fmt',
 		'btc_only',
 		'add_prec',
 		'cachedir',
 		'proxy',
 		'proxy2',
+		'http_backend',
+		'server',
 		'portfolio',
+		'alerts',
 		'sort',
 		'percent_cols',
 		'pchg_unit',
+		'pchg_window',
+		'local_pchg',
+		'as_of',
 		'asset_limit',
 		'cached_data',
 		'elapsed',
@@ -834,15 +1749,54 @@ def make_cfg(gcfg_arg):
 	proxy2 = get_proxy('proxy2')
 
 	portfolio = (
-		get_portfolio() if cfg_in.portfolio and get_cfg_var('portfolio') and not query
+		get_portfolio() if (
+			cfg_in.portfolio
+			and (get_cfg_var('portfolio') or gcfg.portfolio_log)
+			and not query)
 		else None)
 
 	if portfolio and asset_range:
 		die(1, '--portfolio not supported in market cap view')
 
+	if gcfg.watch:
+		if not (is_int(gcfg.watch) and int(gcfg.watch) > 0):
+			die(1, f'{gcfg.watch!r}: invalid value for --watch (must be a positive integer)')
+		for opt in ('download', 'list_ids', 'pager', 'search', 'testing'):
+			if getattr(gcfg, opt):
+				die(1, '--{} may not be combined with --watch'.format(opt.replace('_', '-')))
+
+	if gcfg.serve:
+		for opt in ('cached_data', 'download', 'list_ids', 'pager', 'search', 'testing', 'watch'):
+			if getattr(gcfg, opt):
+				die(1, '--{} may not be combined with --serve'.format(opt.replace('_', '-')))
+
+	if gcfg.portfolio_log:
+		if cmd_args:
+			die(1, '--portfolio-log takes no command-line arguments')
+		for opt in ('as_of', 'download', 'list_ids', 'search', 'serve', 'watch'):
+			if getattr(gcfg, opt):
+				die(1, '--{} may not be combined with --portfolio-log'.format(opt.replace('_', '-')))
+
+	if gcfg.as_of:
+		for opt in ('download', 'list_ids', 'search', 'serve', 'watch'):
+			if getattr(gcfg, opt):
+				die(1, '--{} may not be combined with --as-of'.format(opt.replace('_', '-')))
+
+	if gcfg.json or gcfg.csv: # ignored with --download
+		fmt_opt = 'json' if gcfg.json else 'csv'
+		for opt in ('csv', 'list_ids', 'portfolio_log', 'search', 'serve', 'watch'):
+			if getattr(gcfg, opt) and opt != fmt_opt:
+				die(1, '--{} may not be combined with --{}'.format(opt.replace('_', '-'), fmt_opt))
+
+	cachedir = get_cfg_var('cachedir') or dfl_cachedir
+	cached_data = get_cfg_var('cached_data')
+	server = get_cfg_var('server')
+
 	pchg_unit = (lambda s: parse_asset_id(s, require_label=False) if s else None)(
 		get_cfg_var('pchg_unit'))
 
+	alert_rules = get_alert_rules()
+
 	cfg = cfg_tuple(
 		rows        = create_rows(),
 		usr_rows    = usr_rows,
@@ -851,17 +1805,33 @@ def make_cfg(gcfg_arg):
 		asset_range = asset_range,
 		adjust      = (lambda x: (100 + x) / 100 if x else 1)(Decimal(gcfg.adjust or 0)),
 		clsname     = 'trading' if query else 'overview',
+		output_fmt  = 'json' if gcfg.json else 'csv' if gcfg.csv else None,
 		btc_only    = get_cfg_var('btc'),
 		add_prec    = parse_add_precision(get_cfg_var('add_precision')),
-		cachedir    = get_cfg_var('cachedir') or dfl_cachedir,
+		cachedir    = cachedir,
 		proxy       = proxy,
 		proxy2      = None if proxy2 == 'none' else '' if proxy2 == '' else (proxy2 or proxy),
+		http_backend = get_http_backend(),
+		server      = (
+			PriceServer.parse_addr(server or PriceServer.dfl_addr, cachedir) if gcfg.serve else
+			PriceServer.parse_addr(server, cachedir) if server and not (
+				cached_data or gcfg.download or gcfg.testing) else
+			None),
 		portfolio   = portfolio,
+		alerts      = PriceAlerts(
+			cachedir,
+			alert_rules,
+			command = cfg_in.alerts.get('command'),
+			sound   = cfg_in.alerts.get('sound'),
+			volume  = cfg_in.alerts.get('sound_volume')) if alert_rules else None,
 		sort        = get_sort_opt(),
 		percent_cols    = parse_percent_cols(get_cfg_var('percent_cols')),
 		pchg_unit       = pchg_unit,
+		pchg_window     = parse_pchg_window(get_cfg_var('pchg_window')),
+		local_pchg      = get_cfg_var('local_pchg'),
+		as_of           = parse_as_of(gcfg.as_of),
 		asset_limit     = get_cfg_var('asset_limit'),
-		cached_data     = get_cfg_var('cached_data'),
+		cached_data     = cached_data,
 		elapsed         = get_cfg_var('elapsed'),
 		name_labels     = get_cfg_var('name_labels'),
 		pager           = get_cfg_var('pager'),
@@ -873,13 +1843,19 @@ def make_cfg(gcfg_arg):
 	return (src_cls, cfg_in)
 
 def get_cfg_in():
-	ret = namedtuple('cfg_in_data', ['cfg', 'portfolio', 'cfg_file', 'portfolio_file'])
-	cfg_file, portfolio_file = (
+	ret = namedtuple('cfg_in_data', [
+		'cfg',
+		'portfolio',
+		'alerts',
+		'cfg_file',
+		'portfolio_file',
+		'alerts_file'])
+	cfg_file, portfolio_file, alerts_file = (
 		[os.path.join(gcfg.data_dir_root, 'node_tools', fn)
-			for fn in (cfg_fn, portfolio_fn)])
-	cfg_data, portfolio_data = (
+			for fn in (cfg_fn, portfolio_fn, alerts_fn)])
+	cfg_data, portfolio_data, alerts_data = (
 		[yaml.safe_load(open(fn).read()) if os.path.exists(fn) else None
-			for fn in (cfg_file, portfolio_file)])
+			for fn in (cfg_file, portfolio_file, alerts_file)])
 	return ret(
 		cfg = cfg_data or {
 			'assets': {
@@ -892,8 +1868,10 @@ def get_cfg_in():
 				'index':     [ '^dji', '^ixic', '^gspc' ]},
 			'proxy': 'http://vpn-gw:8118'},
 		portfolio      = portfolio_data,
+		alerts         = alerts_data,
 		cfg_file       = cfg_file,
-		portfolio_file = portfolio_file)
+		portfolio_file = portfolio_file,
+		alerts_file    = alerts_file)
 
 class Ticker:
 
@@ -901,7 +1879,8 @@ class Ticker:
 
 		offer = None
 		to_asset = None
-		hidden_groups = ('extra', 'pchg_unit_uniq')
+		symbol_ids = None
+		hidden_groups = ('extra', 'pchg_unit_uniq', 'alert_uniq')
 
 		def __init__(self, data):
 
@@ -909,10 +1888,6 @@ class Ticker:
 
 			self.comma = ',' if cfg.thousands_comma else ''
 
-			self.col1_wid = max(len('TOTAL'), (
-				max(len(self.create_label(d['id'])) for d in data.values()) if cfg.name_labels else
-				max(len(d['symbol']) for d in data.values())))
-
 			self.rows = RowDict(
 				{k: tuple(row._replace(id=self.get_id(row)) for row in v) for k, v in cfg.rows.items()})
 
@@ -938,11 +1913,9 @@ class Ticker:
 
 			if cfg.pchg_unit:
 				self.pchg_data = self.data[self.get_id(cfg.pchg_unit)]
-				self.pchg_factors = {k: (self.pchg_data[k] / 100) + 1 for k in (
-					'percent_change_24h',
-					'percent_change_7d',
-					'percent_change_30d',
-					'percent_change_1y')}
+				self.pchg_factors = {k: (self.pchg_data[k] / 100) + 1
+					for k in list(pchg_windows) + (['percent_change_window'] if cfg.pchg_window else [])
+						if self.pchg_data.get(k) is not None}
 
 			self.col_usd_prices = {k: self.data[k]['price_usd'] for k in self.col_ids}
 			self.prices = {row.id: self.get_row_prices(row.id) for row in self.rows if row.id in data}
@@ -981,8 +1954,23 @@ class Ticker:
 
 			self.upd_w = max_w
 
+		def init_display(self, cross_assets=()):
+			"""
+			compute the label and price column widths and format the update times (not
+			needed for JSON or CSV output)
+			"""
+			self.col1_wid = max(len('TOTAL'), (
+				max(len(self.create_label(d['id'])) for d in self.data.values()) if cfg.name_labels else
+				max(len(d['symbol']) for d in self.data.values())))
+			self.format_last_updated_col(cross_assets=cross_assets)
+			self.init_prec()
+			self.init_fs()
+
+		def get_usd_price(self, id):
+			return self.prices[id]['usd-us-dollar']
+
 		def init_prec(self):
-			exp = [(a.id, self.prices[a.id]['usd-us-dollar'].adjusted()) for a in self.usr_col_assets]
+			exp = [(a.id, self.get_usd_price(a.id).adjusted()) for a in self.usr_col_assets]
 			self.uprec = {k: max(0, v+4) + cfg.add_prec for k, v in exp}
 			self.uwid  = {k: 12 + max(0, abs(v)-6) + cfg.add_prec for k, v in exp}
 
@@ -990,14 +1978,90 @@ class Ticker:
 			if asset.id:
 				return asset.id
 			else:
-				m = asset.symbol
-				for d in self.data.values():
-					if m == d['symbol']:
-						return d['id']
+				if self.symbol_ids is None:
+					self.symbol_ids = {}
+					for d in self.data.values():
+						self.symbol_ids.setdefault(d['symbol'], d['id'])
+				return self.symbol_ids.get(asset.symbol)
 
 		def create_label(self, id):
 			return self.data[id]['name'].upper()
 
+		@property
+		def row_groups(self):
+			"""
+			the groups of rows displayed, each headed by a horizontal line in the table
+			"""
+			return (
+				[self.rows['asset_list']] if cfg.asset_range else
+				[rows for group, rows in self.rows.items() if rows and group not in self.hidden_groups])
+
+		def get_pchg(self, d, key):
+			"""
+			return the percentage change ‘key’ of asset data ‘d’ relative to the percent
+			change unit, or None if unavailable
+			"""
+			if (n := d.get(key)) is None or (cfg.pchg_unit and key not in self.pchg_factors):
+				return None
+			return ((((n / 100) + 1) / self.pchg_factors[key]) - 1) * 100 if cfg.pchg_unit else n
+
+		def export_prices(self, prices):
+			# a Decimal’s str() is exact, and its fastest conversion:
+			return dict(zip(self.col_labels, map(str, prices)))
+
+		def export_asset(self, d):
+			return {
+				'id':     d['id'],
+				'symbol': d['symbol'],
+				'name':   d['name']}
+
+		def export_rows(self):
+			for rows in self.row_groups:
+				for row in rows:
+					if row.id in self.data:
+						yield self.export_row(self.data[row.id])
+
+		def export_data(self):
+			"""
+			return the displayed data, unrounded and uncoloured, for JSON or CSV output.
+			Rows hold their prices keyed by column label.
+			"""
+			return (
+				{'time': int(now)}
+				| self.export_hdr()
+				| {
+					'adjust':  str((self.adjust - 1) * 100) if self.show_adj else None,
+					'columns': self.col_labels,
+					'prices':  list(self.export_rows())})
+
+		def format_json(self):
+			return json.dumps(self.export_data()) # compact, so that the C encoder is used
+
+		def format_csv(self):
+			"""
+			output the exported data as a single table, with a ‘type’ column marking price,
+			portfolio holding and portfolio total rows
+			"""
+			import csv, io
+			data = self.export_data()
+			pf = data.get('portfolio') or {}
+			groups = (
+				('price',   data['prices']),
+				('holding', pf.get('holdings', [])),
+				('total',   [pf['total']] if pf.get('total') else []))
+			# all rows of a group have the same fields:
+			fields = list(dict.fromkeys(k for _, recs in groups for rec in recs[:1] for k in rec))
+			out = io.StringIO()
+			writer = csv.writer(out, lineterminator='\n')
+			writer.writerow(['type'] + fields)
+			for rtype, recs in groups:
+				if recs and list(recs[0]) == fields[:len(recs[0])]: # the first group, at least
+					pad = [''] * (len(fields) - len(recs[0]))
+					writer.writerows([rtype, *rec.values(), *pad] for rec in recs)
+				else:
+					writer.writerows([rtype] + [rec.get(k, '') for k in fields] for rec in recs)
+			return out.getvalue().rstrip('\n')
+
 		def gen_output(self):
 
 			def process_rows(rows):
@@ -1008,7 +2072,9 @@ class Ticker:
 					except KeyError:
 						yield gray(f'(no data for {row.id})')
 
-			yield 'Current time: {}'.format(cyan(time.strftime('%F %X', time.gmtime(now)) + ' UTC'))
+			yield '{}: {}'.format(
+				'Price history as of' if cfg.as_of else 'Current time',
+				cyan(time.strftime('%F %X', time.gmtime(now)) + ' UTC'))
 
 			if cfg.sort:
 				text = sort_params[cfg.sort[0]].desc + ('' if cfg.sort[1] else ' [reversed]')
@@ -1046,12 +2112,8 @@ class Ticker:
 			if self.table_hdr:
 				yield self.table_hdr
 
-			if cfg.asset_range:
-				yield from process_rows(self.rows['asset_list'])
-			else:
-				for group, rows in self.rows.items():
-					if rows and group not in self.hidden_groups:
-						yield from process_rows(rows)
+			for rows in self.row_groups:
+				yield from process_rows(rows)
 
 			yield '-' * self.hl_wid
 
@@ -1070,8 +2132,8 @@ class Ticker:
 				yield '-' * self.hl_wid
 				if not cfg.btc_only:
 					yield self.fs_num.format(
-						lbl = 'TOTAL', pc3='', pc4='', pc1='', pc2='', upd='', amt='',
-						**{k.replace('-', '_'): v for k, v in self.prices['total'].items()})
+						lbl = 'TOTAL', pc3='', pc4='', pc1='', pc2='', pc5='', upd='', amt='',
+						prices = self.fs_prices.format(*self.prices['total']))
 
 	class overview(base):
 
@@ -1079,38 +2141,64 @@ class Ticker:
 			self.data = data
 			self.adjust = cfg.adjust
 			self.show_adj = self.adjust != 1
+			self.pc5_wid = max(7, len(f'CHG_{cfg.pchg_window.label}')) if cfg.pchg_window else 7
 			self.usr_col_assets = [asset._replace(id=self.get_id(asset)) for asset in cfg.usr_columns]
-			self.col_ids = ('usd-us-dollar', 'btc-bitcoin') + tuple(a.id for a in self.usr_col_assets)
-
+			# price columns in display order:
+			self.col_ids = (
+				('usd-us-dollar',)
+				+ tuple(a.id for a in self.usr_col_assets)
+				+ (() if cfg.btc_only else ('btc-bitcoin',)))
+			# price column labels for JSON and CSV output:
+			self.col_labels = (
+				['USD']
+				+ [a.symbol for a in self.usr_col_assets]
+				+ ([] if cfg.btc_only else ['BTC']))
+
+			# self.prices is the price matrix: one tuple of column prices per row, computed once
+			# and shared by the prices and portfolio sections
 			super().__init__(data)
 
-			self.format_last_updated_col()
-
 			if cfg.portfolio:
 				pf_dict = dict(cfg.portfolio)
-				self.prices['total'] = {col_id: sum(self.prices[row.id][col_id] * pf_dict[row.id]
+				pf_rows = [(self.prices[row.id], pf_dict[row.id])
 					for row in self.rows
-						if row.id in pf_dict and row.id in data)
-							for col_id in self.col_ids}
-
-			self.init_prec()
-			self.init_fs()
+						if row.id in pf_dict and row.id in data]
+				self.prices['total'] = tuple(
+					sum(p[n] * amt for p, amt in pf_rows)
+						for n in range(len(self.col_ids)))
+				if not cfg.as_of:
+					pf_log = PortfolioLog(cfg.cachedir, cfg.portfolio)
+					# log the valuation at the time of its prices, so that cached or unchanged
+					# data isn’t logged again:
+					if t := pf_log.get_time(data):
+						try:
+							pf_log.append(t, data)
+						except OSError as e:
+							msg(yellow(f'Warning: unable to update portfolio log: {e}'))
+
+			if not cfg.output_fmt:
+				self.init_display()
 
 		def get_row_prices(self, id):
 			if id in self.data:
 				d = self.data[id]
-				return {k: (
-						d['price_btc'] if k == 'btc-bitcoin' else
-						d['price_usd'] / self.col_usd_prices[k]
-					) * self.adjust for k in self.col_ids}
+				# dividing by the unit USD price, like multiplying by a unit adjustment, merely
+				# rounds a Decimal to context precision, so is done with unary plus instead:
+				prices = tuple(
+					d['price_btc'] if k == 'btc-bitcoin' else
+					+d['price_usd'] if k == 'usd-us-dollar' else
+					d['price_usd'] / self.col_usd_prices[k]
+						for k in self.col_ids)
+				return prices if self.adjust == 1 else tuple(p * self.adjust for p in prices)
+
+		def get_usd_price(self, id):
+			return self.prices[id][0]
 
 		def fmt_row(self, d, amt=None, amt_fmt=None):
 
 			def fmt_pct(d, key, wid=7):
-				if (n := d.get(key)) is None:
-					return gray('     --')
-				if cfg.pchg_unit:
-					n = ((((n / 100) + 1) / self.pchg_factors[key]) - 1) * 100
+				if (n := self.get_pchg(d, key)) is None:
+					return gray('--'.rjust(wid) if wid > 8 else '     --')
 				return (red, green)[n>=0](f'{n:+{wid}.2f}')
 
 			p = self.prices[d['id']]
@@ -1128,18 +2216,61 @@ class Ticker:
 				pc2 = fmt_pct(d, 'percent_change_24h'),
 				pc3 = fmt_pct(d, 'percent_change_1y', wid=8),
 				pc4 = fmt_pct(d, 'percent_change_30d'),
+				pc5 = fmt_pct(d, 'percent_change_window', wid=self.pc5_wid),
 				upd = d.get('last_updated_fmt'),
 				amt = amt_fmt,
-				**{k.replace('-', '_'): v * (1 if amt is None else amt) for k, v in p.items()})
+				prices = self.fs_prices.format(*(p if amt is None else (v * amt for v in p))))
+
+		def export_hdr(self):
+			return {
+				'pchg_unit':   self.pchg_data['symbol'] if cfg.pchg_unit else None,
+				'pchg_window': cfg.pchg_window.label if cfg.pchg_window else None}
+
+		def export_row(self, d, amt=None):
+			p = self.prices[d['id']]
+			ret = self.export_asset(d)
+			if cfg.asset_range:
+				ret['rank'] = int(d['rank'])
+				ret['market_cap'] = d.get('market_cap')
+			if amt is None:
+				ret.update(self.export_prices(p))
+			else: # the holding’s value in each column
+				ret['amount'] = str(amt)
+				ret.update(self.export_prices(v * amt for v in p))
+			for k in self.pchg_keys:
+				ret[k] = self.get_pchg(d, k)
+			ret['last_updated'] = d['last_updated']
+			return ret
+
+		def export_data(self):
+			self.pchg_keys = list(pchg_windows) + (['percent_change_window'] if cfg.pchg_window else [])
+			return super().export_data() | ({
+				'portfolio': {
+					'holdings': [self.export_row(self.data[sym], amt=amt)
+						for sym, amt in cfg.portfolio if sym in self.data],
+					'total': None if cfg.btc_only else self.export_prices(self.prices['total'])}
+				} if cfg.portfolio else {})
 
 		def init_fs(self):
 
+			def col_width(n, prec):
+				# get the integer digit count from the exponent of n rounded to prec places:
+				int_digits = max(1, (abs(n) + Decimal(5).scaleb(-prec-1)).adjusted() + 1)
+				return (
+					(n < 0)
+					+ int_digits
+					+ ((int_digits - 1) // 3 if self.comma else 0)
+					+ (prec + 1 if prec else 0))
+
 			col_prec = {'usd-us-dollar': 2+cfg.add_prec, 'btc-bitcoin': 8+cfg.add_prec} | self.uprec
-			max_row = max(
-				((k, v['btc-bitcoin']) for k, v in self.prices.items()),
-				key = lambda a: a[1])
-			widths = {k: len('{:{}.{}f}'.format(self.prices[max_row[0]][k], self.comma, col_prec[k]))
-						for k in self.col_ids}
+			precs = [col_prec[k] for k in self.col_ids]
+			# all columns are proportional, so the widest value in each is in the same row:
+			max_row = max(self.prices.values(), key=lambda p: p[0])
+			widths = [col_width(n, prec) for n, prec in zip(max_row, precs)]
+
+			self.fs_prices = ''.join(f'  {{:{w}{self.comma}.{prec}f}}' for w, prec in zip(widths, precs))
+			self.fs_prices_hdr = ''.join(f'  {{:>{w}}}' for w in widths)
+			prices_wid = sum(widths) + 2 * len(widths)
 
 			fd = namedtuple('format_str_data', ['fs_str', 'fs_num', 'wid'])
 
@@ -1149,24 +2280,22 @@ class Ticker:
 				'pct1m':       fd(' {pc4:7}', ' {pc4:7}', 8),
 				'pct1w':       fd(' {pc1:7}', ' {pc1:7}', 8),
 				'pct1d':       fd(' {pc2:7}', ' {pc2:7}', 8),
+				'pctx':        fd(f' {{pc5:{self.pc5_wid}}}', f' {{pc5:{self.pc5_wid}}}',
+					self.pc5_wid + 1),
 				'update_time': fd('  {upd}',  '  {upd}',
 					max((19 if cfg.portfolio else 0), self.upd_w) + 2),
-				'amt':         fd('  {amt}',  '  {amt}',  21)
-			} | {k: fd(
-				'  {{{}:>{}}}'.format(k.replace('-', '_'), widths[k]),
-				'  {{{}:{}{}.{}f}}'.format(k.replace('-', '_'), widths[k], self.comma, col_prec[k]),
-				widths[k] + 2
-			) for k in self.col_ids}
+				'amt':         fd('  {amt}',  '  {amt}',  21),
+				'prices':      fd('{prices}', '{prices}', prices_wid),
+			}
 
 			cols = (
-				['label', 'usd-us-dollar']
-				+ [asset.id for asset in self.usr_col_assets]
+				['label', 'prices']
 				+ [a for a, b in (
-					('btc-bitcoin',  not cfg.btc_only),
 					('pct1y',       'y' in cfg.percent_cols),
 					('pct1m',       'm' in cfg.percent_cols),
 					('pct1w',       'w' in cfg.percent_cols),
 					('pct1d',       'd' in cfg.percent_cols),
+					('pctx',        cfg.pchg_window),
 					('update_time', cfg.update_time))
 						if b])
 
@@ -1199,11 +2328,13 @@ class Ticker:
 				pc2 = 'CHG_24h',
 				pc3 = '  CHG_1y',
 				pc4 = 'CHG_30d',
+				pc5 = f'CHG_{cfg.pchg_window.label}'.rjust(self.pc5_wid) if cfg.pchg_window else '',
 				upd = 'UPDATED',
 				amt = '         AMOUNT',
-				usd_us_dollar = 'USD',
-				btc_bitcoin = '  BTC',
-				**{a.id.replace('-', '_'): a.symbol for a in self.usr_col_assets})
+				prices = self.fs_prices_hdr.format(
+					'USD',
+					*(a.symbol for a in self.usr_col_assets),
+					*(() if cfg.btc_only else ('  BTC',))))
 
 	class trading(base):
 
@@ -1232,6 +2363,8 @@ class Ticker:
 				self.hl_ids = [self.asset.id]
 
 			self.show_adj = self.adjust != 1 or self.offer
+			self.col_labels = ['spot'] + (
+				['offered' if self.offer else 'adjusted'] if self.show_adj else [])
 
 			super().__init__(data)
 
@@ -1239,16 +2372,33 @@ class Ticker:
 			for a in self.usr_col_assets:
 				self.prices[a.id]['usd-us-dollar'] = data[a.id]['price_usd']
 
-			self.format_last_updated_col(cross_assets=self.usr_col_assets)
-
-			self.init_prec()
-			self.init_fs()
+			if not cfg.output_fmt:
+				self.init_display(cross_assets=self.usr_col_assets)
 
 		def get_row_prices(self, id):
 			if id in self.data:
 				d = self.data[id]
 				return {k: self.col_usd_prices[self.asset.id] / d['price_usd'] for k in self.col_ids}
 
+		def export_hdr(self):
+			return {
+				'asset': {
+					'id':     self.asset.id,
+					'symbol': self.asset.symbol,
+					'amount': str(self.asset.amount)},
+				'to_asset': {
+					'id':     self.to_asset.id,
+					'symbol': self.to_asset.symbol,
+					'amount': str(self.offer) if self.offer else None
+				} if self.to_asset else None}
+
+		def export_row(self, d):
+			p = self.prices[d['id']][self.asset.id] * self.asset.amount
+			ret = self.export_asset(d)
+			ret.update(self.export_prices([p, p * self.adjust]))
+			ret['last_updated'] = d['last_updated']
+			return ret
+
 		def init_fs(self):
 			self.max_wid = max(
 				len('{:{}{}.{}f}'.format(
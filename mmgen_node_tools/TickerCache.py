@@ -0,0 +1,615 @@
+#!/usr/bin/env python3
+#
+# mmgen = Multi-Mode GENerator, a command-line cryptocurrency wallet
+# Copyright (C)2013-2022 The MMGen Project <mmgen@tuta.io>
+# Licensed under the GNU General Public License, Version 3:
+#   https://www.gnu.org/licenses
+# Public project repositories:
+#   https://github.com/mmgen/mmgen-wallet https://github.com/mmgen/mmgen-node-tools
+#   https://gitlab.com/mmgen/mmgen-wallet https://gitlab.com/mmgen/mmgen-node-tools
+
+"""
+mmgen_node_tools.TickerCache: Compressed storage and indexing of cached ticker source data
+"""
+
+import os, json, struct, mmap, hashlib, bisect, codecs
+from collections import namedtuple, Counter
+
+class CacheIndex:
+	"""
+	Sidecar offset index for a cached JSON asset list.  The cache file and index are
+	memory-mapped, and records are located by position, ID or symbol and decoded only
+	when accessed, so that startup cost doesn’t scale with the size of the list.  A
+	compressed cache file can’t be memory-mapped, so it’s decompressed in full on first
+	access to a record, and only the decoding of records is deferred.
+	"""
+	magic = b'MMNTIDX1'
+	hdr  = struct.Struct('<8sQQII') # magic, cache file size, cache file mtime (ns), nrecs, nkeys
+	span = struct.Struct('<QI')     # record offset, record length
+	key  = struct.Struct('<QI')     # key hash, record position
+	key_fields = ('id', 'symbol')
+
+	def __init__(self, src, idx, nrecs, nkeys, records=None):
+		self._src = src
+		self.idx = idx
+		self.nrecs = nrecs
+		self.nkeys = nkeys
+		self.keys_offset = self.hdr.size + nrecs * self.span.size
+		self.records = records or {}
+
+	@property
+	def src(self):
+		if callable(self._src): # the text is loaded on first access to a record not yet decoded
+			self._src = self._src()
+		return self._src
+
+	def __len__(self):
+		return self.nrecs
+
+	def __iter__(self):
+		# records not yet accessed are decoded without being memoized, so that iterating
+		# over a large list doesn’t retain it in memory:
+		return (self.records[n] if n in self.records else self.decode(n) for n in range(self.nrecs))
+
+	def decode(self, n):
+		off, length = self.span.unpack_from(self.idx, self.hdr.size + n * self.span.size)
+		return json.loads(self.src[off:off+length])
+
+	def __getitem__(self, n):
+		if isinstance(n, slice):
+			return [self[i] for i in range(*n.indices(self.nrecs))]
+		if n < 0:
+			n += self.nrecs
+		if not 0 <= n < self.nrecs:
+			raise IndexError('record index out of range')
+		if n not in self.records: # memoize, as records are updated in place by gen_data()
+			self.records[n] = self.decode(n)
+		return self.records[n]
+
+	def find(self, field, value):
+		"""
+		return positions of all records whose ‘field’ equals ‘value’, in source order
+		"""
+		def key_at(n):
+			return self.key.unpack_from(self.idx, self.keys_offset + n * self.key.size)
+		h = self.key_hash(field, value)
+		n = bisect.bisect_left(range(self.nkeys), h, key=lambda n: key_at(n)[0])
+		ret = []
+		while n < self.nkeys and (k := key_at(n))[0] == h:
+			if self[k[1]][field] == value:
+				ret.append(k[1])
+			n += 1
+		return ret
+
+	@staticmethod
+	def idx_fn(json_fn):
+		return json_fn + '.idx'
+
+	@staticmethod
+	def key_hash(field, value):
+		return int.from_bytes(
+			hashlib.blake2b(f'{field}:{value}'.encode(), digest_size=8).digest(), 'little')
+
+	@staticmethod
+	def parse(text):
+		"""
+		parse JSON text, returning the data and, if it’s a list, the byte span of each
+		element in the UTF-8-encoded text (otherwise None)
+		"""
+		ws = json.decoder.WHITESPACE.match
+		i = ws(text, 0).end()
+		if text[i:i+1] != '[':
+			return (json.loads(text), None)
+		dec = json.JSONDecoder()
+		is_ascii = text.isascii()
+		data, spans = [], []
+		pos = boff = 0
+		i = ws(text, i+1).end()
+		if text[i:i+1] != ']':
+			while True:
+				obj, end = dec.raw_decode(text, i)
+				data.append(obj)
+				if is_ascii:
+					spans.append((i, end - i))
+				else:
+					boff += len(text[pos:i].encode())
+					spans.append((boff, blen := len(text[i:end].encode())))
+					boff += blen
+					pos = end
+				i = ws(text, end).end()
+				if text[i:i+1] == ']':
+					break
+				if text[i:i+1] != ',':
+					raise json.JSONDecodeError("Expecting ',' delimiter", text, i)
+				i = ws(text, i+1).end()
+		if (end := ws(text, i+1).end()) != len(text):
+			raise json.JSONDecodeError('Extra data', text, end)
+		return (data, spans)
+
+	@classmethod
+	def write(cls, json_fn, data, spans):
+		keys = sorted((cls.key_hash(f, d[f]), n) for n, d in enumerate(data) for f in cls.key_fields)
+		cls.write_packed(
+			json_fn,
+			len(spans),
+			len(keys),
+			b''.join(cls.span.pack(*e) for e in spans) + b''.join(cls.key.pack(*e) for e in keys))
+
+	@classmethod
+	def write_packed(cls, json_fn, nrecs, nkeys, body):
+		st = os.stat(json_fn)
+		tmp_fn = cls.idx_fn(json_fn) + '.tmp'
+		with open(tmp_fn, 'wb') as fh:
+			fh.write(cls.hdr.pack(cls.magic, st.st_size, st.st_mtime_ns, nrecs, nkeys))
+			fh.write(body)
+		os.replace(tmp_fn, cls.idx_fn(json_fn))
+
+	def save(self, json_fn):
+		"""
+		write the index to the sidecar file of ‘json_fn’
+		"""
+		self.write_packed(json_fn, self.nrecs, self.nkeys, self.idx[self.hdr.size:])
+
+	@classmethod
+	def from_stream(cls, stream, load):
+		"""
+		return an instance for a JSON list parsed by a JSONStream, with the records kept
+		by the stream preloaded and the others decoded from the text returned by ‘load’
+		"""
+		nrecs, nkeys = len(stream.spans) // cls.span.size, len(stream.keys) // cls.key.size
+		return cls(
+			load,
+			cls.hdr.pack(cls.magic, 0, 0, nrecs, nkeys) + stream.spans + stream.keys,
+			nrecs,
+			nkeys,
+			stream.records)
+
+	@classmethod
+	def open(cls, json_fn, load=None):
+		"""
+		return an instance for ‘json_fn’, or None if the index is missing or stale.  The
+		JSON text is memory-mapped, or returned by ‘load’ if the file is compressed.
+		"""
+		def do_mmap(fn):
+			with open(fn, 'rb') as fh:
+				return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+		try:
+			st = os.stat(json_fn)
+			idx = do_mmap(cls.idx_fn(json_fn))
+			magic, size, mtime, nrecs, nkeys = cls.hdr.unpack_from(idx)
+			if (
+					magic != cls.magic
+					or (size, mtime) != (st.st_size, st.st_mtime_ns)
+					or len(idx) != cls.hdr.size + nrecs * cls.span.size + nkeys * cls.key.size):
+				return None
+			return cls((load or do_mmap)(json_fn), idx, nrecs, nkeys)
+		except (OSError, ValueError, struct.error):
+			return None
+
+class JSONStream:
+	"""
+	Incremental parser for JSON text received in chunks, the raw bytes of which are
+	written to file object ‘out’ as they arrive.  If the text is a list, its elements
+	are decoded one at a time, and their byte spans and CacheIndex keys are recorded.
+	Only the elements chosen by ‘select’ are kept, the others being discarded once
+	‘extract’ has been applied to them, so that memory use doesn’t scale with the size
+	of the list.  The extracted values are passed to ‘flush’ in batches, if given.  If
+	‘extract’ or ‘flush’ fails, ‘extracted’ is set to None.  Text that isn’t a list is
+	decoded whole by close().
+	"""
+	head_len = 1024 # length of the text retained for error messages
+	flush_len = 5000 # number of extracted values passed to ‘flush’ at a time
+	ws = json.decoder.WHITESPACE.match
+
+	def __init__(self, out, select=None, extract=None, flush=None):
+		self.out = out
+		self.select = select
+		self.extract = extract
+		self.flush = flush
+		self.decoder = codecs.getincrementaldecoder('utf-8')()
+		self.dec = json.JSONDecoder()
+		self.head = ''
+		self.buf = ''
+		self.pos = 0     # position of the unparsed text in ‘buf’
+		self.boff = 0    # byte offset of the unparsed text
+		self.state = 'start'
+		self.is_list = True
+		self.chunks = None # text that isn’t a list
+		self.value = None
+		self.spans = bytearray()
+		self.keys = []
+		self.records = {}
+		self.extracted = []
+
+	def feed(self, chunk):
+		self.out.write(chunk)
+		self.add_text(self.decoder.decode(chunk))
+
+	def close(self):
+		"""
+		finish parsing, raising ValueError if the text is incomplete or invalid
+		"""
+		self.out.close()
+		self.add_text(self.decoder.decode(b'', final=True), final=True)
+		if self.is_list:
+			if self.state != 'end':
+				raise json.JSONDecodeError('Unexpected end of data', self.buf, len(self.buf))
+			self.flush_extracted()
+			self.keys.sort()
+			keys = bytearray(len(self.keys) * CacheIndex.key.size)
+			for n, k in enumerate(self.keys):
+				CacheIndex.key.pack_into(keys, n * CacheIndex.key.size, k >> 32, k & 0xffffffff)
+			self.keys = keys
+		else:
+			self.value = json.loads(''.join(self.chunks))
+		self.buf = self.chunks = None
+
+	def add_text(self, text, final=False):
+		if len(self.head) < self.head_len:
+			self.head += text[:self.head_len - len(self.head)]
+		if self.is_list:
+			self.buf = self.buf[self.pos:] + text
+			self.pos = 0
+			self.parse(final)
+		else:
+			self.chunks.append(text)
+
+	def parse(self, final):
+		buf = self.buf
+		pos, boff = self.pos, self.boff
+
+		def advance(i): # byte offsets are computed incrementally, so parsing is linear
+			nonlocal pos, boff
+			boff += len(buf[pos:i].encode())
+			pos = i
+
+		i = self.ws(buf, pos).end()
+		while i < len(buf):
+			match self.state:
+				case 'start':
+					if buf[i] != '[':
+						self.is_list = False
+						self.chunks = [buf[i:]]
+						return
+					self.state = 'first'
+					i += 1
+				case 'first' if buf[i] == ']':
+					self.state = 'end'
+					i += 1
+				case 'first' | 'elem':
+					try:
+						obj, end = self.dec.raw_decode(buf, i)
+					except json.JSONDecodeError:
+						if final:
+							raise
+						break # element is incomplete
+					if end == len(buf) and not final: # a number may be incomplete
+						break
+					advance(i)
+					start = boff
+					advance(end)
+					self.add_element(obj, start, boff - start)
+					self.state = 'sep'
+					i = end
+				case 'sep':
+					if buf[i] not in ',]':
+						raise json.JSONDecodeError("Expecting ',' delimiter", buf, i)
+					self.state = 'elem' if buf[i] == ',' else 'end'
+					i += 1
+				case 'end':
+					raise json.JSONDecodeError('Extra data', buf, i)
+			i = self.ws(buf, i).end()
+		advance(i)
+		self.pos, self.boff = pos, boff
+
+	def flush_extracted(self):
+		if self.flush and self.extracted:
+			if self.flush(self.extracted):
+				self.extracted = []
+			else:
+				self.extract = self.extracted = None
+
+	def add_element(self, obj, off, length):
+		n = len(self.spans) // CacheIndex.span.size
+		self.spans += CacheIndex.span.pack(off, length)
+		try:
+			self.keys.extend(CacheIndex.key_hash(f, obj[f]) << 32 | n for f in CacheIndex.key_fields)
+		except (KeyError, TypeError) as e:
+			raise ValueError(f'list element {n}: missing or invalid field {e}') from e
+		if self.extract:
+			try:
+				self.extracted.append(self.extract(obj))
+			except Exception: # leave the error to be handled by the consumer of the data
+				self.extract = self.extracted = None
+			else:
+				if len(self.extracted) == self.flush_len:
+					self.flush_extracted()
+		if self.select is None or self.select(n, obj):
+			self.records[n] = obj
+
+class CompressedCache:
+	"""
+	Compressed storage of cached source data, using zstd if available, otherwise gzip.
+	Of a cache file’s compressed and uncompressed versions, the newest is read, so a
+	JSON file supplied by the user for --cached-data replaces older cached data.
+	Compressed files are read whole, so the CacheIndex loads them lazily but not
+	incrementally.
+	"""
+	codec = namedtuple('cache_codec', ['writer', 'decompress'])
+	codecs = None
+
+	@classmethod
+	def get_codecs(cls):
+		"""
+		return the available codecs keyed by file extension, preferred codec first.  A
+		codec’s writer wraps a binary file object, compressing data written to it.
+		"""
+		if cls.codecs is None:
+			cls.codecs = {}
+			try:
+				from compression import zstd # Python 3.14
+				cls.codecs['.zst'] = cls.codec(
+					lambda fh: zstd.ZstdFile(fh, 'w'),
+					zstd.decompress)
+			except ImportError:
+				try:
+					import zstandard
+					cls.codecs['.zst'] = cls.codec(
+						lambda fh: zstandard.ZstdCompressor().stream_writer(fh, closefd=False),
+						zstandard.ZstdDecompressor().decompress)
+				except ImportError:
+					pass
+			import gzip
+			cls.codecs['.gz'] = cls.codec(
+				lambda fh: gzip.GzipFile(filename='', mode='wb', compresslevel=6, fileobj=fh, mtime=0),
+				gzip.decompress)
+		return cls.codecs
+
+	@classmethod
+	def versions(cls, json_fn):
+		"""
+		return the existing readable versions of ‘json_fn’, newest first
+		"""
+		def gen():
+			for fn in [json_fn + ext for ext in cls.get_codecs()] + [json_fn]:
+				try:
+					yield (os.stat(fn).st_mtime_ns, fn)
+				except FileNotFoundError:
+					pass
+		return [fn for t, fn in sorted(gen(), reverse=True)]
+
+	@classmethod
+	def path(cls, json_fn):
+		"""
+		return the newest version of ‘json_fn’, or None if there is none
+		"""
+		return (cls.versions(json_fn) or [None])[0]
+
+	@classmethod
+	def read(cls, fn):
+		with open(fn, 'rb') as fh:
+			data = fh.read()
+		ext = os.path.splitext(fn)[1]
+		return cls.get_codecs()[ext].decompress(data) if ext in cls.get_codecs() else data
+
+	@classmethod
+	def write(cls, json_fn, text):
+		"""
+		write ‘text’ to a compressed version of ‘json_fn’ and return its path
+		"""
+		w = cls.writer(json_fn)
+		w.write(text.encode())
+		return w.commit()
+
+	class writer:
+		"""
+		File object compressing the data written to it to a temporary file, installed as
+		the newest version of ‘json_fn’ by commit().  The existing versions, including any
+		uncompressed file supplied by the user, are then kept as backups, with ‘.bak’
+		appended to their names.  An uncommitted temporary file is removed at exit.
+		"""
+		def __init__(self, json_fn):
+			self.ext, self.codec = next(iter(CompressedCache.get_codecs().items()))
+			self.json_fn = json_fn
+			self.path = json_fn + '.tmp' + self.ext # the path of the data written, readable by read()
+			self.fh = None
+
+		def write(self, data):
+			if self.fh is None:
+				import atexit
+				atexit.register(self.discard)
+				self.fh = open(self.path, 'wb')
+				self.zfh = self.codec.writer(self.fh)
+			self.zfh.write(data)
+
+		def close(self):
+			if self.fh and not self.fh.closed:
+				self.zfh.close()
+				self.fh.close()
+
+		def commit(self):
+			self.close()
+			for fn in CompressedCache.versions(self.json_fn):
+				os.replace(fn, fn + '.bak')
+				for idx_fn in (CacheIndex.idx_fn(fn), SearchIndex.idx_fn(fn)):
+					try:
+						os.unlink(idx_fn)
+					except FileNotFoundError:
+						pass
+			os.replace(self.path, self.json_fn + self.ext)
+			import atexit
+			atexit.unregister(self.discard)
+			self.path = self.json_fn + self.ext
+			return self.path
+
+		def discard(self):
+			self.close()
+			if self.path != self.json_fn + self.ext:
+				try:
+					os.unlink(self.path)
+				except FileNotFoundError:
+					pass
+
+class SearchIndex:
+	"""
+	Search index for an asset list, matching assets’ IDs, symbols and names by prefix
+	and, via a trigram index of symbols and names, by similarity.  The index of a cached
+	asset list is stored in a memory-mapped sidecar file, which like the CacheIndex is
+	tied to the cache file’s size and mtime, and is thus rebuilt only when it changes.
+	"""
+	magic = b'MMNTSRC1'
+	# magic, cache file size, mtime (ns), nterms, ntrigrams, npostings, nbytes:
+	hdr  = struct.Struct('<8sQQIIII')
+	# string offset, string length, record position, field, trigram count:
+	term = struct.Struct('<IHIBB')
+	# trigram, postings offset, postings count:
+	tri  = struct.Struct('<12sII')
+	fields = ('id', 'symbol', 'name')
+	fuzzy_fields = ('symbol', 'name')
+	threshold = 0.3 # minimum similarity of fuzzy matches, as with PostgreSQL’s pg_trgm
+
+	def __init__(self, buf):
+		self.buf = buf
+		_, _, _, self.nterms, self.ntris, self.npostings, _ = self.hdr.unpack_from(buf)
+		self.tris_offset = self.hdr.size + self.nterms * self.term.size
+		self.postings_offset = self.tris_offset + self.ntris * self.tri.size
+		self.strings_offset = self.postings_offset + self.npostings * 4
+
+	def term_at(self, n):
+		return self.term.unpack_from(self.buf, self.hdr.size + n * self.term.size)
+
+	def term_str(self, n):
+		off, length, *_ = self.term_at(n)
+		return self.buf[self.strings_offset + off:self.strings_offset + off + length]
+
+	def tri_at(self, n):
+		return self.tri.unpack_from(self.buf, self.tris_offset + n * self.tri.size)
+
+	def search(self, term, limit=None):
+		"""
+		return the positions of the records matching ‘term’, best match first: exact
+		matches, then prefix matches, both in source order, then fuzzy matches in order
+		of similarity
+		"""
+		def add(pos, key):
+			if pos not in best or key < best[pos]:
+				best[pos] = key
+
+		if not (q := term.strip().lower()):
+			return []
+		best = {}
+
+		qb = q.encode()
+		n = bisect.bisect_left(range(self.nterms), qb, key=self.term_str)
+		while n < self.nterms and (s := self.term_str(n)).startswith(qb):
+			add(self.term_at(n)[2], (0 if s == qb else 1, 0))
+			n += 1
+
+		counts = Counter()
+		for t in (qt := self.trigrams(q)):
+			tb = t.encode().ljust(12, b'\0')
+			n = bisect.bisect_left(range(self.ntris), tb, key=lambda n: self.tri_at(n)[0])
+			if n < self.ntris and (e := self.tri_at(n))[0] == tb:
+				counts.update(struct.unpack_from(f'<{e[2]}I', self.buf, self.postings_offset + e[1] * 4))
+		for n, count in counts.items():
+			_, _, pos, _, ntri = self.term_at(n)
+			if (sim := count / (len(qt) + ntri - count)) >= self.threshold:
+				add(pos, (2, -sim))
+
+		ret = sorted(best, key=lambda pos: (best[pos], pos))
+		return ret[:limit] if limit else ret
+
+	@staticmethod
+	def trigrams(s):
+		s = f'  {s} '
+		return {s[i:i+3] for i in range(len(s) - 2)}
+
+	@staticmethod
+	def idx_fn(json_fn):
+		return json_fn + '.sidx'
+
+	@classmethod
+	def build(cls, data, st=None):
+		"""
+		return the index of asset list ‘data’ as bytes, tied to cache file stat ‘st’
+		"""
+		terms = sorted(
+			(str(d[f]).lower().encode()[:0xffff], pos, fn)
+				for pos, d in enumerate(data)
+					for fn, f in enumerate(cls.fields))
+		postings = {}
+		ntri = []
+		for n, (s, pos, fn) in enumerate(terms):
+			if cls.fields[fn] in cls.fuzzy_fields:
+				tg = cls.trigrams(s.decode())
+				for t in tg:
+					postings.setdefault(t.encode().ljust(12, b'\0'), []).append(n)
+				ntri.append(min(len(tg), 0xff))
+			else:
+				ntri.append(0)
+		tris = sorted(postings.items())
+		def gen_terms():
+			off = 0
+			for (s, pos, fn), nt in zip(terms, ntri):
+				yield cls.term.pack(off, len(s), pos, fn, nt)
+				off += len(s)
+		def gen_tris():
+			off = 0
+			for t, p in tris:
+				yield cls.tri.pack(t, off, len(p))
+				off += len(p)
+		strings = b''.join(s for s, pos, fn in terms)
+		npostings = sum(len(p) for t, p in tris)
+		return b''.join([
+			cls.hdr.pack(
+				cls.magic,
+				st.st_size if st else 0,
+				st.st_mtime_ns if st else 0,
+				len(terms),
+				len(tris),
+				npostings,
+				len(strings)),
+			*gen_terms(),
+			*gen_tris(),
+			struct.pack(f'<{npostings}I', *(n for t, p in tris for n in p)),
+			strings])
+
+	@classmethod
+	def open(cls, json_fn):
+		"""
+		return an instance for ‘json_fn’, or None if the index is missing or stale
+		"""
+		try:
+			st = os.stat(json_fn)
+			with open(cls.idx_fn(json_fn), 'rb') as fh:
+				buf = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+			magic, size, mtime, nterms, ntris, npostings, nbytes = cls.hdr.unpack_from(buf)
+			if (
+					magic != cls.magic
+					or (size, mtime) != (st.st_size, st.st_mtime_ns)
+					or len(buf) != (
+						cls.hdr.size + nterms * cls.term.size + ntris * cls.tri.size
+						+ npostings * 4 + nbytes)):
+				return None
+			return cls(buf)
+		except (OSError, ValueError, struct.error):
+			return None
+
+	@classmethod
+	def get(cls, data, json_fn=None):
+		"""
+		return an index of asset list ‘data’, reusing or creating the sidecar file of its
+		cache file ‘json_fn’, if any
+		"""
+		if json_fn and (ret := cls.open(json_fn)):
+			return ret
+		buf = cls.build(data, os.stat(json_fn) if json_fn else None)
+		if json_fn:
+			tmp_fn = cls.idx_fn(json_fn) + '.tmp'
+			try:
+				with open(tmp_fn, 'wb') as fh:
+					fh.write(buf)
+				os.replace(tmp_fn, cls.idx_fn(json_fn))
+			except OSError:
+				pass
+		return cls(buf)
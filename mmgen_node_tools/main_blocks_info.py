@@ -22,7 +22,7 @@ mmnode-blocks-info: Display information about a block or range of blocks
 
 from mmgen.cfg import gc, Config
 from mmgen.util import async_run, fmt_list
-from .BlocksInfo import BlocksInfo, JSONBlocksInfo
+from .BlocksInfo import BlocksInfo, JSONBlocksInfo, CompareBlocksInfo
 
 opts_data = {
 	'sets': [
@@ -40,15 +40,35 @@ opts_data = {
 			'[opts] blocknum ...',
 			'[opts] blocknum-blocknum[+step]',
 			'[opts] [blocknum|-nBlocks]+nBlocks[+step]',
+			'[opts] --from-file=F',
+			'[opts] --compare=RANGE2 RANGE1',
+			'[opts] --verify-headers blocknum-blocknum',
 		],
 		'options': """
 -h, --help            Print this help message
 --, --longhelp        Print help message for long options (common options)
+-c, --compare=R       Compare stats for the range given on the command line
+                      with those for range 'R' (specified in the same format),
+                      displaying them side by side with absolute and percent-
+                      age differences.  Both ranges are processed concurrent-
+                      ly, and blocks common to both are fetched only once.
+                      Per-block data and column averages are not displayed
+-F, --from-file=F     Read block heights or hashes (whitespace-separated) from
+                      file 'F', or from standard input if 'F' is '-'.  Input
+                      is processed in chunks, so lists of any length may be
+                      used.  Stats are not available with this option
 -f, --full-stats      Stats that relate to a specific field are shown only
                       if that field is configured, whether by default or via
                       the --fields option.  This option adds the fields req-
                       uired to produce a full display of configured stats.
 -H, --header-info     Display information from block headers only
+-i, --stats-index     Maintain a persistent index of cumulative block stats,
+                      and use it to compute the 'range', 'avg' and 'total'
+                      stats for a range in constant time.  The index is used
+                      only with --stats-only, for ranges without a step and
+                      only if no unindexed fields (e.g. 'difficulty') are
+                      selected.  It’s extended as required on each invoca-
+                      tion, so its first use on a long chain will be slow
 -j, --json            Produce JSON output
 -J, --json-raw        Produce JSON output with unformatted values
 -m, --miner-info      Display miner info in coinbase transaction
@@ -66,6 +86,13 @@ opts_data = {
                       See AVAILABLE STATS below.  The prefixes and special
                       values available to the --fields option are recognized.
 -S, --stats-only      Display stats only.  Suppress display of per-block data.
+-V, --verify-headers  Verify the node’s header chain over the specified range
+                      instead of displaying block info.  Each header’s hash is
+                      recomputed locally and checked against the node-supplied
+                      hash and its target, along with hash linkage to the
+                      previous header and difficulty adjustments (BTC mainnet
+                      and regtest only).  Hashing is distributed across all
+                      available CPU cores
 """,
 	'notes': """
 If no block number is specified, the current chain tip is assumed.
@@ -140,6 +167,23 @@ EXAMPLES:
     Same as above, but display stats only:
     $ {p} -o none -s all -fS +10
 
+    Display specified fields for all blocks listed in a file, which may
+    contain block heights, block hashes or a mixture of both:
+    $ {p} -o block,date,hash,miner --from-file=blocks.txt
+
+    Same as above, but read the blocks from the output of another program:
+    $ some-program | {p} -o block,date,hash,miner --from-file=-
+
+    Compare stats for the last 1008 blocks (≈1 week) with those for the same
+    period four weeks earlier:
+    $ {p} --stats=range,avg --compare=-5040+1008 +1008
+
+    Display totals and averages for an arbitrary range, using the stats index:
+    $ {p} -S -s total,avg --stats-index 600000-700000
+
+    Verify the entire header chain:
+    $ {p} --verify-headers 0-cur
+
     Display headers-only info for the last 1000 blocks.  Speed up execution
     using the async RPC backend:
     $ {p} --rpc-backend=aio -H +1000
@@ -163,6 +207,17 @@ async def main():
 
 	cls = JSONBlocksInfo if cfg.json else BlocksInfo
 
+	if cfg.verify_headers:
+		m = BlocksInfo(cfg, cfg._args, await rpc_init(cfg, ignore_wallet=True))
+		await m.verify_headers()
+		return
+
+	if cfg.compare:
+		m = CompareBlocksInfo(cfg, cfg._args, await rpc_init(cfg, ignore_wallet=True))
+		await m.process_blocks()
+		await m.output_stats()
+		return
+
 	m = cls(cfg, cfg._args, await rpc_init(cfg, ignore_wallet=True))
 
 	if m.fnames and not cfg.no_header:
@@ -40,15 +40,41 @@ opts_data = {
                       used to supply a USD exchange rate for missing assets.
 -C, --cached-data     Use cached data from previous network query instead of
                       live data from server
--d, --download=D      Retrieve and cache asset data ‘D’ from network (valid
-                      options: {ds})
+-d, --download=D      Retrieve and cache asset data ‘D’ from network (comma-
+                      separated list; valid options: {ds})
 -D, --cachedir=D      Read and write cached JSON data to directory ‘D’
                       instead of ‘~/{dfl_cachedir}’
 -e, --add-precision=N Add ‘N’ digits of precision to columns
 -E, --elapsed         Show elapsed time in UPDATED column (see --update-time)
+-f, --portfolio-log   Display the value of the portfolio over time from the
+                      portfolio log (see PORTFOLIO LOG NOTE below)
 -F, --portfolio       Display portfolio data
+-g, --search=T        Search for crypto assets whose ID, symbol or name matches
+                      ‘T’, listing exact and prefix matches first, then those
+                      most similar to ‘T’
+-H, --http-backend=B  Use backend ‘B’ for HTTP requests (valid choices: ‘auto’,
+                      ‘aiohttp’, ‘curl’; default: ‘auto’).  The aiohttp
+                      backend keeps connections open for reuse and is used by
+                      default if installed, unless a proxy it can’t use is in
+                      effect, such as a SOCKS proxy or one set in the
+                      environment by ‘all_proxy’
+-i, --pchg-window=W   Add a column for percentage change over window ‘W’ (e.g.
+                      ‘6h’, ‘3d’, ‘2w’), computed from the local price
+                      history (see PRICE HISTORY NOTE below)
+-j, --json            Output data in JSON format for use by scripts instead of
+                      displaying it (see MACHINE-READABLE OUTPUT NOTE below)
+-k, --server=A        Get data from the price server at address ‘A’ (see
+                      --serve) instead of the remote hosts
 -l, --list-ids        List IDs of all available assets
+-L, --local-pchg      Compute percentage change columns from the local price
+                      history instead of source data
 -n, --name-labels     Label rows with asset names rather than symbols
+-o, --csv             Output data in CSV format for use by scripts instead of
+                      displaying it (see MACHINE-READABLE OUTPUT NOTE below)
+-O, --as-of=T         Display prices as of time ‘T’ from the local price
+                      history.  ‘T’ is a UTC date and time in ISO format
+                      (e.g. ‘2024-03-01’, ‘2024-03-01T12:00’) or an interval
+                      before the current time (e.g. ‘36h’, ‘2w’)
 -p, --percent-cols=C  Add daily, weekly, monthly, or yearly percentage change
                       columns ‘C’ (specify with comma-separated letters
                       {pc})
@@ -57,9 +83,14 @@ opts_data = {
 -r, --add-rows=LIST   Add rows for asset specifiers in LIST (comma-separated,
                       see ASSET SPECIFIERS below). Can also be used to supply
                       a USD exchange rate for missing assets.
+-R, --watch=S         Keep running, redisplaying data every ‘S’ seconds.  Each
+                      data source is refetched when its rate limit allows, and
+                      only changed parts of the display are redrawn
 -s, --sort=P          Sort output according to parameter P.  Valid parameters
                       are {sp_codes}. See SORT PARAMETERS below.
                       To reverse the sort, prefix the parameter with ‘r’.
+-S, --serve           Run a local price server for --server clients (see
+                      PRICE SERVER NOTE below)
 -t, --testing         Print command(s) to be executed to stdout and exit
 -T, --thousands-comma Use comma as a thousands separator
 -u, --update-time     Include UPDATED (last update time) column
@@ -156,6 +187,11 @@ the null string.
 Alternatively, you may download the JSON source data in a Tor-proxied browser
 from {cc.api_url}, save it as ‘ticker.json’ in your
 configured cache directory and run the script with the --cached-data option.
+Cached data is stored compressed (with zstd if available, otherwise gzip),
+but an uncompressed ‘ticker.json’ newer than the cached data is used in its
+place.  When the cache is next updated, its previous versions are kept with a
+‘.bak’ extension.  Compressed data is decompressed in full when first read, so
+only an uncompressed ‘ticker.json’ is loaded incrementally.
 
 Financial data is obtained from {fi.desc}, which currently allows Tor.
 
@@ -175,6 +211,89 @@ Note that financial data obtained from {fi.api_host} is filtered in the
 request, which has privacy implications.  The rate limit for financial data
 is {fi.ratelimit} seconds.
 
+Within the rate limit window, cached data is displayed instead, along with
+its age.  For {cc.stale_ttl} seconds after the window closes, cached data is still
+displayed, while fresh data is retrieved in the background for the next
+invocation.  Older data is retrieved before display.  Only --download
+treats the rate limit as an error.  The output and exit status of the
+background retrieval are logged to ‘ticker-refresh.log’ in the cache
+directory, and a failed retrieval is reported by the next invocation.
+
+Requests to each remote host are also limited by a token bucket shared by
+all invocations of the script on the machine, so that concurrent invocations
+(e.g. cron jobs and interactive use) don’t exceed the rate limit.  When the
+limit is in effect, cached data is displayed if it exists, otherwise the
+request waits.  --download always waits.
+
+Requests for crypto data are conditional: if the data hasn’t changed since it
+was cached, none is transferred, and only the cache’s timestamp is refreshed.
+The age of cached data is reckoned from the server’s time of its last
+response.
+
+
+                             PRICE HISTORY NOTE
+
+Every fetch of data from the remote hosts is appended to a local price
+history, ‘{ph.fn}’ in the cache directory.  Historical financial
+data is stored as weekly closing prices.  The price history is used by the
+--as-of, --local-pchg and --pchg-window options, which need no network
+access for it.  With --local-pchg, historical financial data is not
+retrieved.  Percentage changes are computed against the latest stored price
+at the start of each window, and are omitted if there is none.
+
+
+                             PORTFOLIO LOG NOTE
+
+Each display of the portfolio with new prices appends its value to a
+portfolio log in the cache directory, one for each distinct set of holdings.
+Records hold the update time of the newest price, total value in USD and BTC
+and the USD value of each asset, so displays of cached or unchanged data add
+no records.  --portfolio-log displays the value over time and per-asset
+profit and loss from the log of the configured portfolio, without network
+access.
+
+
+                             PRICE SERVER NOTE
+
+Invoked with --serve, the script runs a local server that fetches and caches
+data from the remote hosts and serves it to clients, i.e. invocations of the
+script with --server (or the ‘server’ option set in the config file).  Each
+remote host is thus contacted at most once per rate limit period, regardless
+of the number of clients.  Clients request only the assets they display.
+
+The server address is either a Unix socket path or HOST:PORT for a TCP
+socket.  Relative socket paths are taken to be in the cache directory.  The
+server listens on the socket ‘{ps.dfl_addr}’ unless --server is given.  As
+requests are unauthenticated, the server binds to loopback addresses only
+(HOST defaults to ‘localhost’).  Yahoo Finance assets are those configured
+for the server.  Clients ignore the server when --cached-data or --download
+is in effect.
+
+
+                                ALERTS NOTE
+
+Price alert rules are listed in the alerts file (see below), one per line in
+the form ‘ASSET COLUMN above|below VALUE’, where COLUMN is one of
+{alert_cols}.  An alert is triggered when the asset’s value in the
+column crosses the threshold between two invocations of the script, or
+between two redisplays with --watch.  The last values seen are kept in the
+file ‘{pa.fn}’ in the cache directory, so no alert is
+triggered on the first invocation.  Alerts are printed below the display,
+and optionally delivered by running a command, with the alert text in the
+environment variable MMNODE_TICKER_ALERT, and by playing a sound.  Alerts are
+not checked with --as-of, --download or --serve.
+
+
+                         MACHINE-READABLE OUTPUT NOTE
+
+With --json or --csv, the rows, price columns and portfolio (if any) of the
+display are output unformatted, with prices and amounts as exact decimal
+strings, percentage changes as numbers and update times as Unix timestamps.
+The JSON output also holds the current time, the adjustment percentage and,
+in trading mode, the traded assets and amounts.  The CSV output is a single
+table whose ‘type’ column distinguishes price rows from the portfolio’s
+holdings and total.  Any alerts are printed to stderr.
+
 
                                   EXAMPLES
 
@@ -196,6 +315,22 @@ $ mmnode-ticker -wE -c eurusd=x,bgn-bulgarian-lev:0.5113r:eurusd=x
 # add DOGE row:
 $ mmnode-ticker -WCFP -r doge
 
+# Wide display, redisplaying every 10 seconds until interrupted:
+$ mmnode-ticker -w -R 10
+
+# Wide display of prices as of one week ago, with 3-day percentage change:
+$ mmnode-ticker -w --as-of=1w --pchg-window=3d
+
+# Output prices and portfolio values in CSV format for use by a script:
+$ mmnode-ticker -F --csv
+
+# Display portfolio values recorded by previous invocations with --portfolio:
+$ mmnode-ticker --portfolio-log
+
+# Run a price server in the background, and get data from it:
+$ mmnode-ticker --serve &
+$ mmnode-ticker -w --server={ps.dfl_addr}
+
 # Display 17.234 XMR priced in all configured assets (‘trading’ mode):
 $ mmnode-ticker xmr:17.234
 
@@ -228,6 +363,9 @@ Customize output by editing the file
 
 To add a portfolio, edit the file
     ~/{pf_cfg}
+
+To add price alerts, edit the file
+    ~/{al_cfg}
 """},
 	'code': {
 		'options': lambda s: s.format(
@@ -240,16 +378,21 @@ To add a portfolio, edit the file
 			assets = fmt_list(assets_list_gen(cfg_in), fmt='col', indent='  '),
 			cfg    = os.path.relpath(cfg_in.cfg_file, start=homedir),
 			pf_cfg = os.path.relpath(cfg_in.portfolio_file, start=homedir),
+			al_cfg = os.path.relpath(cfg_in.alerts_file, start=homedir),
+			alert_cols = fmt_list(alert_cols, fmt='fancy'),
 			al     = DataSource.coinpaprika.dfl_asset_limit,
 			cc     = src_cls['cc'](),
 			sp_fmt = '\n  '.join(f'‘{k}’ - {v.desc}' for k, v in sort_params.items()),
+			ps     = PriceServer,
+			pa     = PriceAlerts,
+			ph     = PriceStore,
 			fi     = src_cls['fi']())
 	}
 }
 
 import os
 
-from mmgen.util import fmt_list, fmt_dict
+from mmgen.util import fmt_list, fmt_dict, async_run
 from mmgen.cfg import Config
 from . import Ticker
 
@@ -258,7 +401,10 @@ gcfg = Config(opts_data=opts_data, caller_post_init=True)
 src_cls, cfg_in = Ticker.make_cfg(gcfg)
 
 from .Ticker import dfl_cachedir, homedir, DataSource, assets_list_gen, sort_params
+from .PriceServer import PriceServer
+from .PriceStore import PriceStore
+from .PriceAlerts import PriceAlerts, alert_cols
 
 gcfg._post_init()
 
-Ticker.main()
+async_run(gcfg, Ticker.main)
@@ -12,7 +12,7 @@
 test.cmdtest_d.misc: Miscellaneous test groups for the cmdtest.py test suite
 """
 
-import os, shutil
+import os, shutil, signal
 
 from ..include.common import cfg
 from .base import CmdTestBase
@@ -70,6 +70,8 @@ class CmdTestScripts(CmdTestBase):
 		('copy_cache_files', 'copying JSON files to cache'),
 		('ticker1a', 'ticker [--download=cc] (early caching)'),
 		('ticker1b', 'ticker [--download=cc] (late caching)'),
+		('ticker1c', 'ticker [--download=cc --http-backend=curl]'),
+		('ticker1d', 'ticker [--download=cc --json]'),
 		('ticker2',  'ticker (bad proxy)'),
 		('ticker3',  'ticker [--cached-data]'),
 		('ticker4',  'ticker [--cached-data --wide]'),
@@ -104,6 +106,13 @@ class CmdTestScripts(CmdTestBase):
 		('ticker33', 'ticker [--cached-data --wide --pchg-unit=btc --sort=c] (cfg file with USD)'),
 		('ticker34', 'ticker [--cached-data --wide --pchg-unit=btc --sort=y] (cfg file with USD)'),
 		('ticker35', 'ticker [--cached-data --wide --pchg-unit=btc --sort=p] (cfg file with USD)'),
+		('ticker36', 'ticker [--cached-data --wide --watch=1]'),
+		('ticker37', 'ticker [--as-of=2022-08-02T18:30 --wide --pchg-window=1d] (price history)'),
+		('ticker38', 'ticker [--portfolio-log] (portfolio log)'),
+		('ticker39', 'ticker [--search=monro]'),
+		('ticker40', 'ticker [--add-rows=btx,xmr-moneroo] (closest matches)'),
+		('ticker41', 'ticker [--cached-data --json --portfolio]'),
+		('ticker42', 'ticker [--cached-data --csv --adjust=1.23 xmr:17.234:btc]'),
 	)
 	}
 
@@ -172,10 +181,31 @@ class CmdTestScripts(CmdTestBase):
 	def ticker1b(self):
 		return self.ticker1a(first_run=False)
 
+	def ticker1c(self):
+		t = self.ticker(
+			add_opts = ['--proxy', '', '--download=cc', '--http-backend=curl'],
+			cached_data = False,
+			use_proxy = False)
+		t.expect('Fetching cryptocurrency data')
+		t.expect('done')
+		return t
+
+	def ticker1d(self): # --json is ignored with --download
+		t = self.ticker(
+			add_opts = ['--proxy', '', '--download=cc', '--json'],
+			cached_data = False,
+			use_proxy = False)
+		t.expect('Fetching cryptocurrency data')
+		t.expect('done')
+		return t
+
 	def ticker2(self):
 		t = self.ticker(cached_data=False)
-		ret = t.expect(['proxy host could not be resolved', 'unexpected keyword'])
-		t.exit_val = 1 if ret else 3
+		ret = t.expect([
+			'proxy host could not be resolved',
+			'Cannot connect to host asdfzxcv',
+			'unexpected keyword'])
+		t.exit_val = 1 if ret == 2 else 3
 		return t
 
 	def ticker3(self):
@@ -500,3 +530,70 @@ class CmdTestScripts(CmdTestBase):
 
 	def ticker35(self):
 		return self._ticker_cur(sort='p')
+
+	def ticker36(self):
+		t = self.ticker(add_opts=['--wide', '--watch=1'], exit_val=1)
+		t.expect('USD         BTC  CHG_7d CHG_24h  UPDATED')
+		t.expect('Redisplaying every 1 seconds')
+		t.p.kill(signal.SIGINT)
+		t.expect('User interrupt')
+		return t
+
+	def ticker37(self):
+		return self.ticker(
+			['--as-of=2022-08-02T18:30', '--wide', '--pchg-window=1d'],
+			[
+				'Price history as of: 2022-08-02 18:30:00 UTC',
+				'USD BTC CHG_7d CHG_24h CHG_1d UPDATED',
+				'BITCOIN 23,250.77 1.00000000 -- -- -- 2022-08-02 18:25:59',
+				'MONERO 158.97 0.00683732 -- -- -- 2022-08-02 18:25:59',
+				r'\(no data for gc=f\)'
+			])
+
+	def ticker38(self): # uses the portfolio log written by ticker7
+		self.copy_file('ticker-portfolio.yaml')
+		t = self.ticker(
+			['--portfolio-log', '--thousands-comma'],
+			[
+				'Portfolio history:',
+				r'\(1 record\)',
+				r'2022-08-02 18:25:59 33,464.32 \+0.00 \+0.00% 1.43927782',
+				r'BTC-BITCOIN 28,704.66 28,704.66 \+0.00 \+0.00%'
+			],
+			cached_data = False)
+		self.rm_file('ticker-portfolio.yaml')
+		return t
+
+	def ticker39(self):
+		t = self.ticker(['--search=monro'])
+		t.expect('xmr-monero  Monero')
+		return t
+
+	def ticker40(self):
+		t = self.ticker(['--add-rows=btx,xmr-moneroo'], exit_val=1)
+		t.expect('BTX  (closest matches: btc-bitcoin)')
+		t.expect('xmr-moneroo  (closest matches: xmr-monero)')
+		return t
+
+	def ticker41(self):
+		self.copy_file('ticker-portfolio.yaml')
+		t = self.ticker(['--json', '--portfolio'])
+		t.expect('{"time": 1659465400,')
+		t.expect('"columns": ["USD", "BTC"]')
+		t.expect('{"id": "eth-ethereum", "symbol": "ETH", "name": "Ethereum", '
+			'"USD": "1659.6621665887371", "BTC": "0.07138094253462818721861245655", '
+			'"percent_change_24h": 1.82, "percent_change_7d": 21.42')
+		t.expect('"portfolio": {"holdings": [{"id": "btc-bitcoin"')
+		t.expect('"amount": "1.23456789", "USD": "28704.65906392725693135258"')
+		t.expect('"total": {"USD": "33464.32332822042691421048046", '
+			'"BTC": "1.439277817220883449383610886"}')
+		self.rm_file('ticker-portfolio.yaml')
+		return t
+
+	def ticker42(self):
+		t = self.ticker(['--csv', '--adjust=1.23', 'xmr:17.234:btc'])
+		t.expect('type,id,symbol,name,spot,adjusted,last_updated')
+		t.expect('price,xmr-monero,XMR,Monero,17.234,17.4459782,1659464759')
+		t.expect('price,btc-bitcoin,BTC,Bitcoin,0.1178344053808316863621495895,'
+			'0.1192837685670159161044040295,1659464759')
+		return t
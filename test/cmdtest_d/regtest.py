@@ -90,6 +90,11 @@ class CmdTestRegtest(CmdTestBase):
 		('blocks_info2',              "blocks-info (no args)"),
 		('blocks_info3',              "blocks-info +100"),
 		('blocks_info4',              "blocks-info --miner-info --fields=all --stats=all +1"),
+		('blocks_info5',              "blocks-info --from-file"),
+		('blocks_info6',              "blocks-info --compare=-100+50 +50"),
+		('blocks_info7',              "blocks-info --stats-only --stats-index 100-300"),
+		('blocks_info8',              "blocks-info --verify-headers 0-cur"),
+		('blocks_info9',              "blocks-info --compare=-100+50 -S -i +50"),
 	),
 	'feeview': (
 		"'mmnode-feeview' script",
@@ -294,6 +299,51 @@ class CmdTestRegtest(CmdTestBase):
 				'Next diff adjust: 2016'
 			])
 
+	def blocks_info5(self):
+		fn = joinpath(self.tmpdir, 'blocks.txt')
+		with open(fn, 'w') as fp:
+			fp.write('# block list\n1 200\n396\n')
+		return self.blocks_info(
+			['--fields=block', f'--from-file={fn}'],
+			['1', '200', '396'])
+
+	def blocks_info6(self):
+		return self.blocks_info(
+			['--stats=range,avg,diff', '--compare=-100+50', '+50'],
+			[
+				'Range Statistics:', '347-396', '296-345', 'Delta',
+				'Range size:', '50', '50', r'\+0', r'\+0.00%',
+				'Averages for processed blocks:',
+				'Current height: 396'
+			])
+
+	def blocks_info7(self):
+		return self.blocks_info(
+			['--stats-only', '--stats=range,total,avg', '--stats-index', '100-300'],
+			[
+				'Range: 100-300',
+				'Averages for processed blocks:',
+				'Totals for processed blocks:'
+			])
+
+	def blocks_info8(self):
+		return self.blocks_info(
+			['--verify-headers', '0-cur'],
+			[
+				'Verified headers 0-396',
+				'Hash, proof of work, linkage: OK',
+				'Difficulty adjustments: OK'
+			])
+
+	def blocks_info9(self):
+		return self.blocks_info(
+			['--stats=range,total', '--compare=-100+50', '-S', '-i', '+50'],
+			[
+				'Range Statistics:', '347-396', '296-345', 'Delta',
+				'Range size:', '50', '50', r'\+0', r'\+0.00%',
+				'Totals for processed blocks:'
+			])
+
 	async def feeview_setup(self):
 
 		def create_pairs(nPairs):
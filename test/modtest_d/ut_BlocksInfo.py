@@ -3,7 +3,10 @@
 test.unit_tests_d.nt_BlocksInfo: BlocksInfo unit test for the MMGen Node Tools suite
 """
 
-from mmgen_node_tools.BlocksInfo import BlocksInfo
+import asyncio
+from array import array
+
+from mmgen_node_tools.BlocksInfo import BlocksInfo, RPCFetchCache, bits_to_target, target_to_bits
 
 from ..include.common import vmsg
 
@@ -62,11 +65,23 @@ fields_vecs = (
 	( 'All-dDddd,aa',           [e for e in full_set if e not in ('aa','ddddd')] ),
 )
 
+# from Bitcoin Core’s pow_tests.cpp:
+#            height   last retarget time  last time   last bits   expected bits
+retarget_vecs = (
+	( 32256,  1261130161,  1262152739, 0x1d00ffff, 0x1d00d86a ), # no constraints
+	( 2016,   1231006505,  1233061996, 0x1d00ffff, 0x1d00ffff ), # pow limit
+	( 68544,  1279008237,  1279297671, 0x1c05a3f4, 0x1c0168fd ), # lower limit actual
+	( 46368,  1263163443,  1269211443, 0x1c387f6f, 0x1d00e1fd ), # upper limit actual
+)
+
 class dummyRPC:
 	blockcount = tip
 	def info(self,arg):
 		return True
 	class proto:
+		coin = 'BTC'
+		network = 'mainnet'
+		diff_adjust_interval = 2016
 		class coin_amt:
 			satoshi = 0.00000001
 
@@ -76,8 +91,40 @@ class dummyCfg:
 	miner_info = None
 	header_info = None
 	full_stats = None
+	from_file = None
+	stats_index = None
 	coin = 'BTC'
 
+class dummyCLICfg(dummyCfg):
+	header_info = True
+	stats = 'all'
+	stats_only = True
+
+class dummyAsyncRPC(dummyRPC):
+
+	def __init__(self, cfg=None):
+		self.cfg = cfg or dummyCfg()
+
+	async def call(self, method, *args):
+		match method:
+			case 'getblockhash':
+				return f'{args[0]:064x}'
+			case 'getblockheader':
+				n = int(args[0], 16)
+				return {
+					'hash': args[0],
+					'height': n,
+					'time': 1600000000 + n * 600,
+					'nTx': 1,
+					'versionHex': '20000000',
+					'difficulty': 1}
+			case 'getblockstats':
+				n = int(args[0], 16)
+				return {'total_size': n * 2, 'total_weight': n * 8}
+
+	async def gathered_call(self, method, args_list):
+		return [await self.call(method, *args) for args in args_list]
+
 class unit_tests:
 
 	def parse_field(self,name,ut):
@@ -122,3 +169,74 @@ class unit_tests:
 			test(*vec)
 
 		return True
+
+	async def iter_blocks(self, name, ut):
+
+		from mmgen.cfg import Config
+
+		# the RPC client’s cfg, whether bare or that of another command, is ignored:
+		for cfg in (Config(), dummyCLICfg()):
+			res = [blk async for blk in BlocksInfo.iter_blocks(
+				dummyAsyncRPC(cfg), ['+3'], 'block,interval,size')]
+			for blk in res:
+				vmsg(repr(blk))
+			assert [tuple(blk) for blk in res] == [(n, 600, n*2) for n in range(tip-2, tip+1)], res
+
+		res = [blk async for blk in BlocksInfo.iter_blocks(
+			dummyAsyncRPC(Config()), ['+1'], 'block', header_info=True)]
+		vmsg(repr(res[0]))
+		assert res[0]._fields == (
+			'block', 'hash', 'date', 'interval', 'nTx', 'version', 'difficulty'), res
+
+		return True
+
+	async def fetch_cache_error(self, name, ut):
+
+		class failingRPC(dummyAsyncRPC):
+			fail = True
+			async def gathered_call(self, method, args_list):
+				await asyncio.sleep(0)
+				if self.fail:
+					raise RuntimeError('RPC failed')
+				return await super().gathered_call(method, args_list)
+
+		rpc = failingRPC()
+		c = RPCFetchCache(rpc)
+		# a concurrent caller waiting on the same key must get the error, not hang:
+		res = await asyncio.wait_for(
+			asyncio.gather(c.call('getblockhash', 1), c.call('getblockhash', 1), return_exceptions=True),
+			timeout = 5)
+		vmsg(repr(res))
+		assert all(isinstance(e, RuntimeError) for e in res), res
+		assert not c.cache, c.cache
+		rpc.fail = False
+		assert await c.call('getblockhash', 1) == f'{1:064x}'
+
+		return True
+
+	def bits_target(self, name, ut):
+
+		for bits in (0x1d00ffff, 0x1d00d86a, 0x1c0168fd, 0x207fffff, 0x170331db):
+			target = bits_to_target(bits)
+			vmsg(f'{bits:08x} => {target:064x}')
+			assert target_to_bits(target) == bits, f'{target_to_bits(target):08x} != {bits:08x}'
+
+		return True
+
+	def check_difficulty(self, name, ut):
+
+		for height, t_first, t_last, bits_last, bits_chk in retarget_vecs:
+			rpc = dummyRPC()
+			rpc.blockcount = height
+			b = BlocksInfo(dummyCfg(), [str(height-2016)], rpc)
+			times = array(
+				'I',
+				[t_first + (t_last - t_first) * i // 2015 for i in range(2016)] + [t_last + 600])
+			bits = array('I', [bits_last] * 2016 + [bits_chk])
+			ret = b.check_difficulty(times, bits)
+			vmsg(f'{height}: {bits_last:08x} => {bits_chk:08x} {ret}')
+			assert ret == (1, []), ret
+			bits[-1] += 1
+			assert b.check_difficulty(times, bits)[1], 'bad difficulty adjustment not detected'
+
+		return True
@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+"""
+test.modtest_d.ut_Ticker: Ticker unit test for the MMGen Node Tools suite
+"""
+
+import os, json, datetime, asyncio
+from decimal import Decimal
+from tempfile import TemporaryDirectory
+from types import SimpleNamespace
+
+from mmgen_node_tools.Ticker import http_session, RateLimiter, DataSource, asset_tuple
+from mmgen_node_tools.TickerCache import CacheIndex, JSONStream, CompressedCache, SearchIndex
+from mmgen_node_tools.PriceServer import PriceServer
+from mmgen_node_tools.PriceStore import PriceStore, PortfolioLog
+from mmgen_node_tools.PriceAlerts import PriceAlerts
+
+from ..include.common import vmsg
+
+assets = [
+	{'id': 'btc-bitcoin',     'symbol': 'BTC', 'name': 'Bitcoin'},
+	{'id': 'xag-silver',      'symbol': 'XAG', 'name': 'Silver'},
+	{'id': 'eth-ethereum',    'symbol': 'ETH', 'name': 'Ethereum'},
+	{'id': 'xag-xrpayment',   'symbol': 'XAG', 'name': 'XRPayNet Gümüş'},
+	{'id': 'xmr-monero',      'symbol': 'XMR', 'name': 'Monero'},
+]
+
+class unit_tests:
+
+	def http_proxy(self, name, ut):
+		from unittest.mock import patch
+		for proxy, env, chk in (
+				('http://127.0.0.1:8118',  {},                                          True),
+				('socks5h://127.0.0.1:9050', {},                                        False),
+				('',                       {'ALL_PROXY': 'socks5h://127.0.0.1:9050'},   True),
+				(None,                     {},                                          True),
+				(None,                     {'https_proxy': 'http://127.0.0.1:8118'},    True),
+				(None,                     {'https_proxy': 'socks5h://127.0.0.1:9050'}, False),
+				(None,                     {'https_proxy': 'https://127.0.0.1:8118'},   False),
+				(None,                     {'ALL_PROXY': 'socks5h://127.0.0.1:9050'},   False),
+				(None,                     {'all_proxy': 'http://127.0.0.1:8118'},      False),
+				(None,                     {'ftp_proxy': 'socks5h://127.0.0.1:9050'},   True)):
+			with patch.dict(os.environ, env, clear=True):
+				ret = http_session.supports_proxy(proxy)
+			vmsg(f'  {proxy!r:26} {env}: {ret}')
+			assert ret == chk, ret
+		return True
+
+	def cache_index_parse(self, name, ut):
+		for text in (
+				json.dumps(assets),
+				json.dumps(assets, ensure_ascii=False, indent=2),
+				' [ ] ',
+				'{"error": "foo"}'):
+			data, spans = CacheIndex.parse(text)
+			assert data == json.loads(text)
+			if spans is not None:
+				b = text.encode()
+				assert [json.loads(b[o:o+n]) for o, n in spans] == data
+			vmsg(f'  {len(data)} elements, spans: {spans}')
+		for text in ('[1,]', '[1 2]', '[1] x', '['):
+			try:
+				CacheIndex.parse(text)
+			except json.JSONDecodeError as e:
+				vmsg(f'  {text!r}: {e}')
+			else:
+				raise AssertionError(f'{text!r}: invalid JSON not detected')
+		return True
+
+	def cache_index(self, name, ut):
+		with TemporaryDirectory() as tmpdir:
+			fn = os.path.join(tmpdir, 'ticker.json')
+			text = json.dumps(assets, ensure_ascii=False)
+			with open(fn, 'w') as fh:
+				fh.write(text)
+			assert CacheIndex.open(fn) is None
+			CacheIndex.write(fn, *CacheIndex.parse(text))
+			idx = CacheIndex.open(fn)
+			assert len(idx) == len(assets)
+			assert list(idx) == assets and idx[1:4] == assets[1:4] and idx[-1] == assets[-1]
+			assert idx.find('id', 'eth-ethereum') == [2]
+			assert idx.find('symbol', 'XAG') == [1, 3]
+			assert idx.find('symbol', 'xag') == []
+			assert idx.find('id', 'foo-bar') == []
+			vmsg(f'  XAG: {[idx[n]["name"] for n in idx.find("symbol", "XAG")]}')
+			with open(fn, 'a') as fh: # cache file modified, so index is stale
+				fh.write(' ')
+			assert CacheIndex.open(fn) is None
+		return True
+
+	def json_stream(self, name, ut):
+
+		def stream(text, chunk_len=7, flush_len=None, **kwargs):
+			s = JSONStream(CompressedCache.writer(fn), **kwargs)
+			s.flush_len = flush_len or s.flush_len
+			b = text.encode()
+			try:
+				for i in range(0, len(b), chunk_len):
+					s.feed(b[i:i+chunk_len])
+				s.close()
+			except:
+				s.out.discard()
+				raise
+			assert CompressedCache.read(s.out.path) == b
+			return s
+
+		with TemporaryDirectory() as tmpdir:
+			fn = os.path.join(tmpdir, 'ticker.json')
+			for text in (json.dumps(assets), json.dumps(assets, ensure_ascii=False, indent=2)):
+				for chunk_len in (1, 7, 4096):
+					batches = []
+					s = stream(
+						text,
+						chunk_len,
+						flush_len = 2,
+						select    = lambda n, d: d['symbol'] == 'XAG',
+						extract   = lambda d: d['name'],
+						flush     = lambda names: batches.append(list(names)) or True)
+					assert s.is_list and sorted(s.records) == [1, 3]
+					assert batches == [[d['name'] for d in assets[i:i+2]] for i in (0, 2, 4)]
+					idx = CacheIndex.from_stream(s, load=lambda: CompressedCache.read(s.out.path))
+					assert list(idx) == assets and len(idx.records) == 2 # not memoized by iteration
+					assert idx.find('symbol', 'XAG') == [1, 3] and idx.find('id', 'eth-ethereum') == [2]
+					idx.save(cache_fn := s.out.commit())
+					assert list(CacheIndex.open(cache_fn, load=CompressedCache.read)) == assets
+			vmsg(f'  {len(assets)} elements, spans: {list(CacheIndex.span.iter_unpack(s.spans))}')
+			s = stream(' [ ] ')
+			assert s.is_list and len(CacheIndex.from_stream(s, load=None)) == 0
+			s.out.discard()
+			s = stream('{"error": "foo"}', extract=lambda d: d['name'])
+			assert not s.is_list and s.value == {'error': 'foo'}
+			s.out.discard()
+			s = stream(json.dumps(assets), extract=lambda d: d['price'])
+			assert s.extracted is None and len(s.records) == len(assets)
+			s.out.discard()
+			e = json.dumps(assets[0])
+			for text in (f'[{e},]', f'[{e} {e}]', f'[{e}] x', f'[{e}', '[1]', '[{}]', ''):
+				try:
+					stream(text)
+				except ValueError as e:
+					vmsg(f'  {text!r}: {e}')
+				else:
+					raise AssertionError(f'{text!r}: invalid JSON not detected')
+			assert not [fn for fn in os.listdir(tmpdir) if '.tmp' in fn]
+		return True
+
+	def compressed_cache(self, name, ut):
+		with TemporaryDirectory() as tmpdir:
+			fn = os.path.join(tmpdir, 'ticker.json')
+			text = json.dumps(assets, ensure_ascii=False)
+			assert CompressedCache.path(fn) is None
+			cache_fn = CompressedCache.write(fn, text)
+			vmsg('  {}: {} -> {} bytes'.format(
+				os.path.basename(cache_fn),
+				len(text.encode()),
+				os.path.getsize(cache_fn)))
+			assert cache_fn != fn and CompressedCache.path(fn) == cache_fn
+			assert CompressedCache.read(cache_fn).decode() == text
+			CacheIndex.write(cache_fn, *CacheIndex.parse(text))
+			assert list(CacheIndex.open(cache_fn, load=CompressedCache.read)) == assets
+			# an uncompressed file newer than the cache replaces it:
+			with open(fn, 'w') as fh:
+				fh.write(json.dumps(assets[:2]))
+			os.utime(cache_fn, ns=(0, 0))
+			assert CompressedCache.path(fn) == fn
+			assert json.loads(CompressedCache.read(fn)) == assets[:2]
+			# the existing versions are kept as backups:
+			assert CompressedCache.write(fn, text) == cache_fn
+			assert sorted(os.listdir(tmpdir)) == sorted(
+				os.path.basename(f) for f in (cache_fn, cache_fn + '.bak', fn + '.bak'))
+			with open(fn + '.bak') as fh:
+				assert json.loads(fh.read()) == assets[:2]
+		return True
+
+	def search_index(self, name, ut):
+		def search(term, limit=None):
+			return [assets[n]['id'] for n in idx.search(term, limit)]
+		with TemporaryDirectory() as tmpdir:
+			fn = os.path.join(tmpdir, 'ticker.json')
+			with open(fn, 'w') as fh:
+				fh.write(json.dumps(assets))
+			assert SearchIndex.open(fn) is None
+			idx = SearchIndex.get(assets, fn)
+			assert SearchIndex.open(fn).search('xag') == idx.search('xag')
+			for term, chk in (
+					('XAG',      ['xag-silver', 'xag-xrpayment']), # exact matches, in source order
+					('e',        ['eth-ethereum']),                # prefix match
+					('xmr-',     ['xmr-monero']),                  # prefix match of ID
+					('gümüş',    ['xag-xrpayment']),               # non-ASCII name
+					('monro',    ['xmr-monero']),                  # fuzzy matches
+					('bitcion',  ['btc-bitcoin']),
+					('x',        ['xag-silver', 'xag-xrpayment', 'xmr-monero']),
+					('etherium', ['eth-ethereum']),
+					('zzzz',     []),
+					('  ',       [])):
+				res = search(term)
+				vmsg(f'  {term!r}: {res}')
+				assert res == chk, res
+			assert search('xag', limit=1) == ['xag-silver']
+			with open(fn, 'a') as fh: # cache file modified, so index is stale
+				fh.write(' ')
+			assert SearchIndex.open(fn) is None
+		idx = SearchIndex.get(assets) # in-memory index
+		assert search('slver') == ['xag-silver']
+		return True
+
+	def price_server_select(self, name, ut):
+
+		def req(ids=(), symbols=(), asset_range=None):
+			return {'id': ids, 'symbol': symbols, 'range': asset_range}
+
+		with TemporaryDirectory() as tmpdir:
+			fn = os.path.join(tmpdir, 'ticker.json')
+			text = json.dumps(assets)
+			with open(fn, 'w') as fh:
+				fh.write(text)
+			CacheIndex.write(fn, *CacheIndex.parse(text))
+			idx = CacheIndex.open(fn)
+			src = SimpleNamespace(data=idx, find=idx.find)
+			for rq, chk_pos, chk_range in (
+					(req(),                                  [0],          None),
+					(req(['xmr-monero'], ['XAG']),           [0, 1, 3, 4], None),
+					(req(['foo-bar'], ['ETH'], [2, 2]),      [0, 1, 2],    [1, 2]),
+					(req(['xmr-monero'], [], [3, 10]),       [0, 2, 3, 4], [1, 4]),
+					(req([], [], [1, None]),                 [0, 1, 2, 3, 4], [0, 5]),
+					(req([], ['XMR'], [9, 10]),              [0, 4],       [2, 2])):
+				data, asset_range = PriceServer.select_records(src, rq)
+				vmsg(f'  {rq}: {[d["id"] for d in data]} {asset_range}')
+				assert data == [assets[n] for n in chk_pos], data
+				assert asset_range == chk_range, asset_range
+				if rq['range']:
+					n, m = rq['range']
+					assert data[slice(*asset_range)] == assets[n-1:m]
+
+		src = SimpleNamespace(data={'GC=F': 1, '^DJI': 2, 'EURUSD=X': 3})
+		data, asset_range = PriceServer.select_records(src, req(['^dji', 'gc=f', 'si=f']))
+		assert data == {'GC=F': 1, '^DJI': 2} and asset_range is None, data
+		return True
+
+	async def price_server_limits(self, name, ut):
+		for host, chk in (
+				('localhost', True),
+				('127.0.0.1', True),
+				('::1',       True),
+				('0.0.0.0',   False),
+				('192.0.2.1', False),
+				('',          False)):
+			ret = PriceServer.is_loopback(host)
+			vmsg(f'  {host!r:12} loopback: {ret}')
+			assert ret == chk, ret
+
+		server = PriceServer({})
+		async def read(data):
+			reader = asyncio.StreamReader()
+			reader.feed_data(data)
+			reader.feed_eof()
+			return await server.read_request(reader)
+		assert await read(b'{"source": "cc"}') == {'source': 'cc'}
+		assert await read(b' ' * (server.max_req_size - 2) + b'{}') == {}
+		try:
+			await read(b' ' * (server.max_req_size - 1) + b'{}')
+		except ValueError as e:
+			vmsg(f'  {e}')
+		else:
+			raise AssertionError('oversized request not rejected')
+		return True
+
+	def price_store(self, name, ut):
+		rec = PriceStore.record
+		with TemporaryDirectory() as tmpdir, PriceStore(tmpdir) as store:
+			assert store.append([
+				rec('btc-bitcoin', 'BTC',  'Bitcoin', 1000, 100.0,  2000.0),
+				rec('btc-bitcoin', 'BTC',  'Bitcoin', 2000, 110.0,  2200.0),
+				rec('xag-silver',  'XAG',  'Silver',  1500, 20.0,   500.0),
+				rec('gc=f',        'GC=F', 'Gold',    1000, 1800.0, None),
+				rec('gc=f',        'GC=F', None,      3000, 1900.0, None),
+				rec('gc=f',        'GC=F', None,      4000, None,   None)]) == 5
+			# appending is idempotent:
+			assert store.append([rec('btc-bitcoin', 'BTC', 'Bitcoin', 2000, 110.0, 2200.0)]) == 0
+
+			btc = store.get_aid('btc-bitcoin')
+			assert store.price_at(btc, 999) is None
+			assert store.price_at(btc, 1999) == (1000, 100.0, 2000.0)
+			assert store.price_at(btc, 2000) == (2000, 110.0, 2200.0)
+			assert round(store.pchg(btc, 2500, 1000, Decimal('121')), 8) == 21
+			assert store.pchg(btc, 2500, 2000, 110) is None
+
+			data = store.get_records(2500, all_assets=True)
+			vmsg('  ' + '\n  '.join(f'{d["rank"]}) {d["id"]}: {d["quotes"]["USD"]}' for d in data))
+			assert [(d['id'], d['rank'], d['name']) for d in data] == [
+				('btc-bitcoin', 1, 'Bitcoin'),
+				('xag-silver', 2, 'Silver'),
+				('gc=f', 3, 'Gold')]
+			assert data[0]['quotes']['USD']['percent_change_24h'] is None # no price a day before
+			assert data[2]['quotes']['USD']['price'] == 1800.0
+			assert data[0]['last_updated'] == '1970-01-01T00:33:20+00:00'
+
+			data = store.get_records(1200, ids=['gc=f'], symbols=['BTC', 'XAG', 'ETH'])
+			assert [d['id'] for d in data] == ['gc=f', 'btc-bitcoin'] # no XAG price at t=1200
+
+			disp_data = {
+				'btc-bitcoin':
+					{'id': 'btc-bitcoin', 'price_usd': Decimal('121'), 'percent_change_24h': 5.0},
+				'eth-ethereum':
+					{'id': 'eth-ethereum', 'price_usd': Decimal('5'), 'percent_change_24h': 5.0},
+				'usd-us-dollar':
+					{'id': 'usd-us-dollar', 'price_usd': Decimal(1), 'percent_change_24h': 0.0},
+				'inr-user':      {'id': 'inr-user', 'price_usd': Decimal('0.01')}}
+			store.set_pchg(disp_data, 2500, {'percent_change_24h': 1000, 'percent_change_window': 2000})
+			assert round(disp_data['btc-bitcoin']['percent_change_24h'], 8) == 21
+			assert disp_data['btc-bitcoin']['percent_change_window'] is None
+			assert disp_data['eth-ethereum']['percent_change_24h'] is None
+			assert disp_data['usd-us-dollar']['percent_change_window'] == 0.0
+			assert 'percent_change_window' not in disp_data['inr-user']
+		return True
+
+	def yahoo_history_merge(self, name, ut):
+		import pandas as pd
+		hist = DataSource.yahoohist
+		date, dt = datetime.date, datetime.datetime
+		index = [
+			('GC=F', date(2022, 7, 25)),
+			('GC=F', date(2022, 8, 1)),
+			('GC=F', dt(2022, 8, 2, 12)), # current day’s data
+			('^DJI', date(2022, 8, 1))]
+		res = pd.DataFrame(
+			{'close': [1750.0, 1780.0, 1790.0, float('nan')], 'volume': [10, 11, 12, 13]},
+			index = pd.MultiIndex.from_tuples(index))
+		new = hist.parse_history(res)
+		vmsg(f'  parsed: {new}')
+		assert new == {
+			'GC=F': {
+				'2022-07-25': {'close': 1750.0, 'volume': 10},
+				'2022-08-01': {'close': 1780.0, 'volume': 11}},
+			'^DJI': {'2022-08-01': {'close': None, 'volume': 13}}}
+		assert hist.parse_history({'GC=F': 'No data found'}) == {}
+
+		# data cached by older versions:
+		cached = hist().postprocess_data({
+			"('GC=F', datetime.date(2021, 7, 26))": {'close': 1800.0},
+			"('GC=F', datetime.date(2022, 7, 25))": {'close': 1740.0},
+			"('GC=F', datetime.datetime(2022, 7, 27, 7, 7, 7))": {'close': 1745.0},
+			"('^IXIC', datetime.date(2022, 7, 25))": {'close': 12000.0}})
+		assert cached == {
+			'GC=F': {'2021-07-26': {'close': 1800.0}, '2022-07-25': {'close': 1740.0}},
+			'^IXIC': {'2022-07-25': {'close': 12000.0}}}
+		assert hist().postprocess_data(new) is new
+
+		ret = hist.merge_history(cached, new, '2022-07-18', '2021-07-27', ['GC=F', '^DJI', 'SI=F'])
+		vmsg(f'  merged: {ret}')
+		assert ret == {
+			'GC=F': {
+				'2022-07-25': {'close': 1750.0, 'volume': 10},
+				'2022-08-01': {'close': 1780.0, 'volume': 11}},
+			'^DJI': {'2022-08-01': {'close': None, 'volume': 13}}}
+		ret = hist.merge_history(cached, new, '2022-08-01', '2021-07-20', ['GC=F'])
+		assert list(ret['GC=F']) == ['2021-07-26', '2022-07-25', '2022-08-01']
+		assert ret['GC=F']['2021-07-26'] == {'close': 1800.0}
+		assert ret['GC=F']['2022-07-25']['close'] == 1750.0
+		return True
+
+	def portfolio_log(self, name, ut):
+		portfolio = (
+			('xmr-monero',  Decimal('2')),
+			('btc-bitcoin', Decimal('0.5')),
+			('gc=f',        Decimal('1')))
+		data = {
+			'btc-bitcoin':
+				{'price_usd': Decimal('20000'), 'price_btc': Decimal(1),        'last_updated': 900},
+			'xmr-monero':
+				{'price_usd': Decimal('150'),   'price_btc': Decimal('0.0075'), 'last_updated': 1000},
+			'eth-ethereum':
+				{'price_usd': Decimal('1000'),  'price_btc': Decimal('0.05'),   'last_updated': 1100}}
+		with TemporaryDirectory() as tmpdir:
+			log = PortfolioLog(tmpdir, portfolio)
+			assert log.records() is None
+			# the newest price of the holdings:
+			assert log.get_time(data) == 1000
+			assert log.get_time({'xmr-monero': data['xmr-monero'] | {'last_updated': None}}) is None
+			# the log depends on the holdings, not their order:
+			assert PortfolioLog(tmpdir, portfolio[::-1]).fn == log.fn
+			assert PortfolioLog(tmpdir, portfolio[:2]).fn != log.fn
+			log.append(1000, data)
+			log.append(1000, data) # not newer than the last record, so skipped
+			data['btc-bitcoin']['price_usd'] = Decimal('21000')
+			log.append(2000, data)
+			with open(log.fn, 'ab') as fh: # partially written record
+				fh.write(b'\0' * 5)
+			assert len(log.records()) == 2
+			log.append(3000, data)
+			recs = log.records()
+			vmsg('  ' + '\n  '.join(map(str, recs)))
+			assert [r[:3] for r in recs] == [
+				(1000, 10300, 0.515),
+				(2000, 10800, 0.515),
+				(3000, 10800, 0.515)]
+			assert recs[0][3] == 10000 and recs[0][4] != recs[0][4] and recs[0][5] == 300 # NaN for gc=f
+			out = list(log.gen_output(comma=','))
+			vmsg('  ' + '\n  '.join(out))
+			assert '(3 records)' in out[0]
+			assert any('(no data)' in line for line in out)
+		return True
+
+	def rate_limiter(self, name, ut):
+		with TemporaryDirectory() as tmpdir:
+			bucket = RateLimiter(tmpdir, 'example.com', capacity=2, period=100)
+			assert bucket.acquire() == 0
+			# the state is shared by all instances for the host:
+			assert RateLimiter(tmpdir, 'example.com', capacity=2, period=100).acquire() == 0
+			wait = bucket.acquire()
+			vmsg(f'  wait: {wait:.3f}s')
+			assert 49 < wait <= 50
+			assert bucket.acquire(cost=0) == 0
+			assert RateLimiter(tmpdir, 'example.org', capacity=1, period=100).acquire(cost=0.5) == 0
+			with open(bucket.fn, 'r+b') as fh: # simulate elapsed time
+				tokens, t = bucket.state.unpack(fh.read())
+				fh.seek(0)
+				fh.write(bucket.state.pack(tokens, t - 75))
+			assert bucket.acquire() == 0
+			assert bucket.acquire(cost=0.5) == 0
+			assert bucket.acquire(cost=0.5) > 0
+		return True
+
+	def price_alerts(self, name, ut):
+
+		def rule(spec):
+			asset, col, op, threshold = spec.split()
+			sym, _, asset_id = asset.partition(':')
+			return PriceAlerts.rule(
+				asset_tuple(sym, asset_id or None, 'cc'),
+				col,
+				op == 'above',
+				float(threshold),
+				spec)
+
+		def data(btc_usd, xmr_btc):
+			return {
+				'btc-bitcoin': {'id': 'btc-bitcoin', 'symbol': 'BTC', 'price_usd': Decimal(btc_usd)},
+				'xmr-monero':  {'id': 'xmr-monero',  'symbol': 'XMR', 'price_btc': Decimal(xmr_btc)}}
+
+		def check(alerts, *args):
+			res = alerts.check(data(*args))
+			for a in res:
+				vmsg('  ' + PriceAlerts.fmt_alert(a, 1659465400))
+			return [a.rule.spec for a in res]
+
+		rules = [rule(s) for s in (
+			'BTC usd above 30000',
+			'BTC usd above 20000',
+			'BTC usd below 20000',
+			'BTC usd above 50000',
+			'XMR:xmr-monero btc below 0.005')]
+
+		with TemporaryDirectory() as tmpdir:
+			alerts = PriceAlerts(tmpdir, rules)
+			assert check(alerts, 25000, 0.006) == [] # first observation
+			assert check(alerts, 25000, 0.006) == []
+			assert check(alerts, 31000, 0.005) == [
+				'BTC usd above 30000',
+				'XMR:xmr-monero btc below 0.005']
+			assert check(alerts, 19000, 0.004) == ['BTC usd below 20000']
+			# the previous values are persisted across instances:
+			alerts = PriceAlerts(tmpdir, rules)
+			assert check(alerts, 20000, 0.004) == ['BTC usd above 20000']
+			assert check(alerts, 60000, 0.004) == ['BTC usd above 30000', 'BTC usd above 50000']
+			assert check(alerts, 60000, 0.006) == []
+		return True
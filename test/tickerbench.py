@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+#
+# MMGen Node Tools, terminal-based programs for Bitcoin and forkcoin nodes
+# Copyright (C)2013-2025 The MMGen Project <mmgen@tuta.io>
+# Licensed under the GNU General Public License, Version 3:
+#   https://www.gnu.org/licenses
+# Public project repositories:
+#   https://github.com/mmgen/mmgen-node-tools
+#   https://gitlab.com/mmgen/mmgen-node-tools
+
+"""
+test/tickerbench.py: Benchmark Ticker data parsing and rendering with synthetic data
+"""
+
+import os, json, time, datetime, asyncio, tracemalloc
+from collections import namedtuple
+from tempfile import TemporaryDirectory
+
+try:
+	from include import test_init
+except ImportError:
+	from test.include import test_init # noqa: F401
+
+from mmgen.cfg import Config
+from mmgen.util import msg, Msg, die, is_int
+
+opts_data = {
+	'text': {
+		'desc': 'Benchmark Ticker data parsing and rendering with synthetic data',
+		'usage':'[options] [SIZE ...]',
+		'options': """
+-h, --help         Print this help message
+--, --longhelp     Print help message for long (global) options
+-f, --fetch        Also benchmark retrieval of crypto data from the test
+                   HTTP server
+-r, --rounds=N     Time each stage over ‘N’ rounds, reporting the best
+                   (default: {r})
+""",
+	'notes': """
+SIZE is the number of crypto assets in the synthetic CoinPaprika data
+(default: {s}).  Yahoo Finance data is synthesized for
+the default configured assets, with a year of weekly history.
+
+For each stage, the best time over all rounds and the peak memory usage
+of a further round, as measured by ‘tracemalloc’, are reported.
+
+STAGES:
+
+  fetch      - retrieve and cache crypto data from the test HTTP server
+               (--fetch only)
+  parse      - parse cached data for all sources and create the crypto
+               data’s index (‘get_data’)
+  parse_idx  - the same with the index present
+  resolve    - resolve assets for display (‘gen_data’)
+  overview   - render the default ‘overview’ display
+  trading    - render the ‘trading’ display for a trade specifier
+  market_cap - resolve and render all assets in market cap view
+               (ASSET_RANGE)
+"""
+	},
+	'code': {
+		'options': lambda s: s.format(r=rounds),
+		'notes': lambda s: s.format(s=', '.join(map(str, dfl_sizes)))
+	}
+}
+
+dfl_sizes = (1000, 10000, 50000)
+rounds = 3
+now = 1659465400 # the test suite’s current time
+
+refdir = os.path.join('test', 'ref', 'ticker')
+
+parsed_opts = namedtuple('parsed_cmd_opts', ['user_opts', 'cmd_args', 'opts'])
+
+def load_ref(fn):
+	with open(os.path.join(refdir, fn)) as fh:
+		return json.load(fh)
+
+def gen_tickers(size):
+	"""
+	return ‘size’ crypto assets in CoinPaprika’s format: the reference assets followed
+	by synthetic ones with prices spanning several orders of magnitude
+	"""
+	ref = sorted(load_ref('ticker.json'), key=lambda d: int(d['rank']))
+	tpl = ref[0]
+	for n in range(size):
+		if n < len(ref):
+			d = json.loads(json.dumps(ref[n]))
+		else:
+			d = json.loads(json.dumps(tpl))
+			d.update({
+				'id':     f'syn{n}-synthetic-coin-{n}',
+				'name':   f'Synthetic Coin {n}',
+				'symbol': f'SYN{n}'})
+			q = d['quotes']['USD']
+			q['price'] = 10 ** (4 - 12 * n / size) * (1 + n % 97 / 100)
+			q['market_cap'] = int(q['market_cap'] / n)
+			q['volume_24h'] = q['volume_24h'] / n
+			for k in q:
+				if k.startswith('percent_change'):
+					q[k] = round((n % 41 - 20) / 3, 2)
+		d['rank'] = str(n + 1)
+		yield d
+
+def gen_history():
+	"""
+	return a year of weekly history for the reference Yahoo Finance assets in the
+	format of the reference history file
+	"""
+	ref = load_ref('ticker-finance-history.json')
+	last = {}
+	for k, v in ref.items():
+		sym = k.split("'")[1]
+		last[sym] = v
+	end = datetime.date.fromtimestamp(now)
+	end -= datetime.timedelta(days=end.weekday())
+	for sym, v in last.items():
+		for n in range(53):
+			date = end - datetime.timedelta(weeks=n)
+			mult = 1 - n / 200
+			yield (
+				str((sym, date)),
+				{k: (x * mult if k != 'volume' else x) for k, x in v.items()})
+
+def write_data(cachedir, size):
+	for fn, data in (
+			('ticker.json',                 list(gen_tickers(size))),
+			('ticker-finance.json',         load_ref('ticker-finance.json')),
+			('ticker-finance-history.json', dict(gen_history()))):
+		with open(os.path.join(cachedir, fn), 'w') as fh:
+			json.dump(data, fh)
+	return os.path.getsize(os.path.join(cachedir, 'ticker.json'))
+
+def make_cfg(tmpdir, cachedir, args=None, **kwargs):
+	"""
+	initialize the Ticker’s configuration for an invocation with ‘args’ and options
+	‘kwargs’, returning the source classes
+	"""
+	gcfg = Config(parsed_opts=parsed_opts(
+		user_opts = {
+			'data_dir': os.path.join(tmpdir, 'data_dir'),
+			'cachedir': cachedir,
+			'cached_data': True,
+			'quiet': True,
+			'skip_cfg_file': True,
+			'test_suite': True} | kwargs,
+		cmd_args = args or [],
+		opts = ()))
+	return Ticker.make_cfg(gcfg)[0]
+
+async def get_data(srcs):
+	try:
+		return await Ticker.fetch_data(srcs)
+	finally:
+		await Ticker.http_session.close()
+
+def measure(func, setup=None):
+	"""
+	return the best time of ‘func’ over ‘rounds’ rounds, and its peak memory usage
+	"""
+	def gen():
+		for _ in range(rounds):
+			if setup:
+				setup()
+			t_start = time.perf_counter()
+			func()
+			yield time.perf_counter() - t_start
+	t = min(gen())
+	if setup:
+		setup()
+	tracemalloc.start()
+	func()
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	return t, peak
+
+def run(tmpdir, size, server):
+
+	def rm_index():
+		for fn in os.listdir(cachedir):
+			if fn.endswith('.idx'):
+				os.unlink(os.path.join(cachedir, fn))
+
+	def fetch_setup():
+		for fn in os.listdir(netdir):
+			os.unlink(os.path.join(netdir, fn))
+		Ticker.DataSource.base.hosts_fetched.clear() # no delay before the request
+
+	def parse():
+		nonlocal src_data
+		src_data = asyncio.run(get_data({k: v() for k, v in src_cls.items()}))
+
+	def resolve():
+		nonlocal data
+		data = Ticker.get_display_data(src_data)
+
+	def render(clsname):
+		return lambda: '\n'.join(getattr(Ticker.Ticker, clsname)(data).gen_output())
+
+	src_data = data = None
+	cachedir = os.path.join(tmpdir, 'cache')
+	os.mkdir(cachedir)
+	msg(f'Generating {size} assets: {write_data(cachedir, size) / 2**20:.1f} MiB of JSON data')
+
+	if server:
+		# the server runs in this process, so load its response before measuring:
+		with open(os.path.join(cachedir, 'ticker.json'), 'rb') as fh:
+			body = fh.read()
+		server.make_response_body = lambda method, environ: body
+		netdir = os.path.join(tmpdir, 'net')
+		os.mkdir(netdir)
+		src_cls = make_cfg(tmpdir, netdir, cached_data=False, download='cc', proxy='')
+		yield ('fetch', measure(
+			lambda: asyncio.run(get_data({'cc': src_cls['cc']()})),
+			setup = fetch_setup))
+
+	src_cls = make_cfg(tmpdir, cachedir)
+	yield ('parse', measure(parse, setup=rm_index))
+	yield ('parse_idx', measure(parse))
+	yield ('resolve', measure(resolve))
+	yield ('overview', measure(render('overview')))
+
+	make_cfg(tmpdir, cachedir, args=['xmr:17.234'])
+	resolve()
+	yield ('trading', measure(render('trading')))
+
+	make_cfg(tmpdir, cachedir, args=[f'1-{size}'])
+	yield ('market_cap', measure(lambda: (resolve(), render('overview')())))
+
+cfg = Config(opts_data=opts_data)
+
+from mmgen_node_tools import Ticker
+
+if cfg.rounds:
+	if not (is_int(cfg.rounds) and int(cfg.rounds) > 0):
+		die(1, f'{cfg.rounds!r}: invalid value for --rounds (must be a positive integer)')
+	rounds = int(cfg.rounds)
+
+for arg in cfg._args:
+	if not (is_int(arg) and int(arg) > 0):
+		die(1, f'{arg!r}: invalid SIZE argument (must be a positive integer)')
+
+sizes = [int(arg) for arg in cfg._args] or dfl_sizes
+
+if cfg.fetch:
+	from mmgen.util2 import port_in_use
+	from test.cmdtest_d.httpd.ticker import TickerServer
+	server = TickerServer(cfg)
+	if port_in_use(server.port):
+		die(1, f'Port {server.port} in use.  Stop the {server.name} and retry')
+	server.start()
+else:
+	server = None
+
+fs = '{:>7} {:<11} {:>10} {:>10}'
+Msg(fs.format('Assets', 'Stage', 'Time (ms)', 'Peak (MiB)'))
+
+try:
+	for size in sizes:
+		with TemporaryDirectory() as tmpdir:
+			for stage, (t, peak) in run(tmpdir, size, server):
+				Msg(fs.format(size, stage, f'{t * 1000:.1f}', f'{peak / 2**20:.1f}'))
+finally:
+	if server:
+		server.stop()